@@ -2,8 +2,11 @@ from __future__ import annotations
 
 import argparse
 
+from archipelago_generator.viewer import view
+
 from .generator import generate_world
-from .render import render_map
+from .outofcore import generate_world_to_disk, open_world
+from .render import export_png, render_map, world_layers
 
 
 def main():
@@ -12,9 +15,33 @@ def main():
     parser.add_argument("--height", type=int, default=40)
     parser.add_argument("--seed", type=int, default=0)
     parser.add_argument("--provinces", type=int, default=5)
+    parser.add_argument("--erosion", type=int, default=0, help="rounds of hydraulic + thermal erosion")
+    parser.add_argument("--workers", type=int, default=1, help="threads running independent stages")
+    parser.add_argument("--png", help="write a PNG image to this path instead of rendering")
+    parser.add_argument("--scale", type=int, default=1, help="pixels per tile for --png")
+    parser.add_argument("--view", action="store_true", help="pan and zoom over the map interactively")
+    parser.add_argument("--out-of-core", metavar="DIR", help="generate band by band into memory-mapped files in DIR")
+    parser.add_argument("--band-rows", type=int, default=256, help="rows per band for --out-of-core")
     args = parser.parse_args()
-    world = generate_world(args.width, args.height, args.seed, args.provinces)
-    render_map(world)
+    if args.out_of_core:
+        if args.erosion:
+            parser.error("--erosion is not available with --out-of-core")
+        generate_world_to_disk(args.out_of_core, args.width, args.height, args.seed, args.provinces,
+                               band_rows=args.band_rows)
+        world = open_world(args.out_of_core)
+        if args.png:
+            export_png(world, args.png, scale=args.scale)
+        if args.view:
+            view(world_layers(world))
+        return
+    world = generate_world(args.width, args.height, args.seed, args.provinces, erosion_iterations=args.erosion,
+                           workers=args.workers)
+    if args.png:
+        export_png(world, args.png, scale=args.scale)
+    elif args.view:
+        view(world_layers(world))
+    else:
+        render_map(world)
 
 
 if __name__ == "__main__":
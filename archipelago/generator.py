@@ -1,7 +1,17 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Optional
+
 import numpy as np
-from perlin_noise import PerlinNoise
+
+from archipelago_generator.erosion import simulate as erode
+from archipelago_generator.instrument import Instrumentation, count
+from archipelago_generator.pipeline import Stage, StageCache, run_pipeline
+from archipelago_generator.rivers import compute_water_flux as compute_flat_water_flux
+
+if TYPE_CHECKING:
+    from perlin_noise import PerlinNoise
 
 
 def lloyd_relaxation(width: int, height: int, num_seeds: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
@@ -10,26 +20,28 @@ def lloyd_relaxation(width: int, height: int, num_seeds: int, iterations: int, r
         rng.integers(0, width, num_seeds),
         rng.integers(0, height, num_seeds),
     ])
+    ys, xs = np.indices((height, width))
     for _ in range(iterations):
-        province_map = np.zeros((height, width), dtype=int)
-        cell_points = [[] for _ in range(num_seeds)]
-        for y in range(height):
-            for x in range(width):
-                dists = np.sum((seeds - np.array([x, y])) ** 2, axis=1)
-                p = int(np.argmin(dists))
-                province_map[y, x] = p
-                cell_points[p].append((x, y))
-        for i in range(num_seeds):
-            if cell_points[i]:
-                arr = np.array(cell_points[i])
-                seeds[i, 0] = int(np.mean(arr[:, 0]))
-                seeds[i, 1] = int(np.mean(arr[:, 1]))
+        # Per-province coordinate sums instead of per-tile point lists.
+        province_map = assign_provinces(width, height, seeds).ravel()
+        counts = np.bincount(province_map, minlength=num_seeds)
+        filled = counts > 0
+        for axis, coords in ((0, xs), (1, ys)):
+            total = np.bincount(province_map, coords.ravel(), minlength=num_seeds)
+            seeds[filled, axis] = (total[filled] / counts[filled]).astype(int)
     return seeds
 
 
-def assign_provinces(width: int, height: int, seeds: np.ndarray) -> np.ndarray:
+def province_dtype(num_provinces: int, compact: bool = False) -> np.dtype:
+    """Label dtype for ``num_provinces``: ``int`` or, when compact, the narrowest fit."""
+    if not compact:
+        return np.dtype(int)
+    return np.dtype(np.uint16 if num_provinces <= np.iinfo(np.uint16).max + 1 else np.int32)
+
+
+def assign_provinces(width: int, height: int, seeds: np.ndarray, dtype=int) -> np.ndarray:
     """Assign each tile to the nearest seed."""
-    province_map = np.zeros((height, width), dtype=int)
+    province_map = np.zeros((height, width), dtype=dtype)
     for y in range(height):
         for x in range(width):
             dists = np.sum((seeds - np.array([x, y])) ** 2, axis=1)
@@ -50,15 +62,21 @@ def mark_borders(province_map: np.ndarray) -> np.ndarray:
     return border_map
 
 
-def _perlin(noise: PerlinNoise, width: int, height: int) -> np.ndarray:
-    return np.array([[noise([x / width, y / height]) for x in range(width)] for y in range(height)])
+def _perlin(noise: PerlinNoise, width: int, height: int, dtype=float) -> np.ndarray:
+    count("noise_samples", width * height)
+    out = np.empty((height, width), dtype=dtype)
+    for y in range(height):
+        out[y] = np.fromiter((noise([x / width, y / height]) for x in range(width)), float, width)
+    return out
 
 
-def generate_elevation(width: int, height: int, rng: np.random.Generator) -> np.ndarray:
+def generate_elevation(width: int, height: int, rng: np.random.Generator, dtype=float) -> np.ndarray:
+    from perlin_noise import PerlinNoise
+
     base_noise = PerlinNoise(octaves=4, seed=int(rng.integers(0, 1e9)))
     ridge_noise = PerlinNoise(octaves=6, seed=int(rng.integers(0, 1e9)))
-    elevation = _perlin(base_noise, width, height)
-    ridges = np.abs(_perlin(ridge_noise, width, height))
+    elevation = _perlin(base_noise, width, height, dtype)
+    ridges = np.abs(_perlin(ridge_noise, width, height, dtype))
     elev = (elevation * 0.7 + ridges * 0.3 + 1) / 2  # normalize to 0..1
     return elev
 
@@ -83,8 +101,10 @@ def smooth_coasts(elevation: np.ndarray, iterations: int = 1) -> np.ndarray:
 
 
 def generate_rainfall(width: int, height: int, elevation: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    from perlin_noise import PerlinNoise
+
     rain_noise = PerlinNoise(octaves=4, seed=int(rng.integers(0, 1e9)))
-    rainfall = (_perlin(rain_noise, width, height) + 1) / 2
+    rainfall = (_perlin(rain_noise, width, height, elevation.dtype) + 1) / 2
     # simple rain shadow: reduce rainfall east of high mountains
     for y in range(height):
         moisture = 0.0
@@ -99,40 +119,22 @@ def generate_rainfall(width: int, height: int, elevation: np.ndarray, rng: np.ra
 
 def compute_temperature(elevation: np.ndarray) -> np.ndarray:
     height, width = elevation.shape
-    lat = np.tile(np.linspace(1.0, 0.0, height)[:, None], (1, width))
+    lat = np.tile(np.linspace(1.0, 0.0, height, dtype=elevation.dtype)[:, None], (1, width))
     temp = lat - elevation * 0.5
     temp = (temp - temp.min()) / (temp.max() - temp.min())
     return temp
 
 
-def compute_water_flux(elevation: np.ndarray):
-    height, width = elevation.shape
-    downslope = np.full((height, width, 2), -1, dtype=int)
-    for y in range(height):
-        for x in range(width):
-            min_elev = elevation[y, x]
-            best = None
-            for dy, dx in [(-1,0),(1,0),(0,-1),(0,1)]:
-                ny, nx = y+dy, x+dx
-                if 0<=ny<height and 0<=nx<width and elevation[ny, nx] < min_elev:
-                    min_elev = elevation[ny, nx]
-                    best = (ny, nx)
-            if best:
-                downslope[y, x] = best
-    water_flux = np.ones((height, width))
-    order = [(y,x) for y in range(height) for x in range(width)]
-    order.sort(key=lambda p: -elevation[p])
-    for y, x in order:
-        ny, nx = downslope[y, x]
-        if ny >= 0:
-            water_flux[ny, nx] += water_flux[y, x]
-    return water_flux, downslope
-
-
-def trace_rivers(water_flux: np.ndarray, downslope: np.ndarray, elevation: np.ndarray, min_flux: float = 20.0):
+def compute_water_flux(elevation: np.ndarray, compact: bool = False):
+    return compute_flat_water_flux(elevation, compact=compact)
+
+
+def trace_rivers(water_flux: np.ndarray, downslope: np.ndarray, elevation: np.ndarray, min_flux: float = 20.0,
+                 compact: bool = False):
     height, width = elevation.shape
-    river_map = np.zeros((height, width), dtype=int)
-    river_width = np.zeros((height, width), dtype=int)
+    river_map = np.zeros((height, width), dtype=np.int32 if compact else int)
+    river_width = np.zeros((height, width), dtype=np.uint8 if compact else int)
+    flat = downslope.ndim == 2
     river_id = 1
     visited = set()
     coords = [(y, x) for y in range(height) for x in range(width) if water_flux[y, x] >= min_flux]
@@ -146,7 +148,7 @@ def trace_rivers(water_flux: np.ndarray, downslope: np.ndarray, elevation: np.nd
                 visited.add((cy, cx))
                 river_map[cy, cx] = river_id
                 river_width[cy, cx] = int(max(1, np.log2(water_flux[cy, cx])))
-                ny, nx = downslope[cy, cx]
+                ny, nx = divmod(int(downslope[cy, cx]), width) if flat else downslope[cy, cx]
                 if ny < 0 or elevation[ny, nx] < 0.26:
                     break
                 cy, cx = ny, nx
@@ -154,28 +156,33 @@ def trace_rivers(water_flux: np.ndarray, downslope: np.ndarray, elevation: np.nd
     return river_map, river_width
 
 
+def city_candidates(elevation: np.ndarray, river_map: np.ndarray) -> np.ndarray:
+    """Mask of the mid-height tiles on a river or touching the sea, where cities may go.
+
+    Only the tiles around each one are read, so a band plus one halo row on
+    each side gives the right mask for the band.
+    """
+    from archipelago_generator.distance import ADJACENT, distance_field
+
+    sea_distance, _ = distance_field(elevation < 0.26)
+    return (elevation > 0.26) & (elevation < 0.8) & ((river_map > 0) | (sea_distance <= ADJACENT))
+
+
 def place_cities(province_map: np.ndarray, river_map: np.ndarray, elevation: np.ndarray, n_cities: int = 1, min_dist: int = 10):
-    height, width = elevation.shape
+    """One city per province on a river or coast tile, each as far from the earlier ones as possible."""
+    ys, xs = np.nonzero(city_candidates(elevation, river_map))
+    province = province_map[ys, xs]
     city_coords = []
     for province_id in np.unique(province_map):
-        candidates = []
-        for y in range(height):
-            for x in range(width):
-                if province_map[y, x] == province_id and 0.26 < elevation[y, x] < 0.8:
-                    if river_map[y, x] > 0 or any(
-                        elevation[ny, nx] < 0.26
-                        for dy in [-1, 0, 1]
-                        for dx in [-1, 0, 1]
-                        if 0 <= y + dy < height and 0 <= x + dx < width
-                        for ny, nx in [(y + dy, x + dx)]
-                    ):
-                        candidates.append((y, x))
-        if candidates:
-            best = max(
-                candidates,
-                key=lambda c: min([np.hypot(c[0] - y, c[1] - x) for y, x in city_coords] or [1e9]),
-            )
-            city_coords.append(best)
+        mine = province == province_id
+        if not mine.any():
+            continue
+        cy, cx = ys[mine], xs[mine]
+        score = np.full(len(cy), 1e9)
+        for y, x in city_coords:
+            score = np.minimum(score, np.hypot(cy - y, cx - x))
+        best = int(np.argmax(score))
+        city_coords.append((int(cy[best]), int(cx[best])))
     return city_coords
 
 
@@ -187,45 +194,136 @@ BIOME_GLYPHS = {
 }
 
 
+def biome_codes(elevation: np.ndarray, temperature: np.ndarray) -> np.ndarray:
+    """Biomes as ``uint8`` indices into ``BIOME_GLYPHS``; works on any band of rows."""
+    names = list(BIOME_GLYPHS)
+    codes = np.full(elevation.shape, names.index("plain"), dtype=np.uint8)
+    high = elevation > 0.8
+    codes[high] = np.where(temperature[high] > 0.3, names.index("mountain"), names.index("snow"))
+    codes[elevation < 0.26] = names.index("ocean")
+    return codes
+
+
 def assign_biomes(elevation: np.ndarray, rainfall: np.ndarray, temperature: np.ndarray) -> np.ndarray:
-    height, width = elevation.shape
-    biome = np.empty((height, width), dtype=object)
-    for y in range(height):
-        for x in range(width):
-            e = elevation[y, x]
-            r = rainfall[y, x]
-            t = temperature[y, x]
-            if e < 0.26:
-                biome[y, x] = "ocean"
-            elif e > 0.8:
-                biome[y, x] = "mountain" if t > 0.3 else "snow"
-            else:
-                biome[y, x] = "plain"
-    return biome
-
-
-def generate_world(width: int = 80, height: int = 40, seed: int = 0, num_provinces: int = 5):
-    rng = np.random.default_rng(seed)
-    seeds = lloyd_relaxation(width, height, num_provinces, 3, rng)
-    provinces = assign_provinces(width, height, seeds)
-    borders = mark_borders(provinces)
-    elevation = generate_elevation(width, height, rng)
-    elevation = smooth_coasts(elevation, iterations=2)
-    rainfall = generate_rainfall(width, height, elevation, rng)
-    temperature = compute_temperature(elevation)
-    flux, downslope = compute_water_flux(elevation)
-    river_map, river_width = trace_rivers(flux, downslope, elevation)
-    cities = place_cities(provinces, river_map, elevation)
-    biome = assign_biomes(elevation, rainfall, temperature)
-    return {
-        "provinces": provinces,
-        "borders": borders,
-        "elevation": elevation,
-        "rainfall": rainfall,
-        "temperature": temperature,
-        "water_flux": flux,
-        "river_map": river_map,
-        "river_width": river_width,
-        "cities": cities,
-        "biome": biome,
-    }
+    return np.array(list(BIOME_GLYPHS), dtype=object)[biome_codes(elevation, temperature)]
+
+
+@dataclass
+class WorldParams:
+    width: int = 80
+    height: int = 40
+    seed: int = 0
+    num_provinces: int = 5
+    erosion_iterations: int = 0
+    # float32 fields, narrow labels and flat int32 downslope indices.
+    compact: bool = False
+
+
+def _dtype(compact):
+    return np.float32 if compact else float
+
+
+def _seeds_stage(rng, width, height, num_provinces):
+    return {"seeds": lloyd_relaxation(width, height, num_provinces, 3, rng)}
+
+
+def _provinces_stage(seeds, width, height, compact):
+    return {"provinces": assign_provinces(width, height, seeds, province_dtype(len(seeds), compact))}
+
+
+def _borders_stage(provinces):
+    return {"borders": mark_borders(provinces)}
+
+
+def _elevation_stage(rng, width, height, compact):
+    return {"raw_elevation": generate_elevation(width, height, rng, _dtype(compact))}
+
+
+def _smooth_stage(raw_elevation):
+    return {"elevation": smooth_coasts(raw_elevation, iterations=2)}
+
+
+def _erosion_stage(elevation, rng, erosion_iterations):
+    if erosion_iterations <= 0:
+        return {"elevation": elevation}
+    eroded = erode(elevation, erosion_iterations, seed=int(rng.integers(0, 1_000_000)), sea_level=0.26)
+    return {"elevation": eroded.astype(elevation.dtype, copy=False)}
+
+
+def _rainfall_stage(elevation, rng, width, height):
+    return {"rainfall": generate_rainfall(width, height, elevation, rng)}
+
+
+def _temperature_stage(elevation):
+    return {"temperature": compute_temperature(elevation)}
+
+
+def _flux_stage(elevation, compact):
+    flux, downslope = compute_water_flux(elevation, compact)
+    return {"water_flux": flux, "downslope": downslope}
+
+
+def _rivers_stage(water_flux, downslope, elevation, compact):
+    river_map, river_width = trace_rivers(water_flux, downslope, elevation, compact=compact)
+    return {"river_map": river_map, "river_width": river_width}
+
+
+def _cities_stage(provinces, river_map, elevation):
+    return {"cities": place_cities(provinces, river_map, elevation)}
+
+
+def _biomes_stage(elevation, rainfall, temperature):
+    return {"biome": assign_biomes(elevation, rainfall, temperature)}
+
+
+# Stages in execution order. Drawing stages are seeded with their own stream,
+# so elevation and rainfall do not wait for the province seeds.
+STAGES = [
+    Stage("seeds", _seeds_stage, ("seeds",), params=("width", "height", "num_provinces"), version=2, seeded=True),
+    Stage("provinces", _provinces_stage, ("provinces",), ("seeds",), ("width", "height", "compact")),
+    Stage("borders", _borders_stage, ("borders",), ("provinces",)),
+    Stage("elevation", _elevation_stage, ("raw_elevation",), params=("width", "height", "compact"),
+          version=2, seeded=True),
+    Stage("smooth", _smooth_stage, ("elevation",), ("raw_elevation",)),
+    Stage("erosion", _erosion_stage, ("elevation",), ("elevation",), ("erosion_iterations",), version=2,
+          seeded=True),
+    Stage("rainfall", _rainfall_stage, ("rainfall",), ("elevation",), ("width", "height"), version=2, seeded=True),
+    Stage("temperature", _temperature_stage, ("temperature",), ("elevation",)),
+    Stage("flux", _flux_stage, ("water_flux", "downslope"), ("elevation",), ("compact",)),
+    Stage("rivers", _rivers_stage, ("river_map", "river_width"), ("water_flux", "downslope", "elevation"),
+          ("compact",)),
+    Stage("cities", _cities_stage, ("cities",), ("provinces", "river_map", "elevation")),
+    Stage("biomes", _biomes_stage, ("biome",), ("elevation", "rainfall", "temperature")),
+]
+
+WORLD_LAYERS = [
+    "provinces",
+    "borders",
+    "elevation",
+    "rainfall",
+    "temperature",
+    "water_flux",
+    "river_map",
+    "river_width",
+    "cities",
+    "biome",
+]
+
+
+def generate_world(
+    width: int = 80,
+    height: int = 40,
+    seed: int = 0,
+    num_provinces: int = 5,
+    cache: Optional[StageCache] = None,
+    instrument: Optional[Instrumentation] = None,
+    erosion_iterations: int = 0,
+    compact: bool = False,
+    workers: int = 1,
+    cancel: Optional[Callable[[], bool]] = None,
+):
+    params = WorldParams(width, height, seed, num_provinces, erosion_iterations, compact)
+    world = run_pipeline(STAGES, params, WORLD_LAYERS, cache, instrument, workers, cancel)
+    if instrument is not None:
+        world["profile"] = instrument.summary()
+    return world
@@ -0,0 +1,398 @@
+"""Out-of-core world generation for maps larger than memory.
+
+:func:`generate_world_to_disk` writes the layers of
+:func:`~archipelago.generator.generate_world` as ``.npy`` files in the
+directory format :func:`archipelago_generator.storage.load_world` reads, and
+never holds a whole layer in memory. Band-local stages (province assignment,
+borders, noise, coast smoothing, rainfall, temperature, downslope, rivers,
+city candidates and biomes) run ``band_rows`` rows at a time plus the halo
+rows they read across band edges. The normalisations of rainfall and
+temperature use the minimum and maximum gathered while the band is written.
+
+Flow accumulation is the one global stage. It uses a two-pass boundary-graph
+algorithm. First each band is accumulated on its own. Then the flow that
+crosses band edges is solved on a graph holding only band-edge tiles. A
+second pass adds that inflow back in. Memory therefore grows with the band
+size plus two rows per band, never with the full map.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from typing import Any, Dict, Iterator, Tuple
+
+import numpy as np
+
+from archipelago_generator.instrument import count
+from archipelago_generator.pipeline import stage_rng
+from archipelago_generator.rivers import accumulate_flux, grid_downslope
+from archipelago_generator.storage import MANIFEST, WORLD_FORMAT_NAME
+from archipelago_generator.utils import perlin_batch
+
+from .generator import BIOME_GLYPHS, biome_codes, city_candidates, province_dtype
+
+BIOME_CATEGORIES = list(BIOME_GLYPHS)
+SEA_LEVEL = 0.26
+MIN_RIVER_FLUX = 20.0
+_NEIGHBOURS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+
+def _bands(height: int, band_rows: int) -> Iterator[Tuple[int, int]]:
+    for y0 in range(0, height, band_rows):
+        yield y0, min(y0 + band_rows, height)
+
+
+def _halo(height: int, y0: int, y1: int, rows: int) -> Tuple[int, int]:
+    return max(y0 - rows, 0), min(y1 + rows, height)
+
+
+def _create(directory: str, name: str, shape: Tuple[int, ...], dtype) -> np.memmap:
+    return np.lib.format.open_memmap(os.path.join(directory, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+
+
+def nearest_seed(seeds: np.ndarray, y0: int, y1: int, width: int, dtype=int) -> np.ndarray:
+    """Label rows ``y0:y1`` with their nearest seed, ties to the lowest index."""
+    ys = np.arange(y0, y1, dtype=np.int64)[:, None]
+    xs = np.arange(width, dtype=np.int64)[None, :]
+    labels = np.zeros((y1 - y0, width), dtype=dtype)
+    best = None
+    for i, (sx, sy) in enumerate(np.asarray(seeds, dtype=np.int64)):
+        dist = (sx - xs) ** 2 + (sy - ys) ** 2
+        if best is None:
+            best = dist
+            continue
+        closer = dist < best
+        best = np.where(closer, dist, best)
+        labels[closer] = i
+    return labels
+
+
+def _lloyd(width: int, height: int, num_seeds: int, iterations: int, rng: np.random.Generator,
+           band_rows: int) -> np.ndarray:
+    # Same draws and arithmetic as generator.lloyd_relaxation, one band at a time.
+    seeds = np.column_stack([rng.integers(0, width, num_seeds), rng.integers(0, height, num_seeds)])
+    for _ in range(iterations):
+        counts = np.zeros(num_seeds)
+        sums = np.zeros((2, num_seeds))
+        for y0, y1 in _bands(height, band_rows):
+            labels = nearest_seed(seeds, y0, y1, width).ravel()
+            ys, xs = np.indices((y1 - y0, width))
+            counts += np.bincount(labels, minlength=num_seeds)
+            sums[0] += np.bincount(labels, xs.ravel(), minlength=num_seeds)
+            sums[1] += np.bincount(labels, (ys + y0).ravel(), minlength=num_seeds)
+        filled = counts > 0
+        for axis in (0, 1):
+            seeds[filled, axis] = (sums[axis][filled] / counts[filled]).astype(int)
+    return seeds
+
+
+def _perlin_band(noise, width: int, height: int, y0: int, y1: int) -> np.ndarray:
+    count("noise_samples", (y1 - y0) * width)
+    ys, xs = np.mgrid[y0:y1, 0:width]
+    coords = np.stack([xs.ravel() / width, ys.ravel() / height], axis=1)
+    return perlin_batch(noise, coords).reshape(y1 - y0, width)
+
+
+def smooth_rows(elevation: np.ndarray, iterations: int = 1) -> np.ndarray:
+    """Vectorized :func:`~archipelago.generator.smooth_coasts` on a block of rows.
+
+    Rows within ``iterations`` of a block edge that is not a map edge read
+    missing neighbours, so callers pass that many halo rows on each side.
+    """
+    elev = np.array(elevation)
+    rows, width = elev.shape
+    for _ in range(iterations):
+        padded = np.pad(elev, 1)
+        valid = np.pad(np.ones_like(elev, dtype=bool), 1)
+        total = np.zeros_like(elev)
+        n = np.zeros(elev.shape)
+        # Same neighbour order as the loop, so the sums round identically.
+        for dy, dx in _NEIGHBOURS:
+            window = (slice(1 + dy, 1 + dy + rows), slice(1 + dx, 1 + dx + width))
+            ok = valid[window]
+            total += np.where(ok, padded[window], 0)
+            n += ok
+        low = (elev < 0.3) & (n > 0)
+        elev = np.where(low, (elev + total / np.maximum(n, 1)) / 2, elev)
+    return elev
+
+
+def accumulate_bands(downslope, out, band_rows: int) -> None:
+    """Write the flow accumulation of a flat ``downslope`` grid into ``out``.
+
+    ``downslope`` (any array-like, e.g. a memory map) holds for every tile
+    the flat index of the tile it drains into, or ``-1``; every tile carries
+    one unit of water. Pass one accumulates each band on its own and records
+    where water leaves it and where water entering on its first and last row
+    ends up. The crossings are solved on that boundary graph, then pass two
+    repeats the band accumulation with the solved inflows added.
+    """
+    height, width = downslope.shape
+    exit_ids, exit_targets, exit_flux, link_ids, link_exits = [], [], [], [], []
+
+    def local(y0: int, y1: int) -> Tuple[np.ndarray, np.ndarray]:
+        start = y0 * width
+        ds = np.asarray(downslope[y0:y1], dtype=np.int64).ravel()
+        inside = (ds >= start) & (ds < y1 * width)
+        return ds, np.where(inside, ds - start, -1)
+
+    for y0, y1 in _bands(height, band_rows):
+        start = y0 * width
+        ds, down = local(y0, y1)
+        flux = accumulate_flux(down, np.ones(down.size))
+        leaving = np.flatnonzero((ds >= 0) & (down < 0))
+        exit_ids.append(leaving + start)
+        exit_targets.append(ds[leaving])
+        exit_flux.append(flux[leaving])
+        # Follow every edge-row tile down its in-band path (pointer jumping).
+        end = np.where(down >= 0, down, np.arange(down.size))
+        while True:
+            nxt = end[end]
+            if np.array_equal(nxt, end):
+                break
+            end = nxt
+        edge = np.unique(np.r_[np.arange(width), np.arange(down.size - width, down.size)])
+        stops = end[edge]
+        drained = (ds[stops] >= 0) & (down[stops] < 0)
+        link_ids.append(edge[drained] + start)
+        link_exits.append(stops[drained] + start)
+
+    exit_ids = np.concatenate(exit_ids)
+    exit_targets = np.concatenate(exit_targets)
+    link_ids = np.concatenate(link_ids)
+    link_exits = np.concatenate(link_exits)
+    # Boundary graph: exits drain into the tile they cross to; a tile water
+    # enters through drains, inside its band, to the exit its path reaches.
+    nodes = np.unique(np.r_[exit_ids, exit_targets])
+    node_down = np.full(len(nodes), -1, dtype=np.int64)
+    exits = np.searchsorted(nodes, exit_ids)
+    entered = np.searchsorted(nodes, exit_targets)
+    is_exit = np.zeros(len(nodes), dtype=bool)
+    is_exit[exits] = True
+    linked = np.isin(link_ids, nodes)
+    at = np.searchsorted(nodes, link_ids[linked])
+    keep = ~is_exit[at]
+    node_down[at[keep]] = np.searchsorted(nodes, link_exits[linked][keep])
+    node_down[exits] = entered
+    weights = np.zeros(len(nodes))
+    weights[exits] = np.concatenate(exit_flux)
+    # Only the water crossing straight into a tile is added in pass two;
+    # the band accumulation carries it on from there.
+    inflow = np.bincount(entered, accumulate_flux(node_down, weights)[exits], minlength=len(nodes))
+
+    for y0, y1 in _bands(height, band_rows):
+        start = y0 * width
+        _, down = local(y0, y1)
+        extra = np.ones(down.size)
+        lo, hi = np.searchsorted(nodes, [start, y1 * width])
+        extra[nodes[lo:hi] - start] += inflow[lo:hi]
+        out[y0:y1] = accumulate_flux(down, extra).reshape(y1 - y0, width)
+
+
+def generate_world_to_disk(
+    path: str,
+    width: int = 80,
+    height: int = 40,
+    seed: int = 0,
+    num_provinces: int = 5,
+    *,
+    band_rows: int = 256,
+    compact: bool = False,
+    overwrite: bool = True,
+) -> str:
+    """Generate a world straight into the directory ``path`` and return it.
+
+    The layers match :func:`~archipelago.generator.generate_world` with the
+    same arguments, up to float rounding of the batched noise, except that
+    ``river_map`` marks river tiles with ``1`` instead of numbering traces.
+    Erosion is not available out of core. Open the result with
+    :func:`open_world` (memory maps, biomes as codes) or
+    :func:`~archipelago_generator.storage.load_world`.
+    """
+    from perlin_noise import PerlinNoise
+
+    if os.path.exists(path) and not overwrite:
+        raise FileExistsError(path)
+    tmp = f"{path}.tmp{os.getpid()}"
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    shape = (height, width)
+    fdtype = np.float32 if compact else float
+    scratch = os.path.join(tmp, "scratch")
+    os.makedirs(scratch)
+
+    seeds = _lloyd(width, height, num_provinces, 3, stage_rng(seed, "seeds"), band_rows)
+    provinces = _create(tmp, "provinces", shape, province_dtype(num_provinces, compact))
+    for y0, y1 in _bands(height, band_rows):
+        provinces[y0:y1] = nearest_seed(seeds, y0, y1, width, provinces.dtype)
+
+    borders = _create(tmp, "borders", shape, bool)
+    for y0, y1 in _bands(height, band_rows):
+        h0, h1 = _halo(height, y0, y1, 1)
+        block = np.asarray(provinces[h0:h1])
+        edge = np.zeros(block.shape, dtype=bool)
+        edge[1:] |= block[1:] != block[:-1]
+        edge[:-1] |= block[:-1] != block[1:]
+        edge[:, 1:] |= block[:, 1:] != block[:, :-1]
+        edge[:, :-1] |= block[:, :-1] != block[:, 1:]
+        borders[y0:y1] = edge[y0 - h0:y1 - h0]
+
+    rng = stage_rng(seed, "elevation")
+    base_noise = PerlinNoise(octaves=4, seed=int(rng.integers(0, 1e9)))
+    ridge_noise = PerlinNoise(octaves=6, seed=int(rng.integers(0, 1e9)))
+    raw = _create(scratch, "raw_elevation", shape, fdtype)
+    for y0, y1 in _bands(height, band_rows):
+        ridges = np.abs(_perlin_band(ridge_noise, width, height, y0, y1))
+        raw[y0:y1] = (_perlin_band(base_noise, width, height, y0, y1) * 0.7 + ridges * 0.3 + 1) / 2
+
+    elevation = _create(tmp, "elevation", shape, fdtype)
+    for y0, y1 in _bands(height, band_rows):
+        h0, h1 = _halo(height, y0, y1, 2)
+        elevation[y0:y1] = smooth_rows(np.asarray(raw[h0:h1]), 2)[y0 - h0:y1 - h0]
+    del raw
+
+    rain_noise = PerlinNoise(octaves=4, seed=int(stage_rng(seed, "rainfall").integers(0, 1e9)))
+    rainfall = _create(tmp, "rainfall", shape, fdtype)
+    temperature = _create(tmp, "temperature", shape, fdtype)
+    lat = np.linspace(1.0, 0.0, height, dtype=fdtype)
+    rain_range = [np.inf, -np.inf]
+    temp_range = [np.inf, -np.inf]
+    for y0, y1 in _bands(height, band_rows):
+        elev = np.asarray(elevation[y0:y1])
+        rain = ((_perlin_band(rain_noise, width, height, y0, y1) + 1) / 2).astype(fdtype)
+        # Rain shadow: the moisture scan runs along each row, all rows at once.
+        moisture = np.zeros(y1 - y0, dtype=fdtype)
+        for x in range(width):
+            moisture = np.maximum(moisture * 0.9, rain[:, x])
+            moisture = np.where(elev[:, x] > 0.6, moisture * 0.5, moisture)
+            rain[:, x] = moisture
+        temp = lat[y0:y1, None] - elev * 0.5
+        rainfall[y0:y1] = rain
+        temperature[y0:y1] = temp
+        for bounds, band in ((rain_range, rain), (temp_range, temp)):
+            bounds[0] = min(bounds[0], band.min())
+            bounds[1] = max(bounds[1], band.max())
+    for y0, y1 in _bands(height, band_rows):
+        rainfall[y0:y1] = (rainfall[y0:y1] - rain_range[0]) / (rain_range[1] - rain_range[0])
+        temperature[y0:y1] = (temperature[y0:y1] - temp_range[0]) / (temp_range[1] - temp_range[0])
+
+    index_dtype = np.int32 if height * width < 2**31 else np.int64
+    downslope = _create(scratch, "downslope", shape, index_dtype)
+    for y0, y1 in _bands(height, band_rows):
+        h0, h1 = _halo(height, y0, y1, 1)
+        local = grid_downslope(np.asarray(elevation[h0:h1])).astype(np.int64)
+        down = np.where(local >= 0, local + h0 * width, -1)
+        downslope[y0:y1] = down[y0 - h0:y1 - h0]
+    flux = _create(tmp, "water_flux", shape, fdtype)
+    accumulate_bands(downslope, flux, band_rows)
+    del downslope
+
+    # Every tile at or above sea level with enough flux is on a river.
+    river_map = _create(tmp, "river_map", shape, np.int32 if compact else int)
+    river_width = _create(tmp, "river_width", shape, np.uint8 if compact else int)
+    biome = _create(tmp, "biome", shape, np.uint8)
+    candidates_path = os.path.join(scratch, "candidates.bin")
+    per_province = np.zeros(num_provinces, dtype=np.int64)
+    with open(candidates_path, "wb") as fh:
+        for y0, y1 in _bands(height, band_rows):
+            h0, h1 = _halo(height, y0, y1, 1)
+            block = np.asarray(elevation[h0:h1])
+            elev = block[y0 - h0:y1 - h0]
+            f = np.asarray(flux[y0:y1])
+            river = (f >= MIN_RIVER_FLUX) & (elev >= SEA_LEVEL)
+            river_map[y0:y1] = river
+            river_width[y0:y1] = np.where(river, np.maximum(1, np.log2(np.maximum(f, 1))), 0).astype(int)
+
+            biome[y0:y1] = biome_codes(elev, np.asarray(temperature[y0:y1]))
+
+            # The halo rows only supply the sea around the band's edge tiles.
+            river_block = np.zeros(block.shape, dtype=bool)
+            river_block[y0 - h0:y1 - h0] = river
+            ys, xs = np.nonzero(city_candidates(block, river_block)[y0 - h0:y1 - h0])
+            prov = np.asarray(provinces[y0:y1])
+            per_province += np.bincount(prov[ys, xs], minlength=num_provinces)
+            np.column_stack([ys + y0, xs, prov[ys, xs]]).astype(np.int64).tofile(fh)
+
+    chunk = max(band_rows * width, 1)
+    candidates, offsets = _group_by_province(candidates_path, per_province, chunk)
+    cities = []
+    for p in np.flatnonzero(per_province):
+        best, best_score = None, -np.inf
+        for c0 in range(offsets[p], offsets[p + 1], chunk):
+            block = np.asarray(candidates[c0:min(c0 + chunk, offsets[p + 1])])
+            score = np.full(len(block), 1e9)
+            for cy, cx in cities:
+                score = np.minimum(score, np.hypot(block[:, 0] - cy, block[:, 1] - cx))
+            i = int(np.argmax(score))
+            if score[i] > best_score:
+                best, best_score = (int(block[i, 0]), int(block[i, 1])), score[i]
+        cities.append(best)
+    del candidates
+
+    for layer in (provinces, borders, elevation, rainfall, temperature, flux, river_map, river_width, biome):
+        layer.flush()
+    shutil.rmtree(scratch)
+    layers: Dict[str, Any] = {
+        name: {"kind": "array", "file": f"{name}.npy"}
+        for name in ("provinces", "borders", "elevation", "rainfall", "temperature", "water_flux",
+                     "river_map", "river_width")
+    }
+    layers["biome"] = {"kind": "categorical", "categories": BIOME_CATEGORIES, "file": "biome.npy"}
+    if cities:
+        np.save(os.path.join(tmp, "cities.npy"), np.asarray(cities, dtype=np.int64))
+        layers["cities"] = {"kind": "points", "file": "cities.npy"}
+    else:
+        layers["cities"] = {"kind": "json", "value": []}
+    with open(os.path.join(tmp, MANIFEST), "w") as fh:
+        json.dump({"format": WORLD_FORMAT_NAME, "version": 1, "layers": layers}, fh)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    return path
+
+
+def _group_by_province(path: str, per_province: np.ndarray, chunk: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Counting-sort the ``(y, x, province)`` rows of ``path`` by province, ``chunk`` rows at a time.
+
+    Returns the ``(y, x)`` rows and the offsets where each province starts.
+    Rows keep their file order within a province.
+    """
+    offsets = np.concatenate([[0], np.cumsum(per_province)])
+    if not offsets[-1]:
+        return np.zeros((0, 2), dtype=np.int64), offsets
+    rows = np.memmap(path, dtype=np.int64, mode="r").reshape(-1, 3)
+    grouped = np.memmap(f"{path}.grouped", dtype=np.int64, mode="w+", shape=(len(rows), 2))
+    cursor = offsets[:-1].copy()
+    for c0 in range(0, len(rows), chunk):
+        block = np.asarray(rows[c0:c0 + chunk])
+        order = np.argsort(block[:, 2], kind="stable")
+        province = block[order, 2]
+        counts = np.bincount(province, minlength=len(per_province))
+        first = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        grouped[cursor[province] + np.arange(len(order)) - first[province]] = block[order, :2]
+        cursor += counts
+    del rows
+    return grouped, offsets
+
+
+def open_world(path: str) -> Dict[str, Any]:
+    """Open a world on disk as memory maps without decoding the biome layer.
+
+    ``biome`` stays a ``uint8`` code map and ``biome_categories`` names the
+    codes, so band-wise consumers such as
+    :func:`~archipelago.render.export_png` never materialise the full map.
+    """
+    from archipelago_generator.storage import decode_layer, read_manifest
+
+    manifest = read_manifest(path, WORLD_FORMAT_NAME)
+    world: Dict[str, Any] = {}
+    for name, entry in manifest["layers"].items():
+        if entry["kind"] == "categorical":
+            world[name] = np.load(os.path.join(path, entry["file"]), mmap_mode="r")
+            world[f"{name}_categories"] = entry["categories"]
+        else:
+            world[name] = decode_layer(path, entry)
+    return world
@@ -1,11 +1,26 @@
 from __future__ import annotations
 
 import numpy as np
-from blessed import Terminal
 from .generator import BIOME_GLYPHS
 
 
+def _biome_codes(world: dict, window=slice(None)) -> np.ndarray:
+    """Indices into ``BIOME_GLYPHS`` of the biomes in ``world["biome"][window]``."""
+    band = np.asarray(world["biome"][window])
+    # Out-of-core worlds keep biomes as codes into ``biome_categories``.
+    categories = world.get("biome_categories")
+    names = list(BIOME_GLYPHS)
+    if categories is not None:
+        return np.array([names.index(c) for c in categories], dtype=np.uint8)[band]
+    codes = np.zeros(band.shape, dtype=np.uint8)
+    for i, name in enumerate(names):
+        codes[band == name] = i
+    return codes
+
+
 def render_map(world: dict):
+    from blessed import Terminal
+
     term = Terminal()
     elevation = world["elevation"]
     provinces = world["provinces"]
@@ -41,3 +56,66 @@ def render_map(world: dict):
             line += color + ch + term.normal
         lines.append(line)
     print(term.home + "\n".join(lines))
+
+
+def export_png(world: dict, fp, *, scale: int = 1, band_rows: int = 256, compress_level: int = 6) -> None:
+    """Write ``world`` as a palette PNG using the terminal renderer's colours."""
+    from archipelago_generator.rasterizer import palette_bands, write_png
+
+    names = list(BIOME_GLYPHS)
+    palette = [BIOME_GLYPHS[n][1] for n in names]
+    palette += [(160, 0, 160), (80, 180, 255), (0, 100, 255), (230, 180, 0)]
+    border, river, wide, city = range(len(names), len(palette))
+
+    river_map = world["river_map"]
+    river_width = world["river_width"]
+    height, width = world["biome"].shape
+
+    def base(y0: int, y1: int) -> np.ndarray:
+        return _biome_codes(world, slice(y0, y1))
+
+    bands = palette_bands(
+        base,
+        height,
+        [
+            (border, lambda y0, y1: world["borders"][y0:y1]),
+            (river, lambda y0, y1: river_map[y0:y1] > 0),
+            (wide, lambda y0, y1: (river_map[y0:y1] > 0) & (river_width[y0:y1] > 2)),
+        ],
+        [(city, world["cities"])],
+        band_rows=band_rows,
+        scale=scale,
+    )
+    write_png(fp, width * scale, height * scale, palette, bands, compress_level=compress_level)
+
+
+def world_layers(world: dict):
+    """Return :class:`~archipelago_generator.viewer.TileLayers` for the interactive viewer."""
+    from archipelago_generator.viewer import TileLayers
+
+    names = list(BIOME_GLYPHS)
+    palette = [BIOME_GLYPHS[n] for n in names]
+    palette += [("#", (160, 0, 160)), ("=", (80, 180, 255)), ("≡", (0, 100, 255)), ("@", (230, 180, 0))]
+    border, river, wide, city = range(len(names), len(palette))
+    biome, river_map, river_width = world["biome"], world["river_map"], world["river_width"]
+
+    return TileLayers(
+        biome.shape[0],
+        biome.shape[1],
+        palette,
+        lambda w: _biome_codes(world, w),
+        [
+            (border, lambda w: world["borders"][w]),
+            (river, lambda w: river_map[w] > 0),
+            (wide, lambda w: (river_map[w] > 0) & (river_width[w] > 2)),
+        ],
+        [(city, world["cities"])],
+    )
+
+
+def world_mesh(world: dict, **options):
+    """A :func:`~archipelago_generator.mesh.grid_mesh` of the world's elevation, coloured by biome."""
+    from archipelago_generator.mesh import grid_mesh
+
+    palette = np.array([rgb for _, rgb in BIOME_GLYPHS.values()], dtype=np.uint8)
+    return grid_mesh(world["elevation"], colors=palette[_biome_codes(world)], **options)
@@ -1,7 +1,41 @@
-"""Archipelago map generator package."""
+"""Archipelago map generator package.
 
-from .generator import generate_archipelago
-from .render import render_archipelago
-from .rasterizer import Rasterizer
+Public names are resolved lazily (PEP 562), so ``import archipelago_generator``
+only costs numpy. Submodules import shapely, scipy, perlin_noise and blessed
+inside the functions that need them, so each dependency is loaded the first
+time its stage runs.
+"""
 
-__all__ = ["generate_archipelago", "render_archipelago", "Rasterizer"]
+from __future__ import annotations
+
+import importlib
+from typing import TYPE_CHECKING, Any
+
+_EXPORTS = {
+    "generate_archipelago": "generator",
+    "render_archipelago": "render",
+    "Rasterizer": "rasterizer",
+    "save_archipelago": "storage",
+    "load_archipelago": "storage",
+}
+
+__all__ = list(_EXPORTS)
+
+if TYPE_CHECKING:
+    from .generator import generate_archipelago
+    from .render import render_archipelago
+    from .rasterizer import Rasterizer
+    from .storage import save_archipelago, load_archipelago
+
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,267 @@
+"""Command line entry point: ``python -m archipelago_generator <command>``."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+
+from .batch import FORMATS, KINDS, BatchJob, parse_seeds, run_batch
+
+
+def _batch(args: argparse.Namespace) -> None:
+    if args.kind == "world":
+        params = {"width": args.width, "height": args.height, "num_provinces": args.provinces}
+    else:
+        params = {"width": args.width, "height": args.height, "point_count": args.point_count}
+    job = BatchJob(args.out, kind=args.kind, fmt=args.format, params=params, scale=args.scale)
+
+    def progress(done: int, total: int, elapsed: float) -> None:
+        rate = done / elapsed if elapsed > 0 else 0.0
+        print(f"\r{done}/{total} maps  {rate:.2f} maps/s", end="", file=sys.stderr, flush=True)
+
+    report = run_batch(
+        job,
+        parse_seeds(args.seeds),
+        workers=args.workers,
+        chunksize=args.chunksize,
+        progress=None if args.quiet else progress,
+    )
+    if not args.quiet:
+        print(file=sys.stderr)
+    per_map = report.map_seconds / report.generated if report.generated else 0.0
+    print(
+        f"generated {report.generated} maps, skipped {report.skipped} existing, "
+        f"{report.elapsed:.1f}s wall, {report.maps_per_second:.2f} maps/s, "
+        f"{per_map * 1000:.0f} ms/map per worker"
+    )
+
+
+def _bench(args: argparse.Namespace) -> None:
+    from . import benchmarks
+
+    report = benchmarks.run(
+        quick=args.quick,
+        repeat=args.repeat,
+        memory=not args.no_memory,
+        pipelines=args.pipeline or ("archipelago", "world"),
+    )
+    print(benchmarks.format_report(report))
+    if args.out:
+        benchmarks.save(report, args.out)
+
+
+def _bench_compare(args: argparse.Namespace) -> None:
+    from . import benchmarks
+
+    regressions = benchmarks.compare(
+        benchmarks.load(args.baseline), benchmarks.load(args.current), threshold=args.threshold
+    )
+    for r in regressions:
+        print(
+            f"REGRESSION {r['pipeline']}/{r['stage']} {r['width']}x{r['height']} cells={r['cells']} "
+            f"{r['metric']}: {r['baseline']:.4g} -> {r['current']:.4g} (x{r['ratio']})"
+        )
+    if regressions:
+        sys.exit(1)
+    print("no regressions")
+
+
+def _bench_compact(args: argparse.Namespace) -> None:
+    from . import benchmarks
+
+    rows = benchmarks.compact_report(
+        world=(args.world_width, args.world_height),
+        archipelago=(args.width, args.height, args.point_count),
+    )
+    print(benchmarks.format_compact(rows))
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(rows, fh, indent=1)
+    if not all(r["passed"] for r in rows):
+        sys.exit(1)
+
+
+def _bench_import(args: argparse.Namespace) -> None:
+    from . import benchmarks
+
+    for row in benchmarks.import_report(runs=args.runs):
+        heavy = ", ".join(row["heavy_loaded"]) or "-"
+        print(f"{row['median'] * 1000:8.1f} ms  {row['statement']:<62} loads: {heavy}")
+
+
+def _serve(args: argparse.Namespace) -> None:
+    import asyncio
+
+    from .service import serve
+
+    try:
+        asyncio.run(serve(args.host, args.port, workers=args.workers,
+                          max_bytes=args.cache_mb * 2**20, max_pending=args.max_pending))
+    except KeyboardInterrupt:
+        pass
+
+
+def _open_or_generate(args: argparse.Namespace):
+    if args.path:
+        from .storage import load_archipelago
+
+        return load_archipelago(args.path)
+    from .generator import generate_archipelago
+
+    return generate_archipelago(width=args.width, height=args.height, point_count=args.point_count,
+                                seed=args.seed)
+
+
+def _view(args: argparse.Namespace) -> None:
+    from .viewer import archipelago_layers, view
+
+    view(archipelago_layers(_open_or_generate(args)))
+
+
+def _export(args: argparse.Namespace) -> None:
+    from .export import export_json
+
+    count = export_json(_open_or_generate(args), args.out, fmt=args.format)
+    print(f"wrote {count} records to {args.out}")
+
+
+def _mesh(args: argparse.Namespace) -> None:
+    from .mesh import archipelago_mesh, write_glb, write_obj
+
+    options = {} if args.source == "cells" else {
+        "max_error": args.max_error, "sea_level": args.sea_level, "chunk": args.chunk, "by_chunk": args.by_chunk,
+    }
+    mesh = archipelago_mesh(_open_or_generate(args), source=args.source, vertical_scale=args.vertical_scale,
+                            **options)
+    if args.out.endswith(".obj"):
+        if isinstance(mesh, dict):
+            sys.exit("--by-chunk needs .glb output")
+        write_obj(mesh, args.out)
+    else:
+        write_glb(mesh, args.out)
+    triangles = sum(map(len, mesh.values())) if isinstance(mesh, dict) else len(mesh)
+    print(f"wrote {triangles} triangles to {args.out}")
+
+
+def _seasons(args: argparse.Namespace) -> None:
+    from .seasons import export_frames, play, seasonal_biomes
+
+    arch = _open_or_generate(args)
+    seasons = seasonal_biomes(arch, args.frames, temperature_amplitude=args.temperature_amplitude,
+                              moisture_amplitude=args.moisture_amplitude)
+    if args.out:
+        paths = export_frames(arch, seasons, args.out, scale=args.scale)
+        print(f"wrote {len(paths)} frames to {os.path.dirname(paths[0]) or '.'}")
+    else:
+        play(arch, seasons, fps=args.fps)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m archipelago_generator")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    batch = sub.add_parser("batch", help="generate many seeds in parallel")
+    batch.add_argument("--seeds", required=True, help="e.g. 0:10000, 0:100:5 or 1,2,3")
+    batch.add_argument("--out", required=True, help="output directory")
+    batch.add_argument("--kind", choices=KINDS, default="archipelago")
+    batch.add_argument("--format", choices=FORMATS, default="binary")
+    batch.add_argument("--workers", type=int, default=None, help="default: CPU count")
+    batch.add_argument("--chunksize", type=int, default=4, help="seeds per submitted task")
+    batch.add_argument("--width", type=int, default=200)
+    batch.add_argument("--height", type=int, default=200)
+    batch.add_argument("--point-count", type=int, default=1024)
+    batch.add_argument("--provinces", type=int, default=5)
+    batch.add_argument("--scale", type=int, default=1, help="pixels per tile for PNG output")
+    batch.add_argument("--quiet", action="store_true")
+    batch.set_defaults(func=_batch)
+
+    bench = sub.add_parser("bench", help="time every pipeline stage across map sizes")
+    bench.add_argument("--out", help="write the JSON report here")
+    bench.add_argument("--quick", action="store_true", help="small sweep for smoke testing")
+    bench.add_argument("--repeat", type=int, default=3, help="runs per stage, best is kept")
+    bench.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    bench.add_argument("--pipeline", action="append", choices=("archipelago", "world"))
+    bench.set_defaults(func=_bench)
+
+    cmp = sub.add_parser("bench-compare", help="flag regressions against a baseline report")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown")
+    cmp.set_defaults(func=_bench_compare)
+
+    bc = sub.add_parser("bench-compact", help="compare peak memory and outputs of compact mode")
+    bc.add_argument("--width", type=int, default=400)
+    bc.add_argument("--height", type=int, default=400)
+    bc.add_argument("--point-count", type=int, default=2048)
+    bc.add_argument("--world-width", type=int, default=256)
+    bc.add_argument("--world-height", type=int, default=128)
+    bc.add_argument("--out", help="write the JSON rows here")
+    bc.set_defaults(func=_bench_compact)
+
+    imp = sub.add_parser("bench-import", help="measure cold import time in fresh interpreters")
+    imp.add_argument("--runs", type=int, default=5)
+    imp.set_defaults(func=_bench_import)
+
+    srv = sub.add_parser("serve", help="run the local HTTP map service")
+    srv.add_argument("--host", default="127.0.0.1")
+    srv.add_argument("--port", type=int, default=8080)
+    srv.add_argument("--workers", type=int, default=None, help="generator processes, default: CPU count")
+    srv.add_argument("--cache-mb", type=int, default=256, help="memory budget for finished maps")
+    srv.add_argument("--max-pending", type=int, default=64, help="distinct maps queued before 503")
+    srv.set_defaults(func=_serve)
+
+    vw = sub.add_parser("view", help="pan and zoom over a map in the terminal")
+    vw.add_argument("path", nargs="?", help="a saved map to open instead of generating one")
+    vw.add_argument("--width", type=int, default=400)
+    vw.add_argument("--height", type=int, default=400)
+    vw.add_argument("--point-count", type=int, default=2048)
+    vw.add_argument("--seed", type=int, default=0)
+    vw.set_defaults(func=_view)
+
+    ex = sub.add_parser("export", help="stream the polygon graph as NDJSON or JSON")
+    ex.add_argument("out", help="output file; a .gz suffix compresses it")
+    ex.add_argument("path", nargs="?", help="a saved map to export instead of generating one")
+    ex.add_argument("--format", choices=("ndjson", "json"), default="ndjson")
+    ex.add_argument("--width", type=int, default=400)
+    ex.add_argument("--height", type=int, default=400)
+    ex.add_argument("--point-count", type=int, default=2048)
+    ex.add_argument("--seed", type=int, default=0)
+    ex.set_defaults(func=_export)
+
+    ms = sub.add_parser("mesh", help="export a 3D terrain mesh as .glb or .obj")
+    ms.add_argument("out", help="output file, .glb or .obj")
+    ms.add_argument("path", nargs="?", help="a saved map to mesh instead of generating one")
+    ms.add_argument("--source", choices=("grid", "cells"), default="grid")
+    ms.add_argument("--max-error", type=float, default=0.005, help="decimation tolerance in elevation units")
+    ms.add_argument("--sea-level", type=float, default=None, help="flatten the sea to this height")
+    ms.add_argument("--chunk", type=int, default=64, help="quadtree root size, a power of two")
+    ms.add_argument("--by-chunk", action="store_true", help="one glTF node per chunk")
+    ms.add_argument("--vertical-scale", type=float, default=20.0)
+    ms.add_argument("--width", type=int, default=400)
+    ms.add_argument("--height", type=int, default=400)
+    ms.add_argument("--point-count", type=int, default=2048)
+    ms.add_argument("--seed", type=int, default=0)
+    ms.set_defaults(func=_mesh)
+
+    ss = sub.add_parser("seasons", help="animate seasonal biomes in the terminal or as PNG frames")
+    ss.add_argument("path", nargs="?", help="a saved map to animate instead of generating one")
+    ss.add_argument("--out", help="PNG name pattern such as frames/{:02d}.png; plays in the terminal if omitted")
+    ss.add_argument("--frames", type=int, default=52, help="time steps per year")
+    ss.add_argument("--temperature-amplitude", type=float, default=0.15)
+    ss.add_argument("--moisture-amplitude", type=float, default=0.1)
+    ss.add_argument("--fps", type=float, default=8.0)
+    ss.add_argument("--scale", type=int, default=1, help="pixels per tile for PNG output")
+    ss.add_argument("--width", type=int, default=400)
+    ss.add_argument("--height", type=int, default=400)
+    ss.add_argument("--point-count", type=int, default=2048)
+    ss.add_argument("--seed", type=int, default=0)
+    ss.set_defaults(func=_seasons)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Parallel multi-seed map generation.
+
+Seeds are split into chunks that are submitted to a process pool, with only
+a few chunks in flight per worker. Each worker imports the generator stack
+once in its initializer and writes its maps straight to the output
+directory, so only seeds and timings travel back to the parent. Seeds whose
+output already exists are skipped, which makes an interrupted run resumable.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+KINDS = ("archipelago", "world")
+FORMATS = ("binary", "png")
+
+
+@dataclass(frozen=True)
+class BatchJob:
+    """What every worker generates and where it writes it."""
+
+    out_dir: str
+    kind: str = "archipelago"
+    fmt: str = "binary"
+    params: Dict[str, Any] = field(default_factory=dict)
+    scale: int = 1
+
+    def output_path(self, seed: int) -> str:
+        ext = "png" if self.fmt == "png" else self.kind
+        return os.path.join(self.out_dir, f"{self.kind}_{seed}.{ext}")
+
+
+@dataclass
+class BatchReport:
+    generated: int
+    skipped: int
+    elapsed: float
+    map_seconds: float
+
+    @property
+    def maps_per_second(self) -> float:
+        return self.generated / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def parse_seeds(spec: str) -> List[int]:
+    """Parse ``"0:100"``, ``"0:100:5"``, ``"1,4,9"`` or ``"7"`` into seeds."""
+    seeds: List[int] = []
+    for part in spec.split(","):
+        part = part.strip()
+        if ":" in part:
+            seeds.extend(range(*(int(p) for p in part.split(":"))))
+        elif part:
+            seeds.append(int(part))
+    return seeds
+
+
+def warm_up(kind: str) -> None:
+    """Pay the generator's import cost once per worker, not once per map."""
+    if kind == "world":
+        import archipelago.generator  # noqa: F401
+    else:
+        import archipelago_generator.generator  # noqa: F401
+        import archipelago_generator.storage  # noqa: F401
+
+
+def _write_one(job: BatchJob, seed: int) -> None:
+    path = job.output_path(seed)
+    if job.kind == "world":
+        from archipelago.generator import generate_world
+        from archipelago.render import export_png as export_world_png
+        from .storage import save_world
+
+        world = generate_world(seed=seed, **job.params)
+        if job.fmt == "png":
+            tmp = f"{path}.tmp{os.getpid()}"
+            export_world_png(world, tmp, scale=job.scale)
+            os.replace(tmp, path)
+        else:
+            save_world(world, path)
+    else:
+        from .generator import generate_archipelago
+        from .rasterizer import export_png
+        from .storage import save_archipelago
+
+        arch = generate_archipelago(seed=seed, **job.params)
+        if job.fmt == "png":
+            tmp = f"{path}.tmp{os.getpid()}"
+            export_png(arch, tmp, scale=job.scale)
+            os.replace(tmp, path)
+        else:
+            save_archipelago(arch, path)
+
+
+def _run_chunk(job: BatchJob, seeds: Sequence[int]) -> List[Tuple[int, float]]:
+    timings = []
+    for seed in seeds:
+        start = time.perf_counter()
+        _write_one(job, seed)
+        timings.append((seed, time.perf_counter() - start))
+    return timings
+
+
+def run_batch(
+    job: BatchJob,
+    seeds: Sequence[int],
+    *,
+    workers: Optional[int] = None,
+    chunksize: int = 4,
+    progress: Optional[Callable[[int, int, float], None]] = None,
+) -> BatchReport:
+    """Generate every seed in ``seeds`` that is not already on disk.
+
+    ``workers`` defaults to the CPU count; ``workers=1`` runs in-process.
+    ``progress(done, total, elapsed)`` is called after each finished chunk.
+    """
+
+    if job.kind not in KINDS:
+        raise ValueError(f"kind must be one of {KINDS}")
+    if job.fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    os.makedirs(job.out_dir, exist_ok=True)
+    todo = [s for s in seeds if not os.path.exists(job.output_path(s))]
+    skipped = len(seeds) - len(todo)
+    chunks = [todo[i:i + chunksize] for i in range(0, len(todo), chunksize)]
+    workers = workers or os.cpu_count() or 1
+
+    start = time.perf_counter()
+    done = 0
+    map_seconds = 0.0
+
+    def finished(timings: List[Tuple[int, float]]) -> None:
+        nonlocal done, map_seconds
+        done += len(timings)
+        map_seconds += sum(t for _, t in timings)
+        if progress is not None:
+            progress(done, len(todo), time.perf_counter() - start)
+
+    if workers == 1:
+        warm_up(job.kind)
+        for chunk in chunks:
+            finished(_run_chunk(job, chunk))
+    else:
+        with ProcessPoolExecutor(workers, initializer=warm_up, initargs=(job.kind,)) as pool:
+            pending = set()
+            queue = iter(chunks)
+            # Keep a couple of chunks per worker queued so no worker idles,
+            # without materialising futures for the whole seed range.
+            for chunk in queue:
+                pending.add(pool.submit(_run_chunk, job, chunk))
+                if len(pending) >= 2 * workers:
+                    break
+            while pending:
+                finished_set, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished_set:
+                    finished(fut.result())
+                    nxt = next(queue, None)
+                    if nxt is not None:
+                        pending.add(pool.submit(_run_chunk, job, nxt))
+
+    return BatchReport(done, skipped, time.perf_counter() - start, map_seconds)
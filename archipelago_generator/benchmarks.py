@@ -0,0 +1,385 @@
+"""Per-stage benchmarks for ``generate_archipelago`` and ``generate_world``.
+
+Every pipeline stage (plus terminal rendering and PNG export) is timed on a
+sweep of map sizes and, for archipelagos, cell counts. Wall time is the best
+of ``repeat`` runs; peak memory is measured in a separate ``tracemalloc``
+pass so tracing does not distort the timings. Results are written as JSON,
+scaling exponents are fitted on log-log axes, and :func:`compare` flags
+regressions against a stored baseline.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import copy
+import io
+import json
+import platform
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .pipeline import stage_rng
+
+# (width, height, point_count) sweeps. The size sweep keeps the cell count
+# fixed and the cell sweep keeps the map size fixed, so each exponent
+# isolates one variable.
+ARCHIPELAGO_SIZE_SWEEP = [(100, 100, 1024), (200, 200, 1024), (400, 400, 1024)]
+ARCHIPELAGO_CELL_SWEEP = [(200, 200, 512), (200, 200, 1024), (200, 200, 2048)]
+WORLD_SIZE_SWEEP = [(32, 16), (64, 32), (128, 64)]
+QUICK_ARCHIPELAGO_SIZE_SWEEP = [(50, 50, 256), (100, 100, 256)]
+QUICK_ARCHIPELAGO_CELL_SWEEP = [(100, 100, 128), (100, 100, 256)]
+QUICK_WORLD_SIZE_SWEEP = [(16, 8), (32, 16)]
+
+# PRD performance target: a full 5k-cell map in under 500 ms.
+TARGET_CELLS = 5000
+TARGET_SECONDS = 0.5
+
+
+def _measure(func: Callable[[], Any], repeat: int, memory: bool) -> Tuple[float, Optional[int], Any]:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak, result
+
+
+def time_stages(stages, params, extra: Sequence[Tuple[str, Callable[[Dict[str, Any]], Any]]] = (),
+                *, repeat: int = 1, memory: bool = True) -> List[Dict[str, Any]]:
+    """Run ``stages`` in order and return one ``{stage, wall, peak_bytes}`` per stage.
+
+    ``extra`` holds ``(name, fn(values))`` steps run after the pipeline, such
+    as rendering, and are timed the same way.
+    """
+
+    values: Dict[str, Any] = {}
+    rows = []
+    for stage in stages:
+        kwargs = {p: getattr(params, p) for p in stage.params}
+
+        def call(stage=stage, kwargs=kwargs):
+            # Each run gets fresh copies of inputs the stage may advance.
+            args = dict(kwargs)
+            for inp in stage.inputs:
+                v = values[inp]
+                args[inp] = copy.deepcopy(v) if isinstance(v, np.random.Generator) else v
+            if stage.seeded:
+                args["rng"] = stage_rng(getattr(params, "seed", None), stage.name)
+            return stage.func(**args)
+
+        wall, peak, outputs = _measure(call, repeat, memory)
+        values.update(outputs)
+        rows.append({"stage": stage.name, "wall": wall, "peak_bytes": peak})
+    for name, fn in extra:
+        wall, peak, _ = _measure(lambda fn=fn: fn(values), repeat, memory)
+        rows.append({"stage": name, "wall": wall, "peak_bytes": peak})
+    return rows
+
+
+def _quiet(fn: Callable[[], Any]) -> Any:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn()
+
+
+def bench_archipelago(width: int, height: int, point_count: int, *, repeat: int = 1,
+                      memory: bool = True) -> List[Dict[str, Any]]:
+    from .generator import STAGES, Archipelago, ArchipelagoParams
+    from .rasterizer import export_png
+    from .render import render_archipelago
+
+    params = ArchipelagoParams(width=width, height=height, point_count=point_count, seed=0)
+
+    def arch(values):
+        names = [f for f in Archipelago.__dataclass_fields__ if f in values]
+        return Archipelago(width=width, height=height, **{n: values[n] for n in names})
+
+    extra = [
+        ("render", lambda v: _quiet(lambda: render_archipelago(arch(v)))),
+        ("png", lambda v: export_png(arch(v), io.BytesIO())),
+    ]
+    rows = time_stages(STAGES, params, extra, repeat=repeat, memory=memory)
+    for row in rows:
+        row.update(pipeline="archipelago", width=width, height=height, cells=point_count)
+    return rows
+
+
+def bench_world(width: int, height: int, *, repeat: int = 1, memory: bool = True) -> List[Dict[str, Any]]:
+    from archipelago.generator import STAGES, WorldParams
+    from archipelago.render import export_png, render_map
+
+    params = WorldParams(width=width, height=height, seed=0)
+    extra = [
+        ("render", lambda v: _quiet(lambda: render_map(v))),
+        ("png", lambda v: export_png(v, io.BytesIO())),
+    ]
+    rows = time_stages(STAGES, params, extra, repeat=repeat, memory=memory)
+    for row in rows:
+        row.update(pipeline="world", width=width, height=height, cells=params.num_provinces)
+    return rows
+
+
+def fit_exponents(rows: List[Dict[str, Any]], sweep: str, variable: str) -> Dict[str, float]:
+    """Fit ``wall ~ variable ** k`` per stage of ``sweep`` and return ``k``."""
+    series: Dict[str, List[Tuple[float, float]]] = {}
+    for row in rows:
+        if row["sweep"] != sweep:
+            continue
+        x = row["width"] * row["height"] if variable == "pixels" else row["cells"]
+        series.setdefault(f"{row['pipeline']}/{row['stage']}", []).append((x, row["wall"]))
+    exponents = {}
+    for name, pts in series.items():
+        xs = np.log([p[0] for p in pts])
+        ys = np.log([max(p[1], 1e-7) for p in pts])
+        if len(set(xs)) >= 2:
+            exponents[name] = round(float(np.polyfit(xs, ys, 1)[0]), 3)
+    return exponents
+
+
+def run(*, quick: bool = False, repeat: int = 3, memory: bool = True,
+        pipelines: Sequence[str] = ("archipelago", "world")) -> Dict[str, Any]:
+    """Run the full sweep and return a JSON-serialisable report."""
+    rows: List[Dict[str, Any]] = []
+    if "archipelago" in pipelines:
+        size_sweep = QUICK_ARCHIPELAGO_SIZE_SWEEP if quick else ARCHIPELAGO_SIZE_SWEEP
+        cell_sweep = QUICK_ARCHIPELAGO_CELL_SWEEP if quick else ARCHIPELAGO_CELL_SWEEP
+        for sweep, sizes in (("size", size_sweep), ("cells", cell_sweep)):
+            for w, h, n in sizes:
+                for row in bench_archipelago(w, h, n, repeat=repeat, memory=memory):
+                    rows.append(dict(row, sweep=sweep))
+    if "world" in pipelines:
+        for w, h in QUICK_WORLD_SIZE_SWEEP if quick else WORLD_SIZE_SWEEP:
+            for row in bench_world(w, h, repeat=repeat, memory=memory):
+                rows.append(dict(row, sweep="size"))
+
+    scaling = {
+        "pixels": fit_exponents(rows, "size", "pixels"),
+        "cells": fit_exponents(rows, "cells", "cells"),
+    }
+    report: Dict[str, Any] = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": repeat,
+        },
+        "results": rows,
+        "scaling": scaling,
+    }
+    if "archipelago" in pipelines and not quick:
+        from .generator import generate_archipelago
+
+        wall, _, _ = _measure(lambda: generate_archipelago(seed=0, point_count=TARGET_CELLS), repeat, False)
+        report["targets"] = {
+            "full_map_5k_cells": {"wall": wall, "limit": TARGET_SECONDS, "passed": wall < TARGET_SECONDS}
+        }
+    return report
+
+
+# ``compact=True`` must cut peak generation memory at least this much.
+COMPACT_TARGET_REDUCTION = 3.0
+# Largest allowed difference of a float field between the two modes.
+COMPACT_TOLERANCE = 1e-5
+
+
+def _peak(func: Callable[[], Any]) -> Tuple[int, Any]:
+    tracemalloc.start()
+    try:
+        result = func()
+        return tracemalloc.get_traced_memory()[1], result
+    finally:
+        tracemalloc.stop()
+
+
+def _layer_agreement(full: Dict[str, Any], compact: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    layers = {}
+    for name, a in full.items():
+        b = compact.get(name)
+        if not isinstance(a, np.ndarray) or not isinstance(b, np.ndarray) or a.shape != b.shape:
+            continue
+        if a.dtype.kind == "f":
+            diff = float(np.max(np.abs(a - b.astype(a.dtype)))) if a.size else 0.0
+            layers[name] = {"dtype": str(b.dtype), "max_abs_diff": diff, "ok": diff <= COMPACT_TOLERANCE}
+        else:
+            # Thresholded layers can flip where a value rounds across a threshold.
+            agree = float(np.mean(a == b)) if a.size else 1.0
+            layers[name] = {"dtype": str(b.dtype), "agreement": agree, "ok": agree >= 0.99}
+    return layers
+
+
+def compact_report(*, world: Tuple[int, int] = (256, 128),
+                   archipelago: Tuple[int, int, int] = (400, 400, 2048)) -> List[Dict[str, Any]]:
+    """Peak generation memory with and without ``compact`` and the output agreement.
+
+    Both pipelines are generated twice with the same seed; layers are
+    compared field by field (float fields within ``COMPACT_TOLERANCE``,
+    integer and boolean layers by the share of equal entries).
+    """
+
+    import dataclasses
+
+    from archipelago.generator import generate_world
+
+    from .generator import generate_archipelago
+
+    def arch_fields(**kw):
+        arch = generate_archipelago(seed=0, width=archipelago[0], height=archipelago[1],
+                                    point_count=archipelago[2], **kw)
+        return {f.name: getattr(arch, f.name) for f in dataclasses.fields(arch)}
+
+    runs = [
+        ("world", world, lambda **kw: generate_world(world[0], world[1], seed=0, **kw)),
+        ("archipelago", archipelago, arch_fields),
+    ]
+    rows = []
+    for pipeline, size, generate in runs:
+        full_peak, full = _peak(generate)
+        compact_peak, compact = _peak(lambda: generate(compact=True))
+        layers = _layer_agreement(full, compact)
+        reduction = full_peak / max(compact_peak, 1)
+        rows.append({
+            "pipeline": pipeline,
+            "size": list(size),
+            "peak_bytes": full_peak,
+            "compact_peak_bytes": compact_peak,
+            "reduction": round(reduction, 2),
+            "layers": layers,
+            "passed": reduction >= COMPACT_TARGET_REDUCTION and all(v["ok"] for v in layers.values()),
+        })
+    return rows
+
+
+def format_compact(rows: List[Dict[str, Any]]) -> str:
+    lines = []
+    for r in rows:
+        status = "PASS" if r["passed"] else "FAIL"
+        lines.append(
+            f"{r['pipeline']:<12}{'x'.join(map(str, r['size'])):<14}"
+            f"{r['peak_bytes'] / 2**20:>8.1f} MB -> {r['compact_peak_bytes'] / 2**20:>6.1f} MB"
+            f"  x{r['reduction']:<5} {status}"
+        )
+        for name, layer in sorted(r["layers"].items()):
+            detail = (f"max diff {layer['max_abs_diff']:.2e}" if "max_abs_diff" in layer
+                      else f"agreement {layer['agreement']:.4f}")
+            lines.append(f"  {name:<14}{layer['dtype']:<9}{detail}{'' if layer['ok'] else '  !'}")
+    return "\n".join(lines)
+
+
+HEAVY_MODULES = ("shapely", "scipy", "perlin_noise", "blessed")
+
+_IMPORT_PROBE = """
+import sys, time
+t = time.perf_counter()
+{stmt}
+dt = time.perf_counter() - t
+print(dt, ",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def import_time(stmt: str, *, runs: int = 5) -> Dict[str, Any]:
+    """Time ``stmt`` in ``runs`` fresh interpreters and report the median.
+
+    Also lists which heavy dependencies the statement loaded.
+    """
+
+    import os
+    import subprocess
+    import sys
+
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (root, env.get("PYTHONPATH")) if p)
+    samples, loaded = [], ""
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", _IMPORT_PROBE.format(stmt=stmt, heavy=HEAVY_MODULES)],
+            capture_output=True, text=True, check=True, env=env,
+        ).stdout.split()
+        samples.append(float(out[0]))
+        loaded = out[1] if len(out) > 1 else ""
+    return {"statement": stmt, "median": float(np.median(samples)), "heavy_loaded": loaded.split(",") if loaded else []}
+
+
+def import_report(*, runs: int = 5) -> List[Dict[str, Any]]:
+    """Cold-start cost of the packages versus eagerly importing their dependencies."""
+    return [
+        import_time("import archipelago_generator", runs=runs),
+        import_time("from archipelago_generator import generate_archipelago", runs=runs),
+        import_time("import archipelago", runs=runs),
+        import_time("import numpy, shapely, scipy.spatial, perlin_noise, blessed", runs=runs),
+    ]
+
+
+def _key(row: Dict[str, Any]) -> Tuple:
+    return (row["pipeline"], row.get("sweep"), row["stage"], row["width"], row["height"], row["cells"])
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], *, threshold: float = 0.2,
+            min_seconds: float = 1e-3) -> List[Dict[str, Any]]:
+    """Return the entries of ``current`` that regressed against ``baseline``.
+
+    A stage regresses when its wall time or peak memory grew by more than
+    ``threshold`` (relative). Stages faster than ``min_seconds`` in both runs
+    are ignored for timing because their noise dominates.
+    """
+
+    base = {_key(r): r for r in baseline["results"]}
+    regressions = []
+    for row in current["results"]:
+        old = base.get(_key(row))
+        if old is None:
+            continue
+        for metric in ("wall", "peak_bytes"):
+            a, b = old.get(metric), row.get(metric)
+            if a is None or b is None or a <= 0:
+                continue
+            if metric == "wall" and max(a, b) < min_seconds:
+                continue
+            ratio = b / a
+            if ratio > 1 + threshold:
+                regressions.append({
+                    "pipeline": row["pipeline"], "sweep": row.get("sweep"), "stage": row["stage"],
+                    "width": row["width"], "height": row["height"], "cells": row["cells"],
+                    "metric": metric, "baseline": a, "current": b, "ratio": round(ratio, 3),
+                })
+    return regressions
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"{'pipeline':<12}{'sweep':<7}{'stage':<14}{'size':>10}{'cells':>7}{'ms':>10}{'peak MB':>9}"]
+    for r in report["results"]:
+        peak = "" if r["peak_bytes"] is None else f"{r['peak_bytes'] / 2**20:.1f}"
+        lines.append(
+            f"{r['pipeline']:<12}{r['sweep']:<7}{r['stage']:<14}{r['width']:>5}x{r['height']:<4}"
+            f"{r['cells']:>7}{r['wall'] * 1000:>10.2f}{peak:>9}"
+        )
+    for variable, exps in report["scaling"].items():
+        if exps:
+            lines.append(f"scaling exponents vs {variable}:")
+            lines.extend(f"  {name:<28}{k:>6.2f}" for name, k in sorted(exps.items()))
+    for name, t in report.get("targets", {}).items():
+        status = "PASS" if t["passed"] else "FAIL"
+        lines.append(f"target {name}: {t['wall'] * 1000:.0f} ms (limit {t['limit'] * 1000:.0f} ms) {status}")
+    return "\n".join(lines)
+
+
+def save(report: Dict[str, Any], path: str) -> None:
+    with open(path, "w") as fh:
+        json.dump(report, fh, indent=1)
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path) as fh:
+        return json.load(fh)
@@ -21,44 +21,28 @@ BIOMES = [
 
 def classify_biomes(land_mask: np.ndarray, temp: np.ndarray, moisture: np.ndarray) -> np.ndarray:
     """Classify biome for each cell using a coarse Whittaker diagram."""
-    biome = np.empty(len(land_mask), dtype=object)
-    for i in range(len(biome)):
-        if not land_mask[i]:
-            biome[i] = "ocean"
-            continue
-
-        t = temp[i]
-        m = moisture[i]
-
-        # extremely dry region independent of temperature
-        if m < 0.05:
-            biome[i] = "scorched"
-            continue
-
-        if t < 0.2:  # very cold
-            biome[i] = "snow" if m > 0.5 else "tundra"
-        elif t < 0.4:  # cold/temperate
-            if m < 0.25:
-                biome[i] = "desert"
-            elif m < 0.5:
-                biome[i] = "grassland"
-            else:
-                biome[i] = "forest"
-        elif t < 0.7:  # temperate/warm
-            if m < 0.25:
-                biome[i] = "desert"
-            elif m < 0.5:
-                biome[i] = "grassland"
-            elif m < 0.75:
-                biome[i] = "forest"
-            else:
-                biome[i] = "dark_forest"
-        else:  # hot
-            if m < 0.3:
-                biome[i] = "desert" if m > 0.05 else "scorched"
-            elif m < 0.6:
-                biome[i] = "grassland"
-            else:
-                biome[i] = "jungle"
-    return biome
-
+    return np.array(BIOMES, dtype=object)[classify_biome_codes(land_mask, temp, moisture)]
+
+
+def classify_biome_codes(land_mask: np.ndarray, temp: np.ndarray, moisture: np.ndarray) -> np.ndarray:
+    """Classify biomes as ``uint8`` indices into :data:`BIOMES`.
+
+    The inputs broadcast against each other, so a ``(T, n)`` stack of
+    temperatures classifies ``T`` frames at once.
+    """
+    land_mask, t, m = np.broadcast_arrays(np.asarray(land_mask, dtype=bool), temp, moisture)
+    code = {name: i for i, name in enumerate(BIOMES)}
+    hot_dry = np.where(m > 0.05, code["desert"], code["scorched"])
+    choices = [
+        (~land_mask, code["ocean"]),
+        (m < 0.05, code["scorched"]),
+        ((t < 0.2) & (m > 0.5), code["snow"]),
+        (t < 0.2, code["tundra"]),
+        ((t < 0.7) & (m < 0.25), code["desert"]),
+        ((t < 0.7) & (m < 0.5), code["grassland"]),
+        ((t < 0.7) & ((t < 0.4) | (m < 0.75)), code["forest"]),
+        (t < 0.7, code["dark_forest"]),
+        (m < 0.3, hot_dry),
+        (m < 0.6, code["grassland"]),
+    ]
+    return np.select([c for c, _ in choices], [v for _, v in choices], code["jungle"]).astype(np.uint8)
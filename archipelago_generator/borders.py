@@ -2,14 +2,15 @@
 
 from __future__ import annotations
 
-from typing import List, Set
+from typing import TYPE_CHECKING, List, Set
 
 import numpy as np
-from shapely.geometry import Polygon, LineString
-from shapely.geometry.base import BaseGeometry
-from shapely.prepared import prep
-from shapely.strtree import STRtree
-from perlin_noise import PerlinNoise
+
+from .instrument import count
+
+if TYPE_CHECKING:
+    from perlin_noise import PerlinNoise
+    from shapely.geometry import Polygon, LineString
 
 
 def compute_adjacency(cells: List[Polygon]) -> List[Set[int]]:
@@ -21,6 +22,10 @@ def compute_adjacency(cells: List[Polygon]) -> List[Set[int]]:
     accelerates processing for larger maps (e.g. 1024 cells).
     """
 
+    from shapely.geometry.base import BaseGeometry
+    from shapely.prepared import prep
+    from shapely.strtree import STRtree
+
     n = len(cells)
     neighbors: List[Set[int]] = [set() for _ in range(n)]
 
@@ -28,6 +33,7 @@ def compute_adjacency(cells: List[Polygon]) -> List[Set[int]]:
     index_map = {geom.wkb: idx for idx, geom in enumerate(cells)}
 
     prepared = [prep(c) for c in cells]
+    count("strtree_queries", n)
 
     for i, poly in enumerate(cells):
         results = tree.query(poly)
@@ -84,6 +90,8 @@ def unite_regions(biomes: np.ndarray, neighbors: List[Set[int]]) -> np.ndarray:
 
 def _distort_line(line: LineString, noise: PerlinNoise, *, amplitude: float, frequency: float) -> LineString:
     """Return a distorted copy of ``line`` using 1D noise."""
+    from shapely.geometry import LineString
+
     if line.length == 0:
         return line
     (x1, y1), (x2, y2) = line.coords[0], line.coords[-1]
@@ -93,6 +101,7 @@ def _distort_line(line: LineString, noise: PerlinNoise, *, amplitude: float, fre
         return line
     norm = norm / np.linalg.norm(norm)
     steps = max(int(line.length / 5), 2)
+    count("noise_samples", steps + 1)
     pts = []
     for i in range(steps + 1):
         t = i / steps
@@ -103,6 +112,19 @@ def _distort_line(line: LineString, noise: PerlinNoise, *, amplitude: float, fre
     return LineString(pts)
 
 
+def shared_edges(a: Polygon, b: Polygon) -> List[LineString]:
+    """Return the line pieces of the boundary shared by cells ``a`` and ``b``."""
+
+    inter = a.intersection(b)
+    if inter.is_empty:
+        return []
+    if inter.geom_type == "LineString":
+        return [inter]
+    if inter.geom_type == "MultiLineString":
+        return list(inter.geoms)
+    return []
+
+
 def compute_borders(
     cells: List[Polygon],
     biomes: np.ndarray,
@@ -113,6 +135,8 @@ def compute_borders(
     seed: int = 0,
 ) -> List[LineString]:
     """Compute distorted borders between different biomes."""
+    from perlin_noise import PerlinNoise
+
     noise = PerlinNoise(seed=seed)
     lines: List[LineString] = []
     for i, neigh in enumerate(neighbors):
@@ -121,13 +145,6 @@ def compute_borders(
                 continue
             if biomes[i] == biomes[j]:
                 continue
-            inter = cells[i].intersection(cells[j])
-            if inter.is_empty:
-                continue
-            if inter.geom_type == "LineString":
-                lines.append(_distort_line(inter, noise, amplitude=amplitude, frequency=frequency))
-            elif inter.geom_type == "MultiLineString":
-                for geom in inter.geoms:
-                    lines.append(_distort_line(geom, noise, amplitude=amplitude, frequency=frequency))
+            for geom in shared_edges(cells[i], cells[j]):
+                lines.append(_distort_line(geom, noise, amplitude=amplitude, frequency=frequency))
     return lines
-
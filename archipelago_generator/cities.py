@@ -5,6 +5,8 @@ from __future__ import annotations
 from typing import List, Tuple
 import numpy as np
 
+from .distance import ADJACENT, distance_field
+
 SEA_LEVEL = 0.26
 
 
@@ -16,22 +18,20 @@ def place_cities(
     min_dist: int = 10,
     sea_level: float = SEA_LEVEL,
     rng: np.random.Generator | None = None,
+    sea_distance: np.ndarray | None = None,
 ) -> List[Tuple[int, int]]:
-    """Place cities near rivers or coasts with spacing."""
-
-    height, width = elevation.shape
-    candidates: list[tuple[int, int]] = []
-    for y in range(height):
-        for x in range(width):
-            if sea_level < elevation[y, x] < 0.8:
-                if river_map[y, x] > 0 or any(
-                    0 <= y + dy < height
-                    and 0 <= x + dx < width
-                    and elevation[y + dy, x + dx] < sea_level
-                    for dy in [-1, 0, 1]
-                    for dx in [-1, 0, 1]
-                ):
-                    candidates.append((y, x))
+    """Place cities near rivers or coasts with spacing.
+
+    ``sea_distance`` is the tile distance to the sea from
+    :func:`~archipelago_generator.distance.distance_field`, computed here
+    when not given.
+    """
+
+    if sea_distance is None:
+        sea_distance, _ = distance_field(elevation < sea_level)
+    ok = (elevation > sea_level) & (elevation < 0.8) & ((river_map > 0) | (sea_distance <= ADJACENT))
+    ys, xs = np.nonzero(ok)
+    candidates = list(zip(ys.tolist(), xs.tolist()))
 
     if rng is None:
         rng = np.random.default_rng(0)
@@ -3,7 +3,16 @@
 from __future__ import annotations
 
 import numpy as np
-from perlin_noise import PerlinNoise
+
+from .instrument import count
+from .utils import perlin_batch
+
+
+def _centroids(cells) -> np.ndarray:
+    import shapely
+
+    centroids = shapely.centroid(np.asarray(cells, dtype=object))
+    return np.column_stack([shapely.get_x(centroids), shapely.get_y(centroids)])
 
 
 def compute_temperature(
@@ -13,27 +22,37 @@ def compute_temperature(
 ) -> np.ndarray:
     """Generate latitudinal temperature gradient with subtle noise."""
 
+    from perlin_noise import PerlinNoise
+
     if rng is None:
         rng = np.random.default_rng(0)
 
     noise = PerlinNoise(seed=int(rng.integers(0, 10_000)))
-    temp = np.zeros(len(cells))
-    for i, poly in enumerate(cells):
-        y = poly.centroid.y / height
-        grad = 1 - y
-        n = noise([0, y * 3]) * 0.1
-        temp[i] = np.clip(grad + n, 0.0, 1.0)
-    return temp
+    count("noise_samples", len(cells))
+    y = _centroids(cells)[:, 1] / height
+    n = perlin_batch(noise, np.column_stack([np.zeros_like(y), y * 3])) * 0.1
+    return np.clip(1 - y + n, 0.0, 1.0)
 
 
-def compute_rainfall(cells, rng: np.random.Generator) -> np.ndarray:
-    """Generate continuous rainfall using a shared noise field."""
+def compute_rainfall(cells, rng: np.random.Generator, *, frequency: float = 0.01) -> np.ndarray:
+    """Generate continuous rainfall using a shared noise field sampled at ``frequency`` per map unit."""
+    from perlin_noise import PerlinNoise
 
     noise = PerlinNoise(seed=int(rng.integers(0, 10000)))
-    rain = np.zeros(len(cells))
-    for i, poly in enumerate(cells):
-        c = poly.centroid
-        n = noise([c.x * 0.01, c.y * 0.01])
-        rain[i] = (n + 1) / 2
-    return rain
+    count("noise_samples", len(cells))
+    return (perlin_batch(noise, _centroids(cells) * frequency) + 1) / 2
+
+
+def compute_winds(centroids: np.ndarray, height: float, *, latitude_span: float = 60.0) -> np.ndarray:
+    """Prevailing surface wind ``(u, v)`` per cell from latitude.
+
+    The map is assumed to span ``latitude_span`` degrees north (top) to south
+    (bottom). A three-cell circulation gives easterly trade winds drifting
+    towards the equator at low latitudes and poleward westerlies above 30
+    degrees. ``v`` follows the map's y axis, which points south.
+    """
 
+    lat = np.radians(latitude_span * (1 - 2 * np.asarray(centroids)[:, 1] / height))
+    u = -np.cos(3 * lat)
+    v = 0.3 * np.sin(6 * lat)
+    return np.column_stack([u, v])
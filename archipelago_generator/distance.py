@@ -0,0 +1,38 @@
+"""Distance-transform layers: how far every tile is from sea, rivers and roads.
+
+:func:`distance_field` runs an exact Euclidean distance transform (scipy's
+linear-time ``distance_transform_edt``) over a feature mask. The generator
+stores the distances to sea, river and road tiles on the
+:class:`~archipelago_generator.generator.Archipelago` as ``float32`` grids.
+With ``nearest_features=True`` it also stores the flat index of the nearest
+feature tile, so "how far from water" and "which coast" are array lookups.
+"""
+
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Tiles within this distance of a feature touch it, diagonals included.
+ADJACENT = 1.5
+
+
+def distance_field(features: np.ndarray, *, nearest: bool = False) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Distance in tiles from every tile to the nearest ``True`` tile of ``features``.
+
+    Returns a ``float32`` grid, 0 on the features and ``inf`` everywhere if
+    there are none. With ``nearest`` an ``int32`` grid of the flat index
+    ``y * width + x`` of the closest feature tile (``-1`` without features)
+    comes second; otherwise ``None``.
+    """
+    from scipy import ndimage
+
+    features = np.asarray(features, dtype=bool)
+    if not features.any():
+        index = np.full(features.shape, -1, dtype=np.int32) if nearest else None
+        return np.full(features.shape, np.inf, dtype=np.float32), index
+    if not nearest:
+        return ndimage.distance_transform_edt(~features).astype(np.float32), None
+    dist, (iy, ix) = ndimage.distance_transform_edt(~features, return_indices=True)
+    return dist.astype(np.float32), iy * np.int32(features.shape[1]) + ix
@@ -0,0 +1,544 @@
+"""Map edits with dirty-region recomputation.
+
+Rerunning the pipeline after every brush stroke is far too slow for
+interactive editing. :class:`MapEditor` keeps a generated
+:class:`~archipelago_generator.generator.Archipelago` together with the
+intermediate values needed to update it in place: the tile elevation grid,
+its downslope directions and water flux, the tiles owned by each river
+trace and the line rasters. An edit recomputes only what it reaches:
+
+* flow directions inside the edited rectangle plus a one-tile halo;
+* water flux along the old and new downstream paths of the tiles whose
+  direction changed;
+* river tiles and widths where the flux changed, the traces through them,
+  and the river raster around those traces;
+* elevation, land and biome of the cells under the rectangle, and the
+  regions and borders next to cells whose biome changed;
+* road segments whose A* path crosses the rectangle, rerouted with A* in
+  a window around the crossing and redrawn along the new path.
+
+Flux, river tiles and widths, regions and borders come out as a full run of
+the same stages on the edited map would make them, up to the numbering of
+regions and the order of lines. Rivers may be split into traces at other
+junctions, which only shows in the river raster when ``jitter`` is on.
+A rerouted road is locally rather than globally shortest. Moisture is not
+re-solved and cities stay where they are. A distance transform is global,
+so elevation edits drop the distance layers until
+:meth:`MapEditor.update_distances` recomputes them.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .biomes import BIOMES, classify_biome_codes
+from .distance import distance_field
+from .pipeline import StageCache, run_stages, stage_rng
+from .rasterizer import Rasterizer
+from .rivers import accumulate_flux, grid_downslope
+from .roads import _astar, road_cost, road_line
+
+if TYPE_CHECKING:
+    from .generator import Archipelago, ArchipelagoParams
+
+Region = Tuple[int, int, int, int]  # (x, y, width, height) in tiles, as in export_png
+Box = Tuple[int, int, int, int]  # (y0, y1, x0, x1), half open
+
+# Tiles of path, and of map around the edit, a road reroute may use.
+ROAD_MARGIN = 16
+DISTANCE_LAYERS = ("sea_distance", "river_distance", "road_distance", "nearest_sea", "nearest_river", "nearest_road")
+
+
+def _union(a: Optional[Box], b: Optional[Box]) -> Optional[Box]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3])
+
+
+def _overlaps(a: Box, b: Box) -> bool:
+    return a[0] < b[1] and b[0] < a[1] and a[2] < b[3] and b[2] < a[3]
+
+
+class _LineLayer:
+    """Polylines keyed by id and their raster, repainted one window at a time.
+
+    Tiles where ``clip`` is true are never painted.
+    """
+
+    def __init__(self, grid: np.ndarray, rasterizer: Rasterizer, width_tiles: int,
+                 jitter: Optional[Dict[str, float]], clip: Optional[Callable[[Box], np.ndarray]] = None) -> None:
+        self.grid = grid
+        self.clip = clip
+        self.rasterizer = rasterizer
+        self.radius = max(0.5, width_tiles / 2)
+        self.jitter = jitter
+        self.lines: Dict[Any, List[Tuple[float, float]]] = {}
+        self._paths: Dict[Any, List[Tuple[float, float]]] = {}
+        self._boxes: Dict[Any, Box] = {}
+
+    def add(self, key: Any, line: List[Tuple[float, float]]) -> Box:
+        path = line
+        if self.jitter:
+            path = self.rasterizer.jitter_polyline(line, self.jitter.get("freq", 1.0), self.jitter.get("strength", 1.0))
+        xy = np.asarray(path, dtype=float).reshape(-1, 2)
+        r = self.radius
+        height, width = self.grid.shape
+        box = (max(int(np.floor(xy[:, 1].min() - r)), 0), min(int(np.ceil(xy[:, 1].max() + r)) + 1, height),
+               max(int(np.floor(xy[:, 0].min() - r)), 0), min(int(np.ceil(xy[:, 0].max() + r)) + 1, width))
+        self.lines[key] = line
+        self._paths[key] = path
+        self._boxes[key] = box
+        return box
+
+    def remove(self, key: Any) -> Box:
+        del self.lines[key], self._paths[key]
+        return self._boxes.pop(key)
+
+    def repaint(self, box: Box) -> None:
+        y0, y1, x0, x1 = box
+        window = self.grid[y0:y1, x0:x1]
+        painted = np.zeros(window.shape, dtype=bool)
+        for key, other in self._boxes.items():
+            if _overlaps(box, other):
+                self.rasterizer.paint_polyline(painted, self._paths[key], self.radius, 1.0, origin=(y0, x0))
+        if self.clip is not None:
+            painted &= ~self.clip(box)
+        window[...] = painted
+
+
+class MapEditor:
+    """Edit a generated archipelago and update it incrementally.
+
+    ``arch`` must have been generated from ``params`` with grid hydrology;
+    ``elev_grid``, ``neighbors``, ``raster_seed`` and ``road_paths`` are the
+    pipeline values of the same names. :meth:`generate` runs the pipeline and collects them.
+    The editor works on copies held in :attr:`arch`, which is updated in
+    place by every edit.
+    """
+
+    def __init__(self, arch: Archipelago, params: ArchipelagoParams, elev_grid: np.ndarray,
+                 neighbors: List[Set[int]], raster_seed: int, road_paths: List[List[Tuple[int, int]]]) -> None:
+        from perlin_noise import PerlinNoise
+
+        from .generator import RIVER_JITTER, RIVER_MIN_CELLS, ROAD_JITTER
+
+        if params.hydrology != "grid":
+            raise ValueError("MapEditor routes water over tiles and needs hydrology='grid'")
+        if params.seed is None:
+            raise ValueError("MapEditor needs the seed the map was generated with")
+        self.params = params
+        self.arch = dataclasses.replace(
+            arch,
+            elevation=np.array(arch.elevation),
+            land=np.array(arch.land),
+            biome=np.array(arch.biome),
+            regions=np.array(arch.regions),
+            river_map=np.array(arch.river_map),
+            river_width=np.array(arch.river_width),
+            road_map=np.array(arch.road_map),
+            cities=list(arch.cities),
+        )
+        self.elev_grid = np.array(elev_grid)
+        self.neighbors = neighbors
+        height, width = self.elev_grid.shape
+        labels = np.asarray(arch.labels)
+        n = len(arch.cells)
+        self._cell_tiles = np.bincount(labels[labels >= 0], minlength=n)
+        self._cell_bounds: Optional[np.ndarray] = None
+
+        self.downslope = grid_downslope(self.elev_grid).ravel()
+        self.flux = accumulate_flux(self.downslope, np.ones(height * width))
+        self.min_flux = RIVER_MIN_CELLS * height * width / n
+        self._mark = np.zeros(height * width, dtype=bool)  # scratch for path walks
+
+        rasterizer = Rasterizer(width, height, seed=raster_seed)
+        self._rivers = _LineLayer(self.arch.river_map, rasterizer, params.river_width_tiles,
+                                  RIVER_JITTER if params.jitter else None)
+        self._roads = _LineLayer(self.arch.road_map, rasterizer, params.road_width_tiles,
+                                 ROAD_JITTER if params.jitter else None, self._sea)
+
+        # River traces: the tiles each one visited and the tile it ended on.
+        # Traces of a single tile own it but draw no line, as in trace_rivers.
+        self._owner = np.full(height * width, -1, dtype=np.int32)
+        self._traces: Dict[int, Tuple[np.ndarray, int]] = {}
+        self._next_trace = 0
+        for line in arch.river_lines:
+            tiles = np.array([y * width + x for x, y in line], dtype=np.int64)
+            self._claim(tiles[self._owner[tiles] < 0], int(tiles[-1]), line)
+
+        # Road segment k joins cities k and k + 1; a segment A* could not
+        # route has no path and no line.
+        self._road_cost = road_cost(self.elev_grid, sea_level=params.sea_level)
+        self._road_noise = PerlinNoise(seed=int(stage_rng(params.seed, "roads").integers(0, 1_000_000)))
+        self._road_paths: Dict[int, np.ndarray] = {}
+        routes = iter(zip(road_paths, arch.road_lines))
+        route = next(routes, None)
+        for k, city in enumerate(self.arch.cities[:-1]):
+            if route is not None and tuple(route[0][0]) == tuple(city):
+                self._road_paths[k] = np.array(route[0], dtype=np.int64)
+                self._roads.add(k, route[1])
+                route = next(routes, None)
+
+        # Border pieces by cell pair, in the order compute_borders makes them.
+        self._border_noise = PerlinNoise(seed=int(stage_rng(params.seed, "borders").integers(0, 1_000_000)))
+        self._borders: Dict[Tuple[int, int], list] = {}
+        self._init_borders(arch.borders)
+        self._next_region = int(self.arch.regions.max()) + 1 if n else 0
+
+    @classmethod
+    def generate(cls, cache: Optional[StageCache] = None, **kwargs: Any) -> MapEditor:
+        """Generate an archipelago from :class:`ArchipelagoParams` keyword arguments and edit it."""
+        from .generator import STAGES, Archipelago, ArchipelagoParams
+
+        params = ArchipelagoParams(**kwargs)
+        if params.seed is None:
+            params.seed = int(np.random.SeedSequence().generate_state(1)[0])
+        produced = {out for stage in STAGES for out in stage.outputs}
+        names = [f.name for f in dataclasses.fields(Archipelago) if f.name in produced]
+        extra = ("elev_grid", "neighbors", "raster_seed", "road_paths")
+        values = run_stages(STAGES, params, names + list(extra), cache)
+        extra = {name: values.pop(name) for name in extra}
+        arch = Archipelago(width=params.width, height=params.height, **values)
+        return cls(arch, params, **extra)
+
+    # -- edits -------------------------------------------------------------
+
+    def edit_elevation(self, region: Region, values: Any) -> Region:
+        """Set the tile elevation of ``region`` to ``values`` and update the map.
+
+        ``region`` is an ``(x, y, width, height)`` rectangle of tiles and
+        ``values`` broadcasts to its shape. Returns the ``(x, y, width,
+        height)`` rectangle of tiles whose rendering may have changed, ready
+        to pass as ``region`` to :func:`~archipelago_generator.rasterizer.export_png`.
+        """
+        y0, y1, x0, x1 = box = self._box(region)
+        height, width = self.elev_grid.shape
+        sea_level = self.params.sea_level
+        old = self.elev_grid[y0:y1, x0:x1].copy()
+        self.elev_grid[y0:y1, x0:x1] = values
+        new = self.elev_grid[y0:y1, x0:x1]
+        self._road_cost[y0:y1, x0:x1] = road_cost(new, sea_level=sea_level)
+        edited = (np.arange(y0, y1)[:, None] * width + np.arange(x0, x1)).ravel()
+
+        affected = self._reroute(box)
+        tiles = np.union1d(affected, edited)
+        dirty = _union(box, self._update_rivers(tiles))
+        dirty = _union(dirty, self._update_cells(np.asarray(self.arch.labels)[y0:y1, x0:x1], (new - old).ravel()))
+        dirty = _union(dirty, self._update_roads(box))
+        self._lines_changed()
+        for name in DISTANCE_LAYERS:
+            setattr(self.arch, name, None)
+        return self._region(dirty)
+
+    def edit_biome(self, region: Region, biome: str) -> Region:
+        """Paint ``biome`` on every cell with a tile in ``region``.
+
+        Hydrology is unaffected. Regions and borders next to repainted cells
+        are updated. Returns the rectangle of changed tiles as in
+        :meth:`edit_elevation`.
+        """
+        if biome not in BIOMES:
+            raise ValueError(f"unknown biome {biome!r}")
+        y0, y1, x0, x1 = self._box(region)
+        cells = np.unique(np.asarray(self.arch.labels)[y0:y1, x0:x1])
+        cells = cells[cells >= 0]
+        changed = cells[self.arch.biome[cells] != biome]
+        self.arch.biome[changed] = biome
+        dirty = self._biomes_changed(changed)
+        self._lines_changed()
+        return self._region(dirty)
+
+    def update_distances(self) -> None:
+        """Recompute the sea, river and road distance layers of the edited map."""
+        sea, nearest_sea = distance_field(self.elev_grid < self.params.sea_level,
+                                          nearest=self.params.nearest_features)
+        river, nearest_river = distance_field(self.arch.river_map > 0, nearest=self.params.nearest_features)
+        road, nearest_road = distance_field(self.arch.road_map > 0, nearest=self.params.nearest_features)
+        values = (sea, river, road, nearest_sea, nearest_river, nearest_road)
+        for name, value in zip(DISTANCE_LAYERS, values):
+            setattr(self.arch, name, value)
+
+    def _lines_changed(self) -> None:
+        # Cells and cities never move, so only the line indexes of a spatial
+        # query already built on the map go stale.
+        query = self.arch.__dict__.get("query")
+        if query is not None:
+            query.invalidate()
+
+    # -- hydrology ---------------------------------------------------------
+
+    def _downstream(self, starts: np.ndarray) -> np.ndarray:
+        # Every tile on the drainage paths from ``starts``, starts included.
+        mark, downslope = self._mark, self.downslope
+        front = np.unique(starts)
+        mark[front] = True
+        seen = [front]
+        while front.size:
+            front = downslope[front]
+            front = np.unique(front[front >= 0])
+            front = front[~mark[front]]
+            mark[front] = True
+            seen.append(front)
+        tiles = np.concatenate(seen)
+        mark[tiles] = False
+        return tiles
+
+    def _reroute(self, box: Box) -> np.ndarray:
+        # Flow directions of the rectangle plus halo, computed on a window one
+        # tile wider still so every halo tile sees all its neighbours.
+        y0, y1, x0, x1 = box
+        height, width = self.elev_grid.shape
+        hy0, hy1, hx0, hx1 = max(y0 - 1, 0), min(y1 + 1, height), max(x0 - 1, 0), min(x1 + 1, width)
+        wy0, wy1, wx0, wx1 = max(hy0 - 1, 0), min(hy1 + 1, height), max(hx0 - 1, 0), min(hx1 + 1, width)
+        local = grid_downslope(self.elev_grid[wy0:wy1, wx0:wx1])[hy0 - wy0:hy1 - wy0, hx0 - wx0:hx1 - wx0]
+        ly, lx = np.divmod(local, wx1 - wx0)
+        routed = np.where(local >= 0, (ly + wy0) * width + lx + wx0, -1).ravel()
+        tiles = (np.arange(hy0, hy1)[:, None] * width + np.arange(hx0, hx1)).ravel()
+        moved = routed != self.downslope[tiles]
+        changed = tiles[moved]
+        if not changed.size:
+            return changed
+
+        # Flux changes only downstream of a redirected tile, on its old path
+        # or its new one. Those tiles are closed downstream under the new
+        # directions, so their flux is their own water, plus what drains in
+        # from unaffected tiles, accumulated among themselves.
+        before = self._downstream(changed)
+        self.downslope[changed] = routed[moved]
+        affected = np.union1d(before, self._downstream(changed))
+        downslope, flux, mark = self.downslope, self.flux, self._mark
+        mark[affected] = True
+        water = np.ones(len(affected))
+        col = affected % width
+        for step, ok in ((-width, affected >= width), (width, affected < (height - 1) * width),
+                         (-1, col > 0), (1, col < width - 1)):
+            source = np.where(ok, affected + step, 0)
+            feeds = ok & (downslope[source] == affected) & ~mark[source]
+            water[feeds] += flux[source[feeds]]
+        mark[affected] = False
+        target = downslope[affected]
+        local = np.full(len(affected), -1, dtype=np.int64)
+        drains = target >= 0
+        local[drains] = np.searchsorted(affected, target[drains])
+        flux[affected] = accumulate_flux(local, water)
+        return affected
+
+    def _claim(self, tiles: np.ndarray, last: int, line: List[Tuple[float, float]]) -> Optional[Box]:
+        key = self._next_trace
+        self._next_trace += 1
+        self._owner[tiles] = key
+        self._traces[key] = (tiles, last)
+        if len(line) > 1:
+            return self._rivers.add(key, line)
+        return None
+
+    def _trace(self, start: int) -> Optional[Box]:
+        # The loop of trace_rivers, with the owner grid as its visited set.
+        owner, downslope = self._owner, self.downslope
+        elev = self.elev_grid.ravel()
+        sea_level = self.params.sea_level
+        width = self.elev_grid.shape[1]
+        tiles: List[int] = []
+        line: List[Tuple[int, int]] = []
+        cur = start
+        while elev[cur] >= sea_level:
+            y, x = divmod(cur, width)
+            line.append((x, y))
+            if owner[cur] >= 0:
+                break
+            tiles.append(cur)
+            owner[cur] = self._next_trace
+            nxt = int(downslope[cur])
+            if nxt < 0 or elev[nxt] < sea_level:
+                break
+            cur = nxt
+        return self._claim(np.array(tiles, dtype=np.int64), cur, line)
+
+    def _update_rivers(self, tiles: np.ndarray) -> Optional[Box]:
+        # River status and width of ``tiles``, then retrace every trace that
+        # touched one of them, starting from the smallest flux as
+        # trace_rivers does.
+        flux = self.flux[tiles]
+        river = (flux >= self.min_flux) & (self.elev_grid.ravel()[tiles] >= self.params.sea_level)
+        widths = np.where(river, np.maximum(1, np.log2(np.maximum(flux, 1))), 0).astype(self.arch.river_width.dtype)
+        grid = self.arch.river_width.reshape(-1)
+        moved = tiles[grid[tiles] != widths]
+        grid[tiles] = widths
+        dirty = None
+        if moved.size:
+            ys, xs = np.divmod(moved, self.elev_grid.shape[1])
+            dirty = (int(ys.min()), int(ys.max()) + 1, int(xs.min()), int(xs.max()) + 1)
+
+        mark = self._mark
+        mark[tiles] = True
+        dropped = set(np.unique(self._owner[tiles]).tolist()) - {-1}
+        # A trace is also stale if it ended on, or just above, a changed tile.
+        downslope = self.downslope
+        dropped.update(key for key, (_, last) in self._traces.items()
+                       if mark[last] or (downslope[last] >= 0 and mark[downslope[last]]))
+        mark[tiles] = False
+        if not dropped:
+            return dirty
+        lines = None
+        candidates = [tiles]
+        for key in dropped:
+            owned, _ = self._traces.pop(key)
+            self._owner[owned] = -1
+            candidates.append(owned)
+            if key in self._rivers.lines:
+                lines = _union(lines, self._rivers.remove(key))
+        candidates = np.unique(np.concatenate(candidates))
+        flux = self.flux[candidates]
+        river = (flux >= self.min_flux) & (self.elev_grid.ravel()[candidates] >= self.params.sea_level)
+        candidates = candidates[river]
+        for start in candidates[np.argsort(self.flux[candidates], kind="stable")].tolist():
+            if self._owner[start] < 0:
+                lines = _union(lines, self._trace(start))
+        if lines is not None:
+            self._rivers.repaint(lines)
+        self.arch.river_lines = list(self._rivers.lines.values())
+        return _union(dirty, lines)
+
+    # -- cells -------------------------------------------------------------
+
+    def _update_cells(self, labels: np.ndarray, delta: np.ndarray) -> Optional[Box]:
+        # Each cell moves by the mean change of its tiles.
+        labels = labels.ravel()
+        inside = labels >= 0
+        cells, index = np.unique(labels[inside], return_inverse=True)
+        if not cells.size:
+            return None
+        shift = np.bincount(index, weights=delta[inside], minlength=len(cells)) / self._cell_tiles[cells]
+        arch = self.arch
+        arch.elevation[cells] += shift.astype(arch.elevation.dtype)
+        arch.land[cells] = arch.elevation[cells] > self.params.sea_level
+        codes = classify_biome_codes(arch.land[cells], arch.temperature[cells], arch.moisture[cells])
+        biome = np.array(BIOMES, dtype=object)[codes]
+        changed = cells[arch.biome[cells] != biome]
+        arch.biome[cells] = biome
+        return self._biomes_changed(changed)
+
+    def _biomes_changed(self, cells: np.ndarray) -> Optional[Box]:
+        if not cells.size:
+            return None
+        self._update_regions(cells)
+        self._update_borders(cells)
+        import shapely
+
+        if self._cell_bounds is None:
+            self._cell_bounds = shapely.bounds(np.asarray(self.arch.cells, dtype=object))
+        minx, miny, maxx, maxy = self._cell_bounds[cells].T
+        height, width = self.elev_grid.shape
+        return (max(int(np.floor(miny.min())), 0), min(int(np.ceil(maxy.max())), height),
+                max(int(np.floor(minx.min())), 0), min(int(np.ceil(maxx.max())), width))
+
+    def _update_regions(self, cells: np.ndarray) -> None:
+        # Regions touching a changed cell are flooded again among their own
+        # cells; no other cell can join them. Their ids are reused first.
+        regions, biome, neighbors = self.arch.regions, self.arch.biome, self.neighbors
+        ids = set(regions[cells].tolist())
+        for i in cells.tolist():
+            ids.update(int(regions[j]) for j in neighbors[i])
+        members = np.flatnonzero(np.isin(regions, list(ids)))
+        regions[members] = -1
+        free = sorted(ids, reverse=True)
+        for i in members.tolist():
+            if regions[i] != -1:
+                continue
+            if free:
+                rid = free.pop()
+            else:
+                rid = self._next_region
+                self._next_region += 1
+            regions[i] = rid
+            queue = [i]
+            while queue:
+                u = queue.pop()
+                for v in neighbors[u]:
+                    if regions[v] == -1 and biome[v] == biome[u]:
+                        regions[v] = rid
+                        queue.append(v)
+
+    def _init_borders(self, borders: list) -> None:
+        from .borders import shared_edges
+
+        cells, biome = self.arch.cells, self.arch.biome
+        pieces = iter(borders)
+        for i, neigh in enumerate(self.neighbors):
+            for j in neigh:
+                if j > i and biome[i] != biome[j]:
+                    self._borders[(i, j)] = [next(pieces) for _ in shared_edges(cells[i], cells[j])]
+
+    def _update_borders(self, cells: Iterable[int]) -> None:
+        from .borders import _distort_line, shared_edges
+
+        arch = self.arch
+        pairs = {(min(i, j), max(i, j)) for i in np.asarray(cells).tolist() for j in self.neighbors[i]}
+        for i, j in sorted(pairs):
+            self._borders.pop((i, j), None)
+            if arch.biome[i] != arch.biome[j]:
+                self._borders[(i, j)] = [
+                    _distort_line(geom, self._border_noise, amplitude=2.0, frequency=0.1)
+                    for geom in shared_edges(arch.cells[i], arch.cells[j])
+                ]
+        arch.borders = [line for pieces in self._borders.values() for line in pieces]
+
+    # -- roads -------------------------------------------------------------
+
+    def _update_roads(self, box: Box) -> Optional[Box]:
+        y0, y1, x0, x1 = box
+        dirty = None
+        for k, path in self._road_paths.items():
+            ys, xs = path[:, 0], path[:, 1]
+            inside = np.flatnonzero((ys >= y0) & (ys < y1) & (xs >= x0) & (xs < x1))
+            if not inside.size:
+                continue
+            path = self._road_paths[k] = self._detour(path, int(inside[0]), int(inside[-1]), box)
+            line = road_line([(int(y), int(x)) for y, x in path], self._road_noise)
+            if line != self._roads.lines[k]:
+                dirty = _union(dirty, self._roads.remove(k))
+                dirty = _union(dirty, self._roads.add(k, line))
+        if dirty is not None:
+            self.arch.road_lines = [self._roads.lines[k] for k in sorted(self._roads.lines)]
+        # The edit may also have flooded road tiles of roads that kept their path.
+        self._roads.repaint(_union(dirty, box))
+        return dirty
+
+    def _sea(self, box: Box) -> np.ndarray:
+        y0, y1, x0, x1 = box
+        return self.elev_grid[y0:y1, x0:x1] < self.params.sea_level
+
+    def _detour(self, path: np.ndarray, first: int, last: int, box: Box) -> np.ndarray:
+        # Replace the stretch of ``path`` from ROAD_MARGIN tiles before the
+        # edit to as many after it, searching a window around both.
+        y0, y1, x0, x1 = box
+        height, width = self.elev_grid.shape
+        i0, i1 = max(first - ROAD_MARGIN, 0), min(last + ROAD_MARGIN, len(path) - 1)
+        stretch = path[i0:i1 + 1]
+        wy0 = max(min(int(stretch[:, 0].min()), y0) - ROAD_MARGIN, 0)
+        wy1 = min(max(int(stretch[:, 0].max()) + 1, y1) + ROAD_MARGIN, height)
+        wx0 = max(min(int(stretch[:, 1].min()), x0) - ROAD_MARGIN, 0)
+        wx1 = min(max(int(stretch[:, 1].max()) + 1, x1) + ROAD_MARGIN, width)
+        (sy, sx), (gy, gx) = path[i0], path[i1]
+        local = _astar((int(sy) - wy0, int(sx) - wx0), (int(gy) - wy0, int(gx) - wx0),
+                       self._road_cost[wy0:wy1, wx0:wx1])
+        detour = np.array(local, dtype=np.int64).reshape(-1, 2) + (wy0, wx0)
+        return np.concatenate([path[:i0], detour, path[i1 + 1:]])
+
+    # -- helpers -----------------------------------------------------------
+
+    def _box(self, region: Region) -> Box:
+        x, y, w, h = region
+        if w <= 0 or h <= 0 or x < 0 or y < 0 or x + w > self.arch.width or y + h > self.arch.height:
+            raise ValueError(f"region {region} is outside the {self.arch.width}x{self.arch.height} map")
+        return y, y + h, x, x + w
+
+    @staticmethod
+    def _region(box: Box) -> Region:
+        y0, y1, x0, x1 = box
+        return x0, y0, x1 - x0, y1 - y0
@@ -2,48 +2,56 @@
 
 from __future__ import annotations
 
-from typing import List
+from typing import TYPE_CHECKING, List
 
 import numpy as np
-from perlin_noise import PerlinNoise
-from shapely.geometry import Polygon
 
+from .instrument import count
+from .utils import perlin_batch
 
-def _fractal_noise(noise: PerlinNoise, x: float, y: float, *, octaves: int = 4,
-                   lacunarity: float = 2.0, persistence: float = 0.5) -> float:
-    """Return fractal noise value in range [-1, 1]."""
-    value = 0.0
+if TYPE_CHECKING:
+    from perlin_noise import PerlinNoise
+    from shapely.geometry import Polygon
+
+
+def _fractal_noise(noise: PerlinNoise, coords: np.ndarray, *, octaves: int = 4,
+                   lacunarity: float = 2.0, persistence: float = 0.5) -> np.ndarray:
+    """Return fractal noise values in range [-1, 1] at ``(n, 2)`` ``coords``."""
+    value = np.zeros(len(coords))
     amplitude = 1.0
     frequency = 1.0
     for _ in range(octaves):
-        value += amplitude * noise([x * frequency, y * frequency])
+        value += amplitude * perlin_batch(noise, coords * frequency)
         amplitude *= persistence
         frequency *= lacunarity
     return value
 
 
 def assign_elevation(cells: List[Polygon], width: int, height: int,
-                     rng: np.random.Generator) -> np.ndarray:
-    """Assign elevation using fractal noise and a gaussian mask."""
+                     rng: np.random.Generator, *, frequency: float = 0.02, octaves: int = 4) -> np.ndarray:
+    """Assign elevation using fractal noise and a gaussian mask.
+
+    ``frequency`` is the noise frequency in cycles per map unit and
+    ``octaves`` the number of fractal octaves summed.
+    """
+    import shapely
+    from perlin_noise import PerlinNoise
 
     noise = PerlinNoise(seed=int(rng.integers(0, 10000)))
     center = np.array([width / 2.0, height / 2.0])
     sigma = min(width, height) / 3.0
 
-    elev = np.zeros(len(cells))
-    for i, poly in enumerate(cells):
-        c = np.array(poly.centroid.coords[0])
-        n = _fractal_noise(noise, c[0] * 0.02, c[1] * 0.02)
-        base = (n + 1.0) / 2.0
-        d = np.linalg.norm(c - center)
-        g = np.exp(-(d ** 2) / (2 * sigma ** 2))
-        elev[i] = base * g
+    count("noise_samples", octaves * len(cells))
+    polys = np.asarray(cells, dtype=object)
+    centroids = shapely.centroid(polys)
+    c = np.column_stack([shapely.get_x(centroids), shapely.get_y(centroids)])
+    base = (_fractal_noise(noise, c * frequency, octaves=octaves) + 1.0) / 2.0
+    d = np.linalg.norm(c - center, axis=1)
+    elev = base * np.exp(-(d ** 2) / (2 * sigma ** 2))
 
     # Set boundary cells to sea level
-    for i, poly in enumerate(cells):
-        minx, miny, maxx, maxy = poly.bounds
-        if minx <= 0 or miny <= 0 or maxx >= width or maxy >= height:
-            elev[i] = 0.0
+    bounds = shapely.bounds(polys)
+    elev[(bounds[:, :2] <= 0).any(axis=1) | (bounds[:, 2] >= width) | (bounds[:, 3] >= height)] = 0.0
 
     # Redistribute elevations so that 50% of cells are below 0.5
     order = np.argsort(elev)
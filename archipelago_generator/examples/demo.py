@@ -9,6 +9,7 @@ import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from archipelago_generator import generate_archipelago, render_archipelago
+from archipelago_generator.rasterizer import export_png
 
 
 def main() -> None:
@@ -20,6 +21,10 @@ def main() -> None:
     parser.add_argument("--river-width", type=int, default=1)
     parser.add_argument("--road-width", type=int, default=1)
     parser.add_argument("--jitter", action="store_true", help="enable jitter")
+    parser.add_argument("--erosion", type=int, default=0, help="rounds of hydraulic + thermal erosion")
+    parser.add_argument("--hydrology", choices=("grid", "mesh"), default="grid")
+    parser.add_argument("--png", help="write a PNG image to this path instead of rendering")
+    parser.add_argument("--scale", type=int, default=1, help="pixels per tile for --png")
     args = parser.parse_args()
     arch = generate_archipelago(
         width=args.width,
@@ -28,9 +33,14 @@ def main() -> None:
         river_width_tiles=args.river_width,
         road_width_tiles=args.road_width,
         jitter=args.jitter,
+        erosion_iterations=args.erosion,
+        hydrology=args.hydrology,
     )
     print(f"Generated archipelago with {len(arch.cells)} cells")
-    render_archipelago(arch, show_legend=args.legend)
+    if args.png:
+        export_png(arch, args.png, scale=args.scale)
+    else:
+        render_archipelago(arch, show_legend=args.legend)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,190 @@
+"""Streaming JSON export of the polygon graph and its features.
+
+:func:`iter_records` builds one small dict per cell, river, road, border
+and city, lazily and in chunks, from the array representation of an
+:class:`~archipelago_generator.generator.Archipelago`. :func:`export_json`
+writes the records through a buffered (optionally gzip) stream, either as
+NDJSON (one record per line, each with a ``type``) or as a single JSON
+document written piece by piece. Apart from the neighbour lists of one
+chunk of cells, memory does not grow with the map size.
+
+Record types, in order::
+
+    {"type": "map", "width", "height", "counts": {"cells", "rivers", ...}}
+    {"type": "cell", "id", "vertices", "centroid", "neighbors", "land",
+     "biome", "elevation", "temperature", "rainfall", "moisture", "region"}
+    {"type": "river" | "road" | "border", "id", "points"}
+    {"type": "city", "id", "y", "x"}
+"""
+
+from __future__ import annotations
+
+import contextlib
+import gzip
+import io
+import json
+import os
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, Iterator, Optional, Union
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .generator import Archipelago
+    from .voronoi import CellGraph
+
+FORMATS = ("ndjson", "json")
+# Plural keys of the JSON document, by record type.
+SECTIONS = {"cell": "cells", "river": "rivers", "road": "roads", "border": "borders", "city": "cities"}
+
+
+def _neighbor_chunks(cells: np.ndarray, graph: Optional[CellGraph], chunk: int) -> Iterator[list]:
+    import shapely
+
+    if graph is not None:
+        indptr, neighbor, _ = graph.csr()
+        for start in range(0, len(cells), chunk):
+            stop = min(start + chunk, len(cells))
+            yield [np.sort(neighbor[indptr[i]:indptr[i + 1]]).tolist() for i in range(start, stop)]
+        return
+    # Without the graph, neighbours are cells sharing more than a corner.
+    tree = shapely.STRtree(cells)
+    for start in range(0, len(cells), chunk):
+        stop = min(start + chunk, len(cells))
+        left, right = tree.query(cells[start:stop], predicate="intersects")
+        left = left + start
+        other = left != right
+        left, right = left[other], right[other]
+        shared = shapely.length(shapely.intersection(cells[left], cells[right])) > 0
+        left, right = left[shared], right[shared]
+        order = np.lexsort((right, left))
+        left, right = left[order], right[order]
+        bounds = np.searchsorted(left, np.arange(start, stop + 1))
+        yield [right[bounds[i]:bounds[i + 1]].tolist() for i in range(stop - start)]
+
+
+def _line(points: Any) -> list:
+    if hasattr(points, "coords"):  # shapely geometry
+        import shapely
+
+        return shapely.get_coordinates(points).tolist()
+    return np.asarray(points, dtype=float).reshape(-1, 2).tolist()
+
+
+def iter_records(arch: Archipelago, *, graph: Optional[CellGraph] = None,
+                 chunk: int = 4096) -> Iterator[Dict[str, Any]]:
+    """Yield the export records of ``arch`` one at a time.
+
+    Cell geometry and neighbours are computed ``chunk`` cells at a time. Pass
+    the :class:`~archipelago_generator.voronoi.CellGraph` the map was built
+    from to reuse its adjacency instead of querying shapely.
+    """
+    import shapely
+
+    cells = np.asarray(arch.cells, dtype=object)
+    yield {
+        "type": "map",
+        "width": arch.width,
+        "height": arch.height,
+        "counts": {
+            "cells": len(cells),
+            "rivers": len(arch.river_lines),
+            "roads": len(arch.road_lines),
+            "borders": len(arch.borders),
+            "cities": len(arch.cities),
+        },
+    }
+    attrs = {name: getattr(arch, name) for name in ("land", "elevation", "temperature", "rainfall", "moisture")}
+    for start, neighbors in zip(range(0, len(cells), chunk), _neighbor_chunks(cells, graph, chunk)):
+        stop = start + len(neighbors)
+        part = cells[start:stop]
+        # Exterior rings only: Voronoi cells have no holes.
+        coords, index = shapely.get_coordinates(shapely.get_exterior_ring(part), return_index=True)
+        bounds = np.searchsorted(index, np.arange(len(part) + 1))
+        centroids = shapely.get_coordinates(shapely.centroid(part))
+        values = {name: np.asarray(a[start:stop]).tolist() for name, a in attrs.items()}
+        biome = [str(b) for b in arch.biome[start:stop]]
+        region = np.asarray(arch.regions[start:stop]).tolist()
+        empty = shapely.is_empty(part)
+        for i in range(len(part)):
+            yield {
+                "type": "cell",
+                "id": start + i,
+                "vertices": coords[bounds[i]:bounds[i + 1]].tolist(),
+                "centroid": None if empty[i] else centroids[i].tolist(),
+                "neighbors": neighbors[i],
+                "land": bool(values["land"][i]),
+                "biome": biome[i],
+                "elevation": values["elevation"][i],
+                "temperature": values["temperature"][i],
+                "rainfall": values["rainfall"][i],
+                "moisture": values["moisture"][i],
+                "region": region[i],
+            }
+    for kind, lines in (("river", arch.river_lines), ("road", arch.road_lines), ("border", arch.borders)):
+        for i, line in enumerate(lines):
+            yield {"type": kind, "id": i, "points": _line(line)}
+    for i, (y, x) in enumerate(arch.cities):
+        yield {"type": "city", "id": i, "y": int(y), "x": int(x)}
+
+
+def export_json(
+    arch: Archipelago,
+    fp: Union[str, os.PathLike, BinaryIO],
+    *,
+    fmt: str = "ndjson",
+    compress: Optional[bool] = None,
+    compress_level: int = 6,
+    graph: Optional[CellGraph] = None,
+    chunk: int = 4096,
+) -> int:
+    """Stream the records of :func:`iter_records` to ``fp`` and return how many were written.
+
+    ``fmt="ndjson"`` writes one record per line. ``fmt="json"`` writes one
+    document: the ``map`` record's fields, then a list per record type.
+    Output is gzip-compressed when ``compress`` is true, or by default when
+    ``fp`` is a path ending in ``.gz``. A file object passed as ``fp`` is
+    flushed but not closed.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"fmt must be one of {FORMATS}")
+    path = os.fspath(fp) if isinstance(fp, (str, os.PathLike)) else None
+    if compress is None:
+        compress = path is not None and path.endswith(".gz")
+    encode = json.JSONEncoder(separators=(",", ":"), allow_nan=False).encode
+    written = 0
+    with contextlib.ExitStack() as stack:
+        raw = stack.enter_context(open(path, "wb")) if path is not None else fp
+        if compress:
+            raw = stack.enter_context(gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=compress_level, mtime=0))
+        buffered = io.BufferedWriter(raw, buffer_size=1 << 20)
+        # Detaching flushes and keeps the buffer from closing ``fp`` when collected.
+        stack.callback(buffered.detach)
+        write = buffered.write
+        sections = iter(SECTIONS)
+        section = None
+        for record in iter_records(arch, graph=graph, chunk=chunk):
+            written += 1
+            if fmt == "ndjson":
+                write(encode(record).encode())
+                write(b"\n")
+                continue
+            kind = record.pop("type")
+            if kind == "map":
+                write(encode(record)[:-1].encode())
+                continue
+            first = kind != section
+            while section != kind:  # open every list up to this record's, empty ones included
+                if section is not None:
+                    write(b"]")
+                section = next(sections)
+                write(f',"{SECTIONS[section]}":['.encode())
+            if not first:
+                write(b",")
+            write(encode(record).encode())
+        if fmt == "json":
+            if section is not None:
+                write(b"]")
+            for rest in sections:
+                write(f',"{SECTIONS[rest]}":[]'.encode())
+            write(b"}\n")
+    return written
@@ -2,24 +2,33 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, fields
+from functools import cached_property
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
 
 import numpy as np
-from shapely.geometry import Polygon, LineString
 
 from .points import poisson_disk_sampling, lloyd_relaxation, random_points
-from .voronoi import compute_voronoi
+from .voronoi import compute_cell_graph
 from .elevation import assign_elevation
-from .climate import compute_temperature, compute_rainfall
-from .moisture import compute_moisture
+from .island_mask import classify_land, generate_islands
+from .erosion import simulate as erode
+from .climate import compute_temperature, compute_rainfall, compute_winds
+from .moisture import compute_moisture, transport
 from .biomes import classify_biomes
-from .rivers import compute_rivers
+from .rivers import compute_cell_rivers, compute_rivers
 from .cities import place_cities
+from .distance import distance_field
 from .roads import build_roads
 from .borders import unite_regions, compute_borders
-from .rasterizer import rasterize, Rasterizer
-from .utils import seeded_rng
+from .rasterizer import rasterize, rasterize_barycentric, rasterize_labels, Rasterizer
+from .pipeline import Stage, StageCache, run_pipeline
+from .instrument import Instrumentation
+
+if TYPE_CHECKING:
+    from shapely.geometry import Polygon, LineString
+
+    from .query import SpatialQuery
 
 
 @dataclass
@@ -34,6 +43,39 @@ class ArchipelagoParams:
     river_width_tiles: int = 1
     road_width_tiles: int = 1
     jitter: bool = False
+    # "grid" routes water over the rasterized elevation, "mesh" over the
+    # Voronoi cell graph (much cheaper, independent of map resolution).
+    hydrology: str = "grid"
+    # Rounds of hydraulic + thermal erosion applied to the elevation raster.
+    erosion_iterations: int = 0
+    # "nearest" gives each tile the elevation of its cell (flat plateaus),
+    # "barycentric" interpolates over the Delaunay triangles of the sites.
+    rasterization: str = "nearest"
+    # With num_islands > 0 land comes from that many round islands instead
+    # of the single central mask. Radii are fractions of the shorter map
+    # side; island_clustering is the share of islands placed next to an
+    # earlier one.
+    num_islands: int = 0
+    island_radius: Tuple[float, float] = (0.08, 0.2)
+    island_clustering: float = 0.0
+    # float32 fields and narrow integer layers; about a third of the memory.
+    compact: bool = False
+    # A progressive preview is this fraction of the final size. Noise
+    # frequencies are divided by it, so the preview samples the same terrain.
+    preview_scale: float = 1.0
+    # Fractal octaves of the elevation noise; previews use fewer.
+    noise_octaves: int = 4
+    # Also store the flat index of the nearest sea, river and road tile.
+    nearest_features: bool = False
+
+
+HYDROLOGY_MODES = ("grid", "mesh")
+RASTERIZATION_MODES = ("nearest", "barycentric")
+# Perlin displacement of rasterized lines when ``jitter`` is on.
+RIVER_JITTER = {"freq": 0.1, "strength": 0.5}
+ROAD_JITTER = {"freq": 0.2, "strength": 0.3}
+# Both hydrology modes start a river once it drains about this many cells.
+RIVER_MIN_CELLS = 4.0
 
 
 @dataclass
@@ -55,78 +97,269 @@ class Archipelago:
     cities: list[tuple[int, int]]
     borders: list[LineString]
     regions: np.ndarray
+    labels: np.ndarray
+    # Tile distances to the nearest sea, river and road tile (float32), and
+    # with ``nearest_features`` the flat index of that tile (int32).
+    sea_distance: Optional[np.ndarray] = None
+    river_distance: Optional[np.ndarray] = None
+    road_distance: Optional[np.ndarray] = None
+    nearest_sea: Optional[np.ndarray] = None
+    nearest_river: Optional[np.ndarray] = None
+    nearest_road: Optional[np.ndarray] = None
+    profile: Optional[Dict[str, Any]] = None
 
+    @cached_property
+    def query(self) -> SpatialQuery:
+        """Batch spatial lookups (:mod:`~archipelago_generator.query`); indexes are built on first use."""
+        from .query import SpatialQuery
 
-def generate_archipelago(**kwargs) -> Archipelago:
-    params = ArchipelagoParams(**kwargs)
-    rng = seeded_rng(params.seed)
+        return SpatialQuery(self)
+
+
+def _fields(compact, **values):
+    # Per-cell and per-tile float fields are stored as float32 when compact.
+    if not compact:
+        return values
+    return {k: v.astype(np.float32) if isinstance(v, np.ndarray) and v.dtype.kind == "f" else v
+            for k, v in values.items()}
+
+
+def _points_stage(rng, point_count, width, height, relax_iterations):
+    pts = random_points(point_count, width, height, rng)
+    pts = lloyd_relaxation(pts, width, height, relax_iterations)
+    return {"points": pts}
+
+
+def _voronoi_stage(points, width, height):
+    graph = compute_cell_graph(points, width, height)
+    return {"cells": graph.cells, "neighbors": graph.neighbors, "graph": graph}
+
+
+def _elevation_stage(cells, rng, width, height, compact, preview_scale, noise_octaves):
+    elevation = assign_elevation(cells, width, height, rng, frequency=0.02 / preview_scale, octaves=noise_octaves)
+    return _fields(compact, elevation=elevation)
 
-    pts = random_points(params.point_count, params.width, params.height, rng)
-    pts = lloyd_relaxation(pts, params.width, params.height, params.relax_iterations)
-    cells, neighbors = compute_voronoi(pts, params.width, params.height)
 
-    elevation = assign_elevation(cells, params.width, params.height, rng)
-    land_mask = elevation > params.sea_level
-    land = land_mask.astype(bool)
-    temperature = compute_temperature(cells, params.height, rng)
-    rainfall = compute_rainfall(cells, rng)
-    moisture = compute_moisture(rainfall)
-    biome = classify_biomes(land, temperature, moisture)
+def _islands_stage(graph, elevation, rng, width, height, sea_level, num_islands, island_radius,
+                   island_clustering, preview_scale):
+    if num_islands <= 0:
+        return {"elevation": elevation}
+    import shapely
 
+    side = min(width, height)
+    islands = generate_islands(num_islands, width, height, rng, island_radius[0] * side,
+                               island_radius[1] * side, clustering=island_clustering)
+    land = classify_land(graph.centroids, islands, sea_level, rng, frequency=0.01 / preview_scale)
+    # Like the central mask, cells touching the map edge are always sea.
+    bounds = shapely.bounds(np.asarray(graph.cells, dtype=object))
+    land &= (bounds[:, :2] > 0).all(axis=1) & (bounds[:, 2] < width) & (bounds[:, 3] < height)
+    # Keep the relief order but move land above sea_level and sea below it.
+    order = np.argsort(elevation, kind="stable")
+    ranked = np.empty(len(elevation))
+    for sel, lo, hi, shift in ((~land, 0.0, sea_level, 0), (land, sea_level, 1.0, 1)):
+        idx = order[sel[order]]
+        ranked[idx] = lo + (hi - lo) * (np.arange(len(idx)) + shift) / max(len(idx), 1)
+    return {"elevation": ranked.astype(elevation.dtype, copy=False)}
+
+
+def _climate_stage(cells, rng, height, compact, preview_scale):
+    temperature = compute_temperature(cells, height, rng)
+    rainfall = compute_rainfall(cells, rng, frequency=0.01 / preview_scale)
+    return _fields(compact, temperature=temperature, rainfall=rainfall)
+
+
+def _biome_stage(graph, elevation, temperature, rainfall, sea_level, height):
+    land = (elevation > sea_level).astype(bool)
+    winds = compute_winds(graph.centroids, height)
+    moisture = compute_moisture(rainfall, transport(graph, land, elevation, winds))
+    moisture = moisture.astype(rainfall.dtype, copy=False)
+    return {"land": land, "moisture": moisture, "biome": classify_biomes(land, temperature, moisture)}
+
+
+def _regions_stage(biome, neighbors, compact):
     regions = unite_regions(biome, neighbors)
+    return {"regions": regions.astype(np.int32) if compact else regions}
+
+
+def _borders_stage(cells, biome, neighbors, rng):
     borders = compute_borders(cells, biome, neighbors, seed=int(rng.integers(0, 1_000_000)))
+    return {"borders": borders}
 
-    # Rasterize elevation for river and city generation
-    elev_grid = rasterize(cells, elevation, params.width, params.height)
-    river_map, river_width, river_lines = compute_rivers(
-        elev_grid, sea_level=params.sea_level
-    )
-    rasterizer = Rasterizer(params.width, params.height, seed=int(rng.integers(0, 1_000_000)))
-    river_jitter = {'freq': 0.1, 'strength': 0.5} if params.jitter else None
+
+def _labels_stage(cells, width, height):
+    # The cell-label raster lets any per-cell attribute be rasterized by a
+    # single lookup.
+    return {"labels": rasterize_labels(cells, width, height)}
+
+
+def _elev_grid_stage(cells, graph, elevation, labels, width, height, rasterization):
+    # Rasterized elevation drives river and city generation.
+    if rasterization == "barycentric":
+        return {"elev_grid": rasterize_barycentric(graph.sites, elevation, width, height)}
+    return {"elev_grid": rasterize(cells, elevation, width, height, labels=labels)}
+
+
+def _erosion_stage(elev_grid, rng, erosion_iterations, sea_level):
+    if erosion_iterations <= 0:
+        return {"elev_grid": elev_grid}
+    eroded = erode(elev_grid, erosion_iterations, seed=int(rng.integers(0, 1_000_000)), sea_level=sea_level)
+    return {"elev_grid": eroded.astype(elev_grid.dtype, copy=False)}
+
+
+def _rivers_stage(elev_grid, graph, elevation, labels, sea_level, hydrology, compact):
+    if hydrology == "mesh":
+        _, cell_width, river_lines = compute_cell_rivers(graph, elevation, sea_level=sea_level,
+                                                         min_flux=RIVER_MIN_CELLS)
+        if compact:
+            cell_width = cell_width.astype(np.uint8)
+        # Every pixel of a river cell carries that cell's river width.
+        river_width = np.append(cell_width, 0)[labels]
+    else:
+        min_flux = RIVER_MIN_CELLS * elev_grid.size / len(graph)
+        _, river_width, river_lines = compute_rivers(elev_grid, sea_level=sea_level, min_flux=min_flux,
+                                                     compact=compact)
+    return {"river_width": river_width, "river_lines": river_lines}
+
+
+def _river_raster_stage(river_lines, rng, width, height, river_width_tiles, jitter):
+    raster_seed = int(rng.integers(0, 1_000_000))
+    rasterizer = Rasterizer(width, height, seed=raster_seed)
+    river_jitter = RIVER_JITTER if jitter else None
     river_map = rasterizer.rasterize_rivers(
         river_lines,
-        width_tiles=params.river_width_tiles,
+        width_tiles=river_width_tiles,
         density=1.0,
         jitter=river_jitter,
     )
+    return {"river_map": river_map, "raster_seed": raster_seed}
+
+
+def _sea_distance_stage(elev_grid, sea_level, nearest_features):
+    dist, nearest = distance_field(elev_grid < sea_level, nearest=nearest_features)
+    return {"sea_distance": dist, "nearest_sea": nearest}
+
+
+def _river_distance_stage(river_map, nearest_features):
+    dist, nearest = distance_field(river_map > 0, nearest=nearest_features)
+    return {"river_distance": dist, "nearest_river": nearest}
+
+
+def _road_distance_stage(road_map, nearest_features):
+    dist, nearest = distance_field(road_map > 0, nearest=nearest_features)
+    return {"road_distance": dist, "nearest_road": nearest}
+
+
+def _cities_stage(river_map, elev_grid, sea_distance, rng, num_cities, sea_level):
     cities = place_cities(
         river_map,
         elev_grid,
-        n_cities=params.num_cities,
-        sea_level=params.sea_level,
+        n_cities=num_cities,
+        sea_level=sea_level,
         rng=rng,
+        sea_distance=sea_distance,
     )
-    road_map, road_lines = build_roads(
+    return {"cities": cities}
+
+
+def _roads_stage(cities, elev_grid, rng, sea_level):
+    road_paths = []
+    _, road_lines = build_roads(
         cities,
         elev_grid,
-        sea_level=params.sea_level,
+        sea_level=sea_level,
         seed=int(rng.integers(0, 1_000_000)),
+        paths=road_paths,
     )
-    road_jitter = {'freq': 0.2, 'strength': 0.3} if params.jitter else None
+    return {"road_lines": road_lines, "road_paths": road_paths}
+
+
+def _road_raster_stage(road_lines, raster_seed, elev_grid, width, height, road_width_tiles, jitter, sea_level):
+    rasterizer = Rasterizer(width, height, seed=raster_seed)
+    road_jitter = ROAD_JITTER if jitter else None
     road_map = rasterizer.rasterize_roads(
         road_lines,
-        width_tiles=params.road_width_tiles,
+        width_tiles=road_width_tiles,
         density=1.0,
         jitter=road_jitter,
     )
+    # Wide or jittered roads can spill past the coast; keep them on land.
+    road_map[elev_grid < sea_level] = False
+    return {"road_map": road_map}
+
+
+# Stages in execution order. Stages that draw random numbers are seeded with
+# their own stream, so only real data dependencies order them.
+STAGES = [
+    Stage("points", _points_stage, ("points",), params=("point_count", "width", "height", "relax_iterations"),
+          version=2, seeded=True),
+    Stage("voronoi", _voronoi_stage, ("cells", "neighbors", "graph"), ("points",), ("width", "height"),
+          version=2),
+    Stage("elevation", _elevation_stage, ("elevation",), ("cells",),
+          ("width", "height", "compact", "preview_scale", "noise_octaves"), version=3, seeded=True),
+    Stage("islands", _islands_stage, ("elevation",), ("graph", "elevation"),
+          ("width", "height", "sea_level", "num_islands", "island_radius", "island_clustering", "preview_scale"),
+          version=3, seeded=True),
+    Stage("climate", _climate_stage, ("temperature", "rainfall"), ("cells",), ("height", "compact", "preview_scale"),
+          version=3, seeded=True),
+    Stage("biomes", _biome_stage, ("land", "moisture", "biome"),
+          ("graph", "elevation", "temperature", "rainfall"), ("sea_level", "height"), version=2),
+    Stage("regions", _regions_stage, ("regions",), ("biome", "neighbors"), ("compact",)),
+    Stage("borders", _borders_stage, ("borders",), ("cells", "biome", "neighbors"), version=2, seeded=True),
+    Stage("labels", _labels_stage, ("labels",), ("cells",), ("width", "height")),
+    Stage("elev_grid", _elev_grid_stage, ("elev_grid",), ("cells", "graph", "elevation", "labels"),
+          ("width", "height", "rasterization")),
+    Stage("erosion", _erosion_stage, ("elev_grid",), ("elev_grid",),
+          ("erosion_iterations", "sea_level"), version=2, seeded=True),
+    Stage("rivers", _rivers_stage, ("river_width", "river_lines"), ("elev_grid", "graph", "elevation", "labels"),
+          ("sea_level", "hydrology", "compact")),
+    Stage("river_raster", _river_raster_stage, ("river_map", "raster_seed"), ("river_lines",),
+          ("width", "height", "river_width_tiles", "jitter"), version=2, seeded=True),
+    Stage("sea_distance", _sea_distance_stage, ("sea_distance", "nearest_sea"), ("elev_grid",),
+          ("sea_level", "nearest_features")),
+    Stage("river_distance", _river_distance_stage, ("river_distance", "nearest_river"), ("river_map",),
+          ("nearest_features",)),
+    Stage("cities", _cities_stage, ("cities",), ("river_map", "elev_grid", "sea_distance"),
+          ("num_cities", "sea_level"), version=2, seeded=True),
+    Stage("roads", _roads_stage, ("road_lines", "road_paths"), ("cities", "elev_grid"), ("sea_level",), version=4,
+          seeded=True),
+    Stage("road_raster", _road_raster_stage, ("road_map",), ("road_lines", "raster_seed", "elev_grid"),
+          ("width", "height", "road_width_tiles", "jitter", "sea_level"), version=2),
+    Stage("road_distance", _road_distance_stage, ("road_distance", "nearest_road"), ("road_map",),
+          ("nearest_features",)),
+]
 
-    return Archipelago(
-        width=params.width,
-        height=params.height,
-        cells=cells,
-        land=land,
-        elevation=elevation,
-        temperature=temperature,
-        rainfall=rainfall,
-        moisture=moisture,
-        biome=biome,
-        river_map=river_map,
-        river_width=river_width,
-        river_lines=river_lines,
-        road_map=road_map,
-        road_lines=road_lines,
-        cities=cities,
-        borders=borders,
-        regions=regions,
-    )
 
+def generate_archipelago(
+    cache: Optional[StageCache] = None,
+    instrument: Optional[Instrumentation] = None,
+    workers: int = 1,
+    cancel: Optional[Callable[[], bool]] = None,
+    **kwargs,
+) -> Archipelago:
+    """Generate an archipelago from :class:`ArchipelagoParams` keyword arguments.
+
+    With a :class:`~archipelago_generator.pipeline.StageCache`, stage outputs
+    are reused across calls and only the stages downstream of a changed
+    parameter are recomputed. Caching is skipped when ``seed`` is ``None``
+    because the run is not reproducible. With an
+    :class:`~archipelago_generator.instrument.Instrumentation`, per-stage
+    timings and counters are recorded and attached as ``profile``. With
+    ``workers > 1``, independent stages run concurrently on that many
+    threads; the map is the same for every worker count. ``cancel`` is
+    polled between stages; see :func:`~archipelago_generator.pipeline.run_stages`.
+    """
+
+    params = ArchipelagoParams(**kwargs)
+    if params.hydrology not in HYDROLOGY_MODES:
+        raise ValueError(f"hydrology must be one of {HYDROLOGY_MODES}")
+    if params.rasterization not in RASTERIZATION_MODES:
+        raise ValueError(f"rasterization must be one of {RASTERIZATION_MODES}")
+    if params.seed is None:
+        cache = None
+    produced = {out for stage in STAGES for out in stage.outputs}
+    names = [f.name for f in fields(Archipelago) if f.name in produced]
+    values = run_pipeline(STAGES, params, names, cache, instrument, workers, cancel)
+    arch = Archipelago(width=params.width, height=params.height, **values)
+    if instrument is not None:
+        arch.profile = instrument.summary()
+    return arch
@@ -0,0 +1,146 @@
+"""Stage-level instrumentation for the generation pipelines.
+
+Pass an :class:`Instrumentation` to ``generate_archipelago`` or
+``generate_world`` to receive a :class:`StageEvent` when each stage starts
+and ends. End events carry wall and CPU time, the allocation delta and peak
+(when ``trace_memory`` is on), the estimated size of the stage outputs, the
+hot-operation counters incremented during the stage, and the outputs
+themselves so observers can inspect intermediate data. The summary is
+attached to the result as ``profile``.
+
+Hot loops report their work in bulk through :func:`count`, which is a single
+context-variable lookup when no instrumentation is active.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import time
+import tracemalloc
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+_counters: ContextVar[Optional[Counter]] = ContextVar("archipelago_counters", default=None)
+
+
+def count(name: str, n: int = 1) -> None:
+    """Add ``n`` to the hot-operation counter ``name`` of the running stage."""
+    counters = _counters.get()
+    if counters is not None:
+        counters[name] += n
+
+
+@dataclass
+class StageEvent:
+    stage: str
+    phase: str  # "start" or "end"
+    cached: bool = False
+    wall: float = 0.0
+    cpu: float = 0.0
+    alloc_delta: Optional[int] = None
+    alloc_peak: Optional[int] = None
+    output_bytes: Optional[int] = None
+    counters: Dict[str, int] = field(default_factory=dict)
+    outputs: Optional[Dict[str, Any]] = field(default=None, repr=False)
+
+
+class Instrumentation:
+    """Record stage events and forward them to an optional ``callback``.
+
+    With ``trace_memory=True`` tracemalloc is started for the duration of each
+    stage (unless it is already running), which slows Python-heavy stages
+    noticeably; timings are most accurate with it off. tracemalloc is global
+    to the process, so stages run concurrently on an executor report no
+    memory figures.
+    """
+
+    def __init__(self, callback: Optional[Callable[[StageEvent], None]] = None, *,
+                 trace_memory: bool = False) -> None:
+        self.callback = callback
+        self.trace_memory = trace_memory
+        self.events: List[StageEvent] = []
+
+    def _emit(self, event: StageEvent) -> None:
+        if event.phase == "end":
+            self.events.append(event)
+        if self.callback is not None:
+            self.callback(event)
+
+    @contextlib.contextmanager
+    def stage(self, name: str, *, concurrent: bool = False) -> Iterator[StageEvent]:
+        """Measure the enclosed block as stage ``name``.
+
+        Assign the stage outputs to ``event.outputs`` inside the block.
+        ``concurrent`` marks a stage that may overlap others, which skips
+        memory tracing.
+        """
+        from .pipeline import _nbytes
+
+        self._emit(StageEvent(name, "start"))
+        event = StageEvent(name, "end")
+        counters: Counter = Counter()
+        token = _counters.set(counters)
+        started_tracing = False
+        trace_memory = self.trace_memory and not concurrent
+        if trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield event
+        finally:
+            event.wall = time.perf_counter() - wall
+            event.cpu = time.process_time() - cpu
+            _counters.reset(token)
+            if trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                event.alloc_delta = current - before
+                event.alloc_peak = peak - before
+                if started_tracing:
+                    tracemalloc.stop()
+        event.counters = dict(counters)
+        if event.outputs is not None:
+            event.output_bytes = _nbytes(event.outputs)
+        self._emit(event)
+
+    def cached(self, name: str, outputs: Dict[str, Any]) -> None:
+        """Record that stage ``name`` was served from the stage cache."""
+        self._emit(StageEvent(name, "start", cached=True))
+        self._emit(StageEvent(name, "end", cached=True, outputs=outputs))
+
+    def summary(self) -> Dict[str, Any]:
+        """Return a JSON-serialisable per-stage and total summary."""
+        stages: Dict[str, Dict[str, Any]] = {}
+        totals: Counter = Counter()
+        for ev in self.events:
+            stages[ev.stage] = {
+                "cached": ev.cached,
+                "wall": ev.wall,
+                "cpu": ev.cpu,
+                "alloc_delta": ev.alloc_delta,
+                "alloc_peak": ev.alloc_peak,
+                "output_bytes": ev.output_bytes,
+                "counters": ev.counters,
+            }
+            totals.update(ev.counters)
+        return {
+            "stages": stages,
+            "wall": sum(ev.wall for ev in self.events),
+            "cpu": sum(ev.cpu for ev in self.events),
+            "counters": dict(totals),
+        }
+
+    def format(self) -> str:
+        """Return the summary as a human readable table."""
+        lines = [f"{'stage':<14}{'wall ms':>10}{'cpu ms':>10}{'alloc MB':>10}{'out MB':>9}  counters"]
+        for ev in self.events:
+            alloc = "" if ev.alloc_peak is None else f"{ev.alloc_peak / 2**20:.2f}"
+            out = "" if ev.output_bytes is None else f"{ev.output_bytes / 2**20:.2f}"
+            note = "cached" if ev.cached else " ".join(f"{k}={v}" for k, v in sorted(ev.counters.items()))
+            lines.append(f"{ev.stage:<14}{ev.wall * 1000:>10.2f}{ev.cpu * 1000:>10.2f}{alloc:>10}{out:>9}  {note}")
+        return "\n".join(lines)
@@ -0,0 +1,313 @@
+"""Triangle meshes of height grids and cell maps for 3D engines.
+
+:func:`grid_mesh` turns a height grid into a mesh decimated by an
+error-bounded quadtree. A block of tiles becomes one leaf when the bilinear
+patch through its corners is within ``max_error`` of every sample, so flat
+sea collapses to a few large triangles. The quadtree is split into
+``chunk`` x ``chunk`` roots, which gives chunked output for free. Leaves are
+fanned around every leaf corner that lies on their edges, so neighbouring
+leaves of different sizes share vertices and the mesh has no cracks, even
+between chunks. Everything after the quadtree walk is array operations over
+whole levels.
+
+Meshes are written as OBJ text or binary glTF (``.glb``), each assembled in
+memory and written in one call. Colours are per vertex.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import struct
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, BinaryIO, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .generator import Archipelago
+
+# Height samples copied per batch when measuring the error of a quadtree level.
+BATCH_SAMPLES = 1 << 20
+
+
+@dataclass
+class Mesh:
+    """Triangles over ``positions`` (``(n, 3)`` float32, ``y`` up) with ``uint8`` RGB ``colors``."""
+
+    positions: np.ndarray
+    indices: np.ndarray
+    colors: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+
+def _ring(size: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Offsets of the 4 * size boundary vertices of a leaf, walking round it.
+    t = np.arange(size)
+    ys = np.concatenate([np.zeros(size, int), t, np.full(size, size), size - t])
+    xs = np.concatenate([t, np.full(size, size), size - t, np.zeros(size, int)])
+    return ys, xs
+
+
+def quadtree_leaves(heights: np.ndarray, max_error: float = 0.0, chunk: int = 64) -> Dict[int, np.ndarray]:
+    """Return the leaves of the error-bounded quadtree of ``heights`` by size.
+
+    ``leaves[s]`` is an ``(n, 2)`` array of the top-left ``(row, col)``
+    vertices of the ``s`` x ``s`` leaves. ``chunk`` must be a power of two
+    and sets the largest leaf.
+    """
+    if chunk < 1 or chunk & (chunk - 1):
+        raise ValueError("chunk must be a power of two")
+    rows, cols = heights.shape
+    ny, nx = -(-max(rows - 1, 1) // chunk), -(-max(cols - 1, 1) // chunk)
+    # Edge padding keeps block reads in bounds; blocks reaching into it are
+    # always split, so it never shapes the mesh.
+    padded = np.pad(np.asarray(heights, dtype=float), ((0, ny * chunk + 1 - rows), (0, nx * chunk + 1 - cols)),
+                    mode="edge")
+    nodes = np.stack(np.meshgrid(np.arange(ny) * chunk, np.arange(nx) * chunk, indexing="ij"), -1).reshape(-1, 2)
+    leaves: Dict[int, np.ndarray] = {}
+    size = chunk
+    while len(nodes):
+        inside = (nodes[:, 0] < rows - 1) & (nodes[:, 1] < cols - 1)
+        nodes = nodes[inside]
+        if size == 1:
+            leaves[1] = nodes
+            break
+        straddle = (nodes[:, 0] + size > rows - 1) | (nodes[:, 1] + size > cols - 1)
+        split = straddle.copy()
+        check = np.flatnonzero(~straddle)
+        blocks = np.lib.stride_tricks.sliding_window_view(padded, (size + 1, size + 1))
+        u = np.linspace(0.0, 1.0, size + 1)
+        # Copy the windows a batch at a time to bound the temporaries.
+        step = max(BATCH_SAMPLES // (size + 1) ** 2, 1)
+        for start in range(0, len(check), step):
+            batch = check[start:start + step]
+            block = blocks[nodes[batch, 0], nodes[batch, 1]]
+            top = block[:, :1, :1] * (1 - u) + block[:, :1, -1:] * u
+            bottom = block[:, -1:, :1] * (1 - u) + block[:, -1:, -1:] * u
+            patch = top * (1 - u[:, None]) + bottom * u[:, None]
+            split[batch] = np.abs(block - patch).max(axis=(1, 2)) > max_error
+        leaves[size] = nodes[~split]
+        half = size // 2
+        parents = nodes[split]
+        nodes = (parents[:, None, :] + np.array([[0, 0], [0, half], [half, 0], [half, half]])).reshape(-1, 2)
+        size = half
+    return {s: v for s, v in leaves.items() if len(v)}
+
+
+def _triangulate(leaves: Dict[int, np.ndarray], shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return ``(vertex_flat_index, triangles, leaf_origin)`` for quadtree leaves."""
+    rows, cols = shape
+    used = np.zeros(shape, dtype=bool)
+    for size, nodes in leaves.items():
+        for dy, dx in ((0, 0), (0, size), (size, 0), (size, size)):
+            used[nodes[:, 0] + dy, nodes[:, 1] + dx] = True
+    tris: List[np.ndarray] = []
+    origins: List[np.ndarray] = []
+    for size, nodes in leaves.items():
+        ry, rx = _ring(size)
+        ys, xs = nodes[:, :1] + ry, nodes[:, 1:] + rx
+        flat = ys * cols + xs
+        on = used[ys, xs]
+        plain = on.sum(axis=1) == 4
+        if plain.any():
+            tl, tr, br, bl = (flat[plain][:, k * size] for k in range(4))
+            tris.append(np.concatenate([np.stack([tl, tr, br], 1), np.stack([tl, br, bl], 1)]))
+            origins.append(np.concatenate([nodes[plain], nodes[plain]]))
+        fan = ~plain
+        if fan.any():
+            # Fan from the leaf centre over every used boundary vertex, in order.
+            centre = (nodes[fan, 0] + size // 2) * cols + nodes[fan, 1] + size // 2
+            used.ravel()[centre] = True
+            mask = on[fan]
+            pos = np.flatnonzero(mask)
+            row = pos // mask.shape[1]
+            first = np.searchsorted(row, np.arange(mask.shape[0]))
+            nxt = np.append(pos[1:], 0)
+            last = np.append(row[1:] != row[:-1], True)
+            nxt[last] = pos[first[row[last]]]
+            ring = flat[fan].ravel()
+            tris.append(np.stack([centre[row], ring[pos], ring[nxt]], 1))
+            origins.append(nodes[fan][row])
+    if not tris:
+        return np.zeros(0, np.int64), np.zeros((0, 3), np.int64), np.zeros((0, 2), np.int64)
+    tris_all = np.concatenate(tris)
+    vertices = np.flatnonzero(used.ravel())
+    return vertices, np.searchsorted(vertices, tris_all), np.concatenate(origins)
+
+
+def _upward(positions: np.ndarray, tris: np.ndarray) -> np.ndarray:
+    # Wind every triangle counter-clockwise seen from above (+y).
+    a, b, c = (positions[tris[:, k]].astype(float) for k in range(3))
+    ny = (b[:, 2] - a[:, 2]) * (c[:, 0] - a[:, 0]) - (b[:, 0] - a[:, 0]) * (c[:, 2] - a[:, 2])
+    flip = ny < 0
+    tris = tris.copy()
+    tris[flip, 1], tris[flip, 2] = tris[flip, 2], tris[flip, 1].copy()
+    return tris
+
+
+def grid_mesh(
+    heights: np.ndarray,
+    *,
+    max_error: float = 0.0,
+    chunk: int = 64,
+    colors: Optional[np.ndarray] = None,
+    sea_level: Optional[float] = None,
+    vertical_scale: float = 1.0,
+    by_chunk: bool = False,
+) -> Union[Mesh, Dict[Tuple[int, int], Mesh]]:
+    """Mesh ``heights`` with one potential vertex per sample.
+
+    Samples ``(row, col)`` map to ``(col, height * vertical_scale, row)``.
+    ``colors`` is an ``(rows, cols, 3)`` ``uint8`` array sampled at the
+    kept vertices. With ``sea_level``, heights below it are raised to the
+    water surface so the sea decimates to a few triangles. With
+    ``by_chunk`` the result is one mesh per ``chunk`` x ``chunk`` block,
+    keyed by block ``(row, col)``; chunk edges still match.
+    """
+    heights = np.asarray(heights, dtype=float)
+    if sea_level is not None:
+        heights = np.maximum(heights, sea_level)
+    rows, cols = heights.shape
+    vertices, tris, origins = _triangulate(quadtree_leaves(heights, max_error, chunk), (rows, cols))
+    vy, vx = np.divmod(vertices, cols)
+    positions = np.stack([vx, heights.ravel()[vertices] * vertical_scale, vy], 1).astype(np.float32)
+    tris = _upward(positions, tris)
+    vertex_colors = None if colors is None else np.asarray(colors, dtype=np.uint8).reshape(-1, 3)[vertices]
+    if not by_chunk:
+        return Mesh(positions, tris.astype(np.uint32), vertex_colors)
+    out: Dict[Tuple[int, int], Mesh] = {}
+    key = (origins[:, 0] // chunk) * (-(-cols // chunk) + 1) + origins[:, 1] // chunk
+    order = np.argsort(key, kind="stable")
+    keys, starts = np.unique(key[order], return_index=True)
+    for k, group in zip(keys, np.split(order, starts[1:])):
+        part = tris[group]
+        used, local = np.unique(part, return_inverse=True)
+        out[divmod(int(k), -(-cols // chunk) + 1)] = Mesh(
+            positions[used], local.reshape(-1, 3).astype(np.uint32),
+            None if vertex_colors is None else vertex_colors[used],
+        )
+    return out
+
+
+def lod_meshes(heights: np.ndarray, errors: Sequence[float] = (0.0, 0.01, 0.05), **options) -> List[Dict[Tuple[int, int], Mesh]]:
+    """Chunked meshes of ``heights`` at each ``max_error`` in ``errors``, finest first."""
+    return [grid_mesh(heights, max_error=e, by_chunk=True, **options) for e in errors]
+
+
+def _palette(names: Sequence[str], glyphs: Dict[str, Tuple[str, Tuple[int, int, int]]]) -> np.ndarray:
+    return np.array([glyphs.get(n, ("?", (255, 255, 255)))[1] for n in names] + [(255, 255, 255)], dtype=np.uint8)
+
+
+def archipelago_mesh(arch: Archipelago, *, source: str = "grid", **options) -> Union[Mesh, Dict[Tuple[int, int], Mesh]]:
+    """Mesh an archipelago, coloured by biome.
+
+    ``source="grid"`` meshes the rasterized elevation with :func:`grid_mesh`
+    (``options`` are passed on). ``source="cells"`` places one vertex per
+    cell centroid at its elevation and connects them by Delaunay
+    triangulation; cells are already adaptive, so no decimation is applied.
+    """
+    import shapely
+
+    from .biomes import BIOMES
+    from .rasterizer import rasterize
+    from .render import BIOME_GLYPHS
+
+    lookup = {b: i for i, b in enumerate(BIOMES)}
+    codes = np.array([lookup.get(b, len(BIOMES)) for b in arch.biome] + [len(BIOMES)])
+    palette = _palette(BIOMES, BIOME_GLYPHS)
+    if source == "grid":
+        heights = rasterize(arch.cells, arch.elevation, arch.width, arch.height, labels=arch.labels)
+        return grid_mesh(heights, colors=palette[codes[arch.labels]], **options)
+    if source != "cells":
+        raise ValueError("source must be 'grid' or 'cells'")
+    from scipy.spatial import Delaunay
+
+    cells = np.asarray(arch.cells, dtype=object)
+    keep = np.flatnonzero(~shapely.is_empty(cells))
+    centres = shapely.get_coordinates(shapely.centroid(cells[keep]))
+    scale = options.get("vertical_scale", 1.0)
+    positions = np.column_stack([centres[:, 0], np.asarray(arch.elevation, dtype=float)[keep] * scale,
+                                 centres[:, 1]]).astype(np.float32)
+    tris = _upward(positions, Delaunay(centres).simplices.astype(np.int64))
+    return Mesh(positions, tris.astype(np.uint32), palette[codes[keep]])
+
+
+def _obj_bytes(mesh: Mesh) -> bytes:
+    buf = io.BytesIO()
+    if mesh.colors is not None:
+        np.savetxt(buf, np.hstack([mesh.positions, mesh.colors / 255.0]), fmt="v %.6g %.6g %.6g %.4g %.4g %.4g")
+    else:
+        np.savetxt(buf, mesh.positions, fmt="v %.6g %.6g %.6g")
+    np.savetxt(buf, mesh.indices.astype(np.int64) + 1, fmt="f %d %d %d")
+    return buf.getvalue()
+
+
+def _write(fp: Union[str, os.PathLike, BinaryIO], data: bytes) -> None:
+    if isinstance(fp, (str, os.PathLike)):
+        with open(fp, "wb") as fh:
+            fh.write(data)
+    else:
+        fp.write(data)
+
+
+def write_obj(mesh: Mesh, fp: Union[str, os.PathLike, BinaryIO]) -> None:
+    """Write ``mesh`` as Wavefront OBJ, with colours as the common ``v x y z r g b`` extension."""
+    _write(fp, _obj_bytes(mesh))
+
+
+def write_glb(meshes: Union[Mesh, Dict[object, Mesh]], fp: Union[str, os.PathLike, BinaryIO]) -> None:
+    """Write one mesh, or one node per entry of a dict such as chunks, as binary glTF 2.0."""
+    if isinstance(meshes, Mesh):
+        meshes = {"terrain": meshes}
+    blobs: List[bytes] = []
+    views: List[dict] = []
+    accessors: List[dict] = []
+    offset = 0
+
+    def add(array: np.ndarray, target: int, component: int, kind: str, **extra) -> int:
+        nonlocal offset
+        data = np.ascontiguousarray(array).tobytes()
+        views.append({"buffer": 0, "byteOffset": offset, "byteLength": len(data), "target": target})
+        blobs.append(data + b"\0" * (-len(data) % 4))
+        offset += len(data) + (-len(data) % 4)
+        accessors.append({"bufferView": len(views) - 1, "componentType": component, "count": len(array),
+                          "type": kind, **extra})
+        return len(accessors) - 1
+
+    gl_meshes, nodes = [], []
+    for name, mesh in meshes.items():
+        if not len(mesh):
+            continue
+        attributes = {"POSITION": add(mesh.positions.astype(np.float32), 34962, 5126, "VEC3",
+                                      min=mesh.positions.min(axis=0).tolist(),
+                                      max=mesh.positions.max(axis=0).tolist())}
+        if mesh.colors is not None:
+            rgba = np.column_stack([mesh.colors, np.full(len(mesh.colors), 255, np.uint8)])
+            attributes["COLOR_0"] = add(rgba, 34962, 5121, "VEC4", normalized=True)
+        indices = add(mesh.indices.astype(np.uint32).ravel(), 34963, 5125, "SCALAR")
+        gl_meshes.append({"primitives": [{"attributes": attributes, "indices": indices}]})
+        nodes.append({"mesh": len(gl_meshes) - 1, "name": "_".join(map(str, name)) if isinstance(name, tuple)
+                      else str(name)})
+    doc = {
+        "asset": {"version": "2.0", "generator": "archipelago_generator"},
+        "scene": 0,
+        "scenes": [{"nodes": list(range(len(nodes)))}],
+        "nodes": nodes,
+        "meshes": gl_meshes,
+        "accessors": accessors,
+        "bufferViews": views,
+        "buffers": [{"byteLength": offset}],
+    }
+    text = json.dumps(doc, separators=(",", ":")).encode()
+    text += b" " * (-len(text) % 4)
+    binary = b"".join(blobs)
+    total = 12 + 8 + len(text) + 8 + len(binary)
+    _write(fp, b"".join([
+        struct.pack("<4sII", b"glTF", 2, total),
+        struct.pack("<I4s", len(text), b"JSON"), text,
+        struct.pack("<I4s", len(binary), b"BIN\0"), binary,
+    ]))
@@ -0,0 +1,360 @@
+"""Named pipeline stages with content-hashed caching.
+
+A pipeline is an ordered list of :class:`Stage` objects. Each stage declares
+the parameters it reads and the values it consumes from earlier stages; its
+cache key is a hash of those parameters and of the keys of the stages that
+produced its inputs. Changing one parameter therefore only changes the keys
+of the stages downstream of it, and :func:`run_stages` recomputes just those,
+taking everything else from a :class:`StageCache`.
+
+Stages that draw random numbers do not share a generator. Each gets its own
+stream, spawned from the run's seed by stage name (:func:`stage_rng`), so
+stages without a data dependency can run concurrently on an executor and
+the result does not depend on the order they finish in.
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import os
+import pickle
+import sys
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .instrument import Instrumentation
+
+
+@dataclass(frozen=True)
+class Stage:
+    """A pipeline step.
+
+    ``func`` is called with the declared ``inputs`` and ``params`` as keyword
+    arguments and returns a dict containing every name in ``outputs``. A
+    ``seeded`` stage is also passed ``rng``, its own generator from
+    :func:`stage_rng`. Bump ``version`` when the stage's code changes so
+    on-disk entries made by the old code are no longer reused.
+    """
+
+    name: str
+    func: Callable[..., Dict[str, Any]]
+    outputs: Tuple[str, ...]
+    inputs: Tuple[str, ...] = ()
+    params: Tuple[str, ...] = ()
+    version: int = 1
+    seeded: bool = False
+
+
+class Cancelled(Exception):
+    """Raised by :func:`run_stages` when its ``cancel`` callback asks it to stop."""
+
+
+def stage_rng(seed: Any, name: str) -> np.random.Generator:
+    """Return the random generator of stage ``name`` in a run seeded with ``seed``.
+
+    ``seed`` is anything ``np.random.SeedSequence`` accepts, or a sequence
+    itself. The stream is spawned from it with a spawn key hashed from
+    ``name``, so every stage's draws are independent of the other stages.
+    """
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    word = int.from_bytes(hashlib.sha256(name.encode()).digest()[:4], "little")
+    return np.random.default_rng(np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (word,)))
+
+
+def _nbytes(value: Any) -> int:
+    """Rough in-memory size of a stage output, used for cache eviction."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(_nbytes(v) for v in value)
+    if hasattr(value, "wkb_hex"):  # shapely geometry
+        import shapely
+
+        return 100 + 16 * int(shapely.get_num_coordinates(value))
+    return sys.getsizeof(value)
+
+
+class StageCache:
+    """In-memory LRU of stage outputs with an optional on-disk second level.
+
+    ``max_bytes`` bounds the estimated size of the entries kept in memory and
+    ``max_disk_bytes`` the size of the pickles kept in ``directory``; the
+    least recently used entries are evicted first. Cached arrays are marked
+    read-only because they are shared by every result built from them.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 512 * 2**20,
+        directory: Optional[str] = None,
+        max_disk_bytes: int = 4 * 2**30,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._size = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries or (
+            self.directory is not None and os.path.exists(self._path(key))
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        return self._size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        if self.directory is not None and os.path.exists(self._path(key)):
+            with open(self._path(key), "rb") as fh:
+                outputs = pickle.load(fh)
+            os.utime(self._path(key))
+            self._remember(key, outputs)
+            self.hits += 1
+            return outputs
+        self.misses += 1
+        return None
+
+    def put(self, key: str, outputs: Dict[str, Any]) -> None:
+        self._remember(key, outputs)
+        if self.directory is not None:
+            tmp = f"{self._path(key)}.tmp{os.getpid()}"
+            with open(tmp, "wb") as fh:
+                pickle.dump(outputs, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+            self._evict_disk()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+    def _remember(self, key: str, outputs: Dict[str, Any]) -> None:
+        for value in outputs.values():
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+        size = _nbytes(outputs)
+        if key in self._entries:
+            self._size -= self._entries.pop(key)[1]
+        self._entries[key] = (outputs, size)
+        self._size += size
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, (_, old) = self._entries.popitem(last=False)
+            self._size -= old
+
+    def _evict_disk(self) -> None:
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                st = os.stat(os.path.join(self.directory, name))
+                files.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+
+def stage_keys(stages: Iterable[Stage], params: Any) -> Dict[str, str]:
+    """Return the cache key of every stage under ``params``.
+
+    A stage's key hashes its name, version, parameter values (plus ``seed``
+    for seeded stages) and the keys of the stages that produced its inputs
+    (the latest earlier producer of each value name).
+    """
+
+    keys: Dict[str, str] = {}
+    producer_of: Dict[str, Stage] = {}
+    for stage in stages:
+        payload = {
+            "stage": stage.name,
+            "version": stage.version,
+            "params": {p: getattr(params, p) for p in stage.params},
+            "inputs": {i: keys[producer_of[i].name] for i in stage.inputs},
+        }
+        if stage.seeded:
+            payload["seed"] = getattr(params, "seed", None)
+        blob = json.dumps(payload, sort_keys=True, default=repr).encode()
+        keys[stage.name] = hashlib.sha256(blob).hexdigest()
+        for out in stage.outputs:
+            producer_of[out] = stage
+    return keys
+
+
+def _call(stage: Stage, kwargs: Dict[str, Any], instrument: Optional["Instrumentation"],
+          concurrent: bool = False) -> Dict[str, Any]:
+    if instrument is None:
+        return stage.func(**kwargs)
+    with instrument.stage(stage.name, concurrent=concurrent) as event:
+        event.outputs = stage.func(**kwargs)
+    return event.outputs
+
+
+def run_stages(
+    stages: List[Stage],
+    params: Any,
+    targets: Iterable[str],
+    cache: Optional[StageCache] = None,
+    instrument: Optional["Instrumentation"] = None,
+    executor: Optional[Executor] = None,
+    cancel: Optional[Callable[[], bool]] = None,
+) -> Dict[str, Any]:
+    """Compute the values named in ``targets``.
+
+    Only stages whose outputs are needed and not already cached are run; a
+    cache hit also prunes every stage upstream of it. Seeded stages get a
+    fresh generator spawned from ``params.seed``, and ``np.random.Generator``
+    inputs are copied before use so a cached stream state is never advanced.
+    Intermediate values are dropped as soon as their last consumer has run,
+    so peak memory is set by the live values rather than every stage's
+    output. ``instrument`` receives start and end events for every stage used.
+
+    With an ``executor`` every stage is submitted as soon as the stages it
+    reads from have finished, so independent stages run concurrently; the
+    values are the same as in a sequential run. A process pool needs
+    picklable stage functions and values, and instrumentation only reaches
+    the parent from a thread pool. Memory is not traced for stages run on an
+    executor, since tracemalloc cannot tell concurrent stages apart.
+
+    ``cancel`` is polled before each stage starts. Once it returns true no
+    further stage is started and :class:`Cancelled` is raised; stages that
+    already finished stay in the cache.
+    """
+
+    stages = list(stages)
+    targets = list(targets)
+    producers: Dict[Tuple[str, str], Stage] = {}
+    producer_of: Dict[str, Stage] = {}
+    # Inputs resolve to the latest producer *before* the consuming stage.
+    for stage in stages:
+        for inp in stage.inputs:
+            producers[(stage.name, inp)] = producer_of[inp]
+        for out in stage.outputs:
+            producer_of[out] = stage
+    keys = stage_keys(stages, params)
+    kept = {(producer_of[name].name, name) for name in targets}
+    # One root per run, so unseeded runs still give every stage its own stream.
+    root = np.random.SeedSequence(getattr(params, "seed", None))
+
+    results: Dict[str, Dict[str, Any]] = {}
+    plan: List[Stage] = []
+    planned = set()
+
+    def visit(stage: Stage) -> None:
+        if stage.name in results or stage.name in planned:
+            return
+        outputs = cache.get(keys[stage.name]) if cache is not None else None
+        if outputs is not None:
+            if instrument is not None:
+                instrument.cached(stage.name, outputs)
+            results[stage.name] = dict(outputs)
+            return
+        planned.add(stage.name)
+        for inp in stage.inputs:
+            visit(producers[(stage.name, inp)])
+        plan.append(stage)
+
+    for name in targets:
+        visit(producer_of[name])
+
+    consumers: Dict[Tuple[str, str], int] = {}
+    for stage in plan:
+        for inp in stage.inputs:
+            use = (producers[(stage.name, inp)].name, inp)
+            consumers[use] = consumers.get(use, 0) + 1
+
+    def arguments(stage: Stage) -> Dict[str, Any]:
+        kwargs = {}
+        for inp in stage.inputs:
+            value = results[producers[(stage.name, inp)].name][inp]
+            if isinstance(value, np.random.Generator):
+                value = copy.deepcopy(value)
+            kwargs[inp] = value
+        for p in stage.params:
+            kwargs[p] = getattr(params, p)
+        if stage.seeded:
+            kwargs["rng"] = stage_rng(root, stage.name)
+        return kwargs
+
+    def finish(stage: Stage, outputs: Dict[str, Any]) -> None:
+        missing = set(stage.outputs) - set(outputs)
+        if missing:
+            raise RuntimeError(f"stage {stage.name!r} did not produce {sorted(missing)}")
+        if cache is not None:
+            cache.put(keys[stage.name], outputs)
+        # A copy, so freeing a value never touches a dict held by the cache.
+        results[stage.name] = dict(outputs)
+        for inp in stage.inputs:
+            use = (producers[(stage.name, inp)].name, inp)
+            consumers[use] -= 1
+            if consumers[use] == 0 and use not in kept:
+                results[use[0]].pop(inp, None)
+
+    def check(stage: Stage) -> None:
+        if cancel is not None and cancel():
+            raise Cancelled(f"cancelled before stage {stage.name!r}")
+
+    if executor is None:
+        for stage in plan:
+            check(stage)
+            finish(stage, _call(stage, arguments(stage), instrument))
+    else:
+        waiting = {stage.name: {producers[(stage.name, inp)].name for inp in stage.inputs} & planned
+                   for stage in plan}
+        running: Dict[Any, Stage] = {}
+        pending = list(plan)
+        while pending or running:
+            for stage in [s for s in pending if not waiting[s.name]]:
+                check(stage)
+                pending.remove(stage)
+                running[executor.submit(_call, stage, arguments(stage), instrument, True)] = stage
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                finish(stage, future.result())
+                for other in pending:
+                    waiting[other.name].discard(stage.name)
+
+    return {name: results[producer_of[name].name][name] for name in targets}
+
+
+def run_pipeline(
+    stages: List[Stage],
+    params: Any,
+    targets: Iterable[str],
+    cache: Optional[StageCache] = None,
+    instrument: Optional["Instrumentation"] = None,
+    workers: int = 1,
+    cancel: Optional[Callable[[], bool]] = None,
+) -> Dict[str, Any]:
+    """:func:`run_stages` on a pool of ``workers`` threads (none when ``workers <= 1``)."""
+    if workers <= 1:
+        return run_stages(stages, params, targets, cache, instrument, cancel=cancel)
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(workers, thread_name_prefix="stage") as executor:
+        return run_stages(stages, params, targets, cache, instrument, executor, cancel)
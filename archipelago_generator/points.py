@@ -7,11 +7,20 @@ from typing import Tuple
 import numpy as np
 
 
-def poisson_disk_sampling(width: int, height: int, radius: float, rng: np.random.Generator) -> np.ndarray:
-    """Generate points using simple Poisson disk sampling."""
+def poisson_disk_sampling(
+    width: int, height: int, radius: float, rng: np.random.Generator, *, wrap: bool = False
+) -> np.ndarray:
+    """Generate points using simple Poisson disk sampling.
+
+    With ``wrap`` distances are measured on a torus, so copies of the result
+    placed side by side keep their spacing across the seams.
+    """
     cell_size = radius / np.sqrt(2)
     grid_width = int(np.ceil(width / cell_size))
     grid_height = int(np.ceil(height / cell_size))
+    # Wrapped grids need whole cells so the neighbourhood reaches across seams.
+    cell_w = width / grid_width if wrap else cell_size
+    cell_h = height / grid_height if wrap else cell_size
     grid = -np.ones((grid_height, grid_width), dtype=int)
 
     points = []
@@ -20,8 +29,8 @@ def poisson_disk_sampling(width: int, height: int, radius: float, rng: np.random
     def add_point(p: Tuple[float, float]):
         points.append(p)
         idx = len(points) - 1
-        gx = int(p[0] / cell_size)
-        gy = int(p[1] / cell_size)
+        gx = int(p[0] / cell_w)
+        gy = int(p[1] / cell_h)
         grid[gy, gx] = idx
         active.append(idx)
 
@@ -36,21 +45,28 @@ def poisson_disk_sampling(width: int, height: int, radius: float, rng: np.random
             r = rng.uniform(radius, 2 * radius)
             x = base[0] + np.cos(ang) * r
             y = base[1] + np.sin(ang) * r
-            if not (0 <= x < width and 0 <= y < height):
+            if wrap:
+                x, y = x % width, y % height
+            elif not (0 <= x < width and 0 <= y < height):
                 continue
-            gx = int(x / cell_size)
-            gy = int(y / cell_size)
-            xmin = max(gx - 2, 0)
-            xmax = min(gx + 3, grid_width)
-            ymin = max(gy - 2, 0)
-            ymax = min(gy + 3, grid_height)
+            gx = min(int(x / cell_w), grid_width - 1)
+            gy = min(int(y / cell_h), grid_height - 1)
+            if wrap:
+                rows = [yy % grid_height for yy in range(gy - 2, gy + 3)]
+                cols = [xx % grid_width for xx in range(gx - 2, gx + 3)]
+            else:
+                rows = range(max(gy - 2, 0), min(gy + 3, grid_height))
+                cols = range(max(gx - 2, 0), min(gx + 3, grid_width))
             too_close = False
-            for yy in range(ymin, ymax):
-                for xx in range(xmin, xmax):
+            for yy in rows:
+                for xx in cols:
                     pid = grid[yy, xx]
                     if pid >= 0:
                         px, py = points[pid]
-                        if (px - x) ** 2 + (py - y) ** 2 < radius ** 2:
+                        dx, dy = abs(px - x), abs(py - y)
+                        if wrap:
+                            dx, dy = min(dx, width - dx), min(dy, height - dy)
+                        if dx ** 2 + dy ** 2 < radius ** 2:
                             too_close = True
                             break
                 if too_close:
@@ -0,0 +1,135 @@
+"""Coarse-to-fine progressive generation for quick previews.
+
+:func:`generate_progressive` is a generator. It first yields a small map made
+with fewer cells on a downsampled grid, then bigger ones, and finally the
+full map. Every level uses the same seed. Archipelago noise is sampled at
+frequencies divided by the level's scale (``preview_scale``), and world noise
+is sampled in map-relative coordinates, so each preview shows the terrain of
+the final map. Coarse levels also use fewer elevation octaves. By default
+they only compute the layers a preview draws: no rivers, roads, cities or
+borders.
+
+Levels are computed lazily, when the consumer asks for the next one, so
+stopping the iteration (or closing the generator) means the expensive
+full-resolution stages never run. ``cancel`` is polled between pipeline
+stages and stops a level that is already running with
+:class:`~archipelago_generator.pipeline.Cancelled`.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import math
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+import numpy as np
+
+from .batch import KINDS
+from .pipeline import StageCache
+
+PREVIEW_SCALES = (0.125, 0.25, 0.5, 1.0)
+# Archipelago layers computed for coarse levels; the rest are left ``None``.
+PREVIEW_LAYERS = ("cells", "land", "elevation", "temperature", "rainfall", "moisture", "biome", "regions", "labels")
+MIN_SIZE = 16
+MIN_POINTS = 64
+
+
+@dataclass
+class Preview:
+    """One level of a progressive run.
+
+    ``map`` is an :class:`~archipelago_generator.generator.Archipelago`, or
+    a world dict for ``kind="world"``, at ``scale`` of the final size.
+    """
+
+    level: int
+    scale: float
+    map: Any
+
+    @property
+    def final(self) -> bool:
+        return self.scale >= 1.0
+
+
+def generate_progressive(
+    kind: str = "archipelago",
+    *,
+    scales: Sequence[float] = PREVIEW_SCALES,
+    preview_layers: Optional[Sequence[str]] = PREVIEW_LAYERS,
+    cache: Optional[StageCache] = None,
+    cancel: Optional[Callable[[], bool]] = None,
+    **params: Any,
+) -> Iterator[Preview]:
+    """Yield a :class:`Preview` per entry of ``scales``, coarsest first.
+
+    ``params`` are the keyword arguments of ``generate_archipelago`` or
+    ``generate_world``. A scale of 1 or more is the full map, generated with
+    ``params`` unchanged. Coarse levels keep the aspect ratio and are at
+    least :data:`MIN_SIZE` tiles on the short side; scales that would repeat
+    a level are skipped. With ``preview_layers=None`` coarse archipelago
+    levels compute every layer.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {KINDS}")
+    if kind == "world":
+        return _world_levels(scales, cache, cancel, params)
+    return _archipelago_levels(scales, preview_layers, cache, cancel, params)
+
+
+def _level_scales(scales: Sequence[float], width: int, height: int) -> list:
+    out: list = []
+    for scale in scales:
+        scale = 1.0 if scale >= 1.0 else min(max(scale, MIN_SIZE / min(width, height)), 1.0)
+        if not out or scale > out[-1]:
+            out.append(scale)
+    return out
+
+
+def _archipelago_levels(scales, layers, cache, cancel, kwargs) -> Iterator[Preview]:
+    from .generator import STAGES, Archipelago, ArchipelagoParams, generate_archipelago
+    from .pipeline import run_pipeline
+
+    kwargs = dict(kwargs)
+    instrument, workers = kwargs.pop("instrument", None), kwargs.pop("workers", 1)
+    params = ArchipelagoParams(**kwargs)
+    if params.seed is None:
+        params.seed = int(np.random.SeedSequence().generate_state(1)[0])
+    produced = {out for stage in STAGES for out in stage.outputs}
+    fields = [f.name for f in dataclasses.fields(Archipelago) if f.name in produced]
+    for level, scale in enumerate(_level_scales(scales, params.width, params.height)):
+        if scale >= 1.0:
+            yield Preview(level, 1.0, generate_archipelago(cache=cache, instrument=instrument, workers=workers,
+                                                           cancel=cancel, **dataclasses.asdict(params)))
+            continue
+        width, height = round(params.width * scale), round(params.height * scale)
+        actual = width / params.width
+        coarse = dataclasses.replace(
+            params,
+            width=width,
+            height=height,
+            point_count=max(round(params.point_count * actual * actual), MIN_POINTS),
+            noise_octaves=max(params.noise_octaves + round(math.log2(actual)), 1),
+            erosion_iterations=0,
+            preview_scale=params.preview_scale * actual,
+        )
+        names = [name for name in fields if layers is None or name in layers]
+        values = run_pipeline(STAGES, coarse, names, cache, instrument, workers, cancel)
+        values.update({name: None for name in fields if name not in values})
+        arch = Archipelago(width=width, height=height, **values)
+        if instrument is not None:
+            arch.profile = instrument.summary()
+        yield Preview(level, actual, arch)
+
+
+def _world_levels(scales, cache, cancel, kwargs) -> Iterator[Preview]:
+    from archipelago.generator import WorldParams, generate_world
+
+    full_width, full_height = kwargs.get("width", WorldParams.width), kwargs.get("height", WorldParams.height)
+    for level, scale in enumerate(_level_scales(scales, full_width, full_height)):
+        if scale >= 1.0:
+            yield Preview(level, 1.0, generate_world(cache=cache, cancel=cancel, **kwargs))
+            continue
+        width, height = round(full_width * scale), round(full_height * scale)
+        coarse = dict(kwargs, width=width, height=height, erosion_iterations=0)
+        yield Preview(level, width / full_width, generate_world(cache=cache, cancel=cancel, **coarse))
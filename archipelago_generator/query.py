@@ -0,0 +1,208 @@
+"""Batch spatial queries over a finished archipelago.
+
+:class:`SpatialQuery`, reached as ``arch.query``, answers point lookups for
+whole arrays of points at once: the cell, biome or region under a point,
+the nearest city, the cells in a box, and whether a point lies on a road,
+river or border. Each index is built the first time a query needs it:
+
+* a KD-tree over cell centroids. The few nearest centroids are tested for
+  containment, which is exact because cells are convex, and points none of
+  them contain fall back to an STRtree over the cells;
+* an STRtree per line kind (roads, rivers, borders);
+* a grid hash of cities, where each bucket lists every city that can be
+  nearest to a point inside it.
+
+Points are map coordinates, in the frame of ``arch.cells``: tile ``(i, j)``
+covers ``[j, j + 1) x [i, i + 1)``. Tile-based features (rivers, roads,
+cities) sit at tile centres. Results have the broadcast shape of ``x`` and
+``y``.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .generator import Archipelago
+
+LINE_KINDS = ("road", "river", "border")
+# Nearest centroids tested per point before falling back to the STRtree.
+CANDIDATES = 4
+
+
+def _points(x: Any, y: Any) -> Tuple[np.ndarray, np.ndarray, Tuple[int, ...]]:
+    x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    return x.ravel(), y.ravel(), x.shape
+
+
+class SpatialQuery:
+    """Vectorized spatial lookups on ``arch`` with lazily built indexes."""
+
+    def __init__(self, arch: Archipelago) -> None:
+        self.arch = arch
+        self._cells: Optional[np.ndarray] = None
+        self._kdtree = None
+        self._cell_tree = None
+        self._lines: Dict[str, Tuple[Any, np.ndarray]] = {}
+        self._city_grid: Optional[Tuple[float, int, int, np.ndarray, np.ndarray]] = None
+
+    # -- cells -------------------------------------------------------------
+
+    def _cell_index(self) -> np.ndarray:
+        if self._cells is None:
+            import shapely
+            from scipy.spatial import cKDTree
+
+            cells = np.asarray(self.arch.cells, dtype=object)
+            shapely.prepare(cells)
+            self._kdtree = cKDTree(shapely.get_coordinates(shapely.centroid(cells)))
+            self._cell_tree = shapely.STRtree(cells)
+            self._cells = cells
+        return self._cells
+
+    def cell_at(self, x: Any, y: Any) -> np.ndarray:
+        """Index of the cell containing each point, or ``-1`` off the map."""
+        import shapely
+
+        cells = self._cell_index()
+        px, py, shape = _points(x, y)
+        out = np.full(len(px), -1, dtype=np.int64)
+        if not len(cells) or not len(px):
+            return out.reshape(shape)
+        k = min(CANDIDATES, len(cells))
+        _, near = self._kdtree.query(np.column_stack([px, py]), k=k)
+        near = near.reshape(len(px), k)
+        hit = shapely.intersects_xy(cells[near], px[:, None], py[:, None])
+        found = hit.any(axis=1)
+        out[found] = near[found, hit[found].argmax(axis=1)]
+        rest = np.flatnonzero(~found)
+        if rest.size:
+            which, cell = self._cell_tree.query(shapely.points(px[rest], py[rest]), predicate="intersects")
+            # The lowest index wins where a point lies on several cells.
+            out[rest[which[::-1]]] = cell[::-1]
+        return out.reshape(shape)
+
+    def biome_at(self, x: Any, y: Any) -> np.ndarray:
+        """Biome name under each point, ``None`` off the map."""
+        biome = np.append(np.asarray(self.arch.biome, dtype=object), None)
+        return biome[self.cell_at(x, y)]
+
+    def region_at(self, x: Any, y: Any) -> np.ndarray:
+        """Region id under each point, ``-1`` off the map."""
+        return np.append(np.asarray(self.arch.regions), -1)[self.cell_at(x, y)]
+
+    def cells_in_bbox(self, minx: float, miny: float, maxx: float, maxy: float) -> np.ndarray:
+        """Sorted indices of the cells intersecting a box."""
+        import shapely
+
+        self._cell_index()
+        return np.sort(self._cell_tree.query(shapely.box(minx, miny, maxx, maxy), predicate="intersects"))
+
+    # -- lines -------------------------------------------------------------
+
+    def _line_index(self, kind: str) -> Tuple[Any, np.ndarray]:
+        if kind not in LINE_KINDS:
+            raise ValueError(f"kind must be one of {LINE_KINDS}")
+        if kind not in self._lines:
+            import shapely
+
+            lines = {"road": self.arch.road_lines, "river": self.arch.river_lines, "border": self.arch.borders}[kind]
+            geoms, index = [], []
+            for i, line in enumerate(lines):
+                if hasattr(line, "coords"):
+                    geom = line
+                else:
+                    coords = np.asarray(line, dtype=float).reshape(-1, 2)
+                    if len(coords) < 2:
+                        continue
+                    # Tile-indexed lines run through tile centres.
+                    geom = shapely.linestrings(coords + 0.5)
+                geoms.append(geom)
+                index.append(i)
+            self._lines[kind] = (shapely.STRtree(geoms), np.array(index, dtype=np.int64))
+        return self._lines[kind]
+
+    def invalidate(self, *kinds: str) -> None:
+        """Drop the line indexes of ``kinds`` (all by default) after the lines change."""
+        for kind in kinds or LINE_KINDS:
+            self._lines.pop(kind, None)
+
+    def near_line(self, kind: str, x: Any, y: Any, tolerance: float = 0.5) -> np.ndarray:
+        """Whether each point is within ``tolerance`` of a ``kind`` line (road, river or border)."""
+        import shapely
+
+        tree, _ = self._line_index(kind)
+        px, py, shape = _points(x, y)
+        out = np.zeros(len(px), dtype=bool)
+        if len(px) and len(tree.geometries):
+            which, _ = tree.query(shapely.points(px, py), predicate="dwithin", distance=tolerance)
+            out[which] = True
+        return out.reshape(shape)
+
+    def nearest_line(self, kind: str, x: Any, y: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """``(index, distance)`` of the nearest ``kind`` line to each point; ``-1`` and ``inf`` if none."""
+        import shapely
+
+        tree, index = self._line_index(kind)
+        px, py, shape = _points(x, y)
+        line = np.full(len(px), -1, dtype=np.int64)
+        dist = np.full(len(px), np.inf)
+        if len(px) and len(tree.geometries):
+            (which, geom), d = tree.query_nearest(shapely.points(px, py), return_distance=True, all_matches=False)
+            line[which] = index[geom]
+            dist[which] = d
+        return line.reshape(shape), dist.reshape(shape)
+
+    def on_road(self, x: Any, y: Any, tolerance: float = 0.5) -> np.ndarray:
+        return self.near_line("road", x, y, tolerance)
+
+    def on_river(self, x: Any, y: Any, tolerance: float = 0.5) -> np.ndarray:
+        return self.near_line("river", x, y, tolerance)
+
+    def on_border(self, x: Any, y: Any, tolerance: float = 0.5) -> np.ndarray:
+        return self.near_line("border", x, y, tolerance)
+
+    # -- cities ------------------------------------------------------------
+
+    def _city_index(self) -> Tuple[float, int, int, np.ndarray, np.ndarray]:
+        if self._city_grid is None:
+            arch = self.arch
+            cities = np.asarray(arch.cities, dtype=float).reshape(-1, 2)[:, ::-1] + 0.5
+            n = len(cities)
+            size = max(np.sqrt(arch.width * arch.height / max(n, 1)), 1.0)
+            cols, rows = int(np.ceil(arch.width / size)), int(np.ceil(arch.height / size))
+            # Every city that can be nearest to some point of a bucket: those
+            # within the bucket's nearest-city distance plus its diagonal.
+            cy, cx = np.mgrid[:rows, :cols]
+            centres = np.column_stack([(cx.ravel() + 0.5) * size, (cy.ravel() + 0.5) * size])
+            lists = [np.zeros(0, dtype=np.int64)] * len(centres)
+            if n:
+                for start in range(0, len(centres), 4096):
+                    d = np.linalg.norm(centres[start:start + 4096, None] - cities[None], axis=2)
+                    reach = d.min(axis=1, keepdims=True) + size * np.sqrt(2)
+                    for b, row in enumerate(d <= reach):
+                        lists[start + b] = np.flatnonzero(row)
+            width = max((len(c) for c in lists), default=0)
+            table = np.full((len(lists), max(width, 1)), -1, dtype=np.int64)
+            for b, c in enumerate(lists):
+                table[b, :len(c)] = c
+            self._city_grid = (size, rows, cols, table, cities)
+        return self._city_grid
+
+    def nearest_city(self, x: Any, y: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """``(index, distance)`` of the nearest city to each point; ``-1`` and ``inf`` without cities."""
+        size, rows, cols, table, cities = self._city_index()
+        px, py, shape = _points(x, y)
+        if not len(cities):
+            return np.full(shape, -1, dtype=np.int64), np.full(shape, np.inf)
+        bucket = (np.clip((py // size).astype(np.int64), 0, rows - 1) * cols
+                  + np.clip((px // size).astype(np.int64), 0, cols - 1))
+        cand = table[bucket]
+        pos = cities[np.maximum(cand, 0)]
+        d = np.hypot(pos[..., 0] - px[:, None], pos[..., 1] - py[:, None])
+        d[cand < 0] = np.inf
+        best = d.argmin(axis=1)
+        rows_ = np.arange(len(px))
+        return cand[rows_, best].reshape(shape), d[rows_, best].reshape(shape)
@@ -2,37 +2,144 @@
 
 from __future__ import annotations
 
-from typing import List, Tuple, Optional, Dict
+import os
+import struct
+import zlib
+from typing import TYPE_CHECKING, BinaryIO, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
-from shapely.geometry import Polygon, Point
-from shapely.strtree import STRtree
-from shapely.prepared import prep
-from perlin_noise import PerlinNoise
 
+from .instrument import count
 
-def rasterize(cells: List[Polygon], values: np.ndarray, width: int, height: int) -> np.ndarray:
-    """Rasterize polygon values to a regular grid using ``STRtree`` for speed."""
+if TYPE_CHECKING:
+    from shapely.geometry import Polygon
 
+
+def rasterize_labels(cells: List[Polygon], width: int, height: int) -> np.ndarray:
+    """Return the index of the cell containing each tile centre.
+
+    Tiles whose centre lies in no cell (e.g. exactly on a shared edge) are
+    labelled ``-1``. Each polygon only tests the tile centres inside its
+    bounding box, using shapely's vectorized ``contains_xy`` so there is no
+    per-pixel Python.
+    """
+
+    import shapely
+
+    labels = np.full((height, width), -1, dtype=np.int32)
+    for idx, poly in enumerate(cells):
+        if poly.is_empty:
+            continue
+        minx, miny, maxx, maxy = poly.bounds
+        x0 = max(int(np.ceil(minx - 0.5)), 0)
+        x1 = min(int(np.floor(maxx - 0.5)), width - 1)
+        y0 = max(int(np.ceil(miny - 0.5)), 0)
+        y1 = min(int(np.floor(maxy - 0.5)), height - 1)
+        if x1 < x0 or y1 < y0:
+            continue
+        xs = np.arange(x0, x1 + 1) + 0.5
+        ys = np.arange(y0, y1 + 1) + 0.5
+        inside = shapely.contains_xy(poly, xs[None, :], ys[:, None])
+        labels[y0:y1 + 1, x0:x1 + 1][inside] = idx
+    return labels
+
+
+def rasterize(
+    cells: List[Polygon],
+    values: np.ndarray,
+    width: int,
+    height: int,
+    labels: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Rasterize polygon values to a regular grid.
+
+    ``labels`` may be a precomputed :func:`rasterize_labels` grid, in which
+    case rasterizing another per-cell attribute is a single array lookup.
+    """
+
+    if labels is None:
+        labels = rasterize_labels(cells, width, height)
     grid = np.zeros((height, width), dtype=values.dtype)
-    tree = STRtree(cells)
-    prepared = [prep(c) for c in cells]
-
-    for y in range(height):
-        for x in range(width):
-            pt_geom = Point(x + 0.5, y + 0.5)
-            candidate_idxs = tree.query(pt_geom, predicate="intersects")
-            for idx in candidate_idxs:
-                if prepared[idx].contains(pt_geom):
-                    grid[y, x] = values[idx]
-                    break
+    inside = labels >= 0
+    grid[inside] = values[labels[inside]]
     return grid
 
 
+def rasterize_barycentric(
+    sites: np.ndarray,
+    values: np.ndarray,
+    width: int,
+    height: int,
+    *,
+    out: Optional[np.ndarray] = None,
+    band_rows: int = 256,
+) -> np.ndarray:
+    """Interpolate per-site values linearly over the Delaunay triangles of ``sites``.
+
+    Unlike :func:`rasterize`, which gives every tile the value of its cell
+    and so makes a flat plateau per cell, the result is continuous. All tile
+    centres of a band of rows are located in the triangulation with one
+    ``find_simplex`` call, and the barycentric weights are folded into one
+    plane per triangle, so there is no per-pixel Python. Tiles outside the convex hull of the sites take the value of the
+    nearest site, which is the value of their cell.
+
+    ``values`` is ``(n,)``, or ``(k, n)`` to rasterize ``k`` fields, such as
+    elevation, moisture and temperature, in the same pass. The result is
+    ``(height, width)`` or ``(k, height, width)``, written into ``out`` when
+    given.
+    """
+
+    from scipy.spatial import Delaunay, cKDTree
+
+    sites = np.asarray(sites, dtype=float)
+    values = np.asarray(values)
+    stacked = values if values.ndim == 2 else values[None]
+    shape = (len(stacked), height, width) if values.ndim == 2 else (height, width)
+    if out is None:
+        out = np.empty(shape, dtype=np.result_type(values.dtype, np.float32))
+    elif out.shape != shape:
+        raise ValueError(f"out has shape {out.shape}, expected {shape}")
+    grid = out if values.ndim == 2 else out[None]
+
+    # Linear interpolation over a triangle is a plane, so each triangle gets
+    # its value and gradient at the origin once and every tile costs one
+    # gather and two multiply-adds per field.
+    tri = Delaunay(sites)
+    corner = stacked[:, tri.simplices]
+    edges = corner[..., :2] - corner[..., 2:]
+    gradient = np.einsum("kti,tij->ktj", edges, tri.transform[:, :2])
+    offset = corner[..., 2] - np.einsum("ktj,tj->kt", gradient, tri.transform[:, 2])
+    flat = ~np.isfinite(gradient).all(axis=(0, 2)) | ~np.isfinite(offset).all(axis=0)
+    gradient[:, flat] = 0
+    offset[:, flat] = corner[:, flat].mean(axis=2)
+
+    tree = None
+    xs = np.arange(width) + 0.5
+    for y0 in range(0, height, band_rows):
+        y1 = min(y0 + band_rows, height)
+        pts = np.empty(((y1 - y0) * width, 2))
+        pts[:, 0] = np.tile(xs, y1 - y0)
+        pts[:, 1] = np.repeat(np.arange(y0, y1) + 0.5, width)
+        simplex = tri.find_simplex(pts)
+        outside = np.flatnonzero(simplex < 0)
+        simplex[outside] = 0
+        band = grid[:, y0:y1]
+        for k in range(len(stacked)):
+            g = gradient[k, simplex]
+            band[k] = (g[:, 0] * pts[:, 0] + g[:, 1] * pts[:, 1] + offset[k, simplex]).reshape(y1 - y0, width)
+        if outside.size:
+            if tree is None:
+                tree = cKDTree(sites)
+            band[:, outside // width, outside % width] = stacked[:, tree.query(pts[outside])[1]]
+    return out
+
+
 class Rasterizer:
     """Utility to rasterize polylines into boolean masks."""
 
     def __init__(self, width: int, height: int, seed: int | None = None) -> None:
+        from perlin_noise import PerlinNoise
+
         self.width = width
         self.height = height
         self.noise = PerlinNoise(octaves=1, seed=seed or 0)
@@ -48,6 +155,7 @@ class Rasterizer:
         if len(polyline) < 2:
             return polyline
 
+        count("noise_samples", len(polyline) - 2)
         jit: List[Tuple[float, float]] = [polyline[0]]
         for i in range(1, len(polyline) - 1):
             x, y = polyline[i]
@@ -77,27 +185,49 @@ class Rasterizer:
         """Rasterize a single polyline to a boolean mask."""
 
         mask = np.zeros((self.height, self.width), dtype=bool)
+        self.paint_polyline(mask, polyline, brush_radius, sampling_density)
+        return mask
+
+    def paint_polyline(
+        self,
+        mask: np.ndarray,
+        polyline: List[Tuple[float, float]],
+        brush_radius: float,
+        sampling_density: float,
+        origin: Tuple[int, int] = (0, 0),
+    ) -> None:
+        """Paint a polyline into ``mask``, a window of the map whose top-left tile is ``origin``.
+
+        Tiles outside the window are skipped, so repainting part of a map
+        only costs the segments that reach it.
+        """
+
         if len(polyline) < 2:
-            return mask
+            return
+        oy, ox = origin
+        ylim = min(oy + mask.shape[0], self.height) - 1
+        xlim = min(ox + mask.shape[1], self.width) - 1
 
         for p0, p1 in zip(polyline[:-1], polyline[1:]):
             x0, y0 = p0
             x1, y1 = p1
+            if (min(x0, x1) - brush_radius > xlim + 1 or max(x0, x1) + brush_radius < ox - 1
+                    or min(y0, y1) - brush_radius > ylim + 1 or max(y0, y1) + brush_radius < oy - 1):
+                continue
             seg_len = ((x1 - x0) ** 2 + (y1 - y0) ** 2) ** 0.5
             samples = max(int(np.ceil(seg_len * sampling_density)), 1)
             for i in range(samples + 1):
                 t = i / samples
                 x = x0 + (x1 - x0) * t
                 y = y0 + (y1 - y0) * t
-                xmin = int(max(0, np.floor(x - brush_radius)))
-                xmax = int(min(self.width - 1, np.ceil(x + brush_radius)))
-                ymin = int(max(0, np.floor(y - brush_radius)))
-                ymax = int(min(self.height - 1, np.ceil(y + brush_radius)))
+                xmin = int(max(ox, np.floor(x - brush_radius)))
+                xmax = int(min(xlim, np.ceil(x + brush_radius)))
+                ymin = int(max(oy, np.floor(y - brush_radius)))
+                ymax = int(min(ylim, np.ceil(y + brush_radius)))
                 for yy in range(ymin, ymax + 1):
                     for xx in range(xmin, xmax + 1):
                         if (xx - x) ** 2 + (yy - y) ** 2 <= brush_radius ** 2:
-                            mask[yy, xx] = True
-        return mask
+                            mask[yy - oy, xx - ox] = True
 
     def _combine_masks(self, masks: List[np.ndarray]) -> np.ndarray:
         combined = np.zeros((self.height, self.width), dtype=bool)
@@ -136,3 +266,161 @@ class Rasterizer:
         return self._combine_masks(masks)
 
 
+# Palette slots appended after the biome colours in ``export_png``.
+FEATURE_LAYERS = ["unknown", "river", "wide river", "road", "city"]
+
+
+def palette_bands(
+    base: Callable[[int, int], np.ndarray],
+    height: int,
+    layers: Sequence[Tuple[int, Callable[[int, int], np.ndarray]]] = (),
+    points: Sequence[Tuple[int, Sequence[Tuple[int, int]]]] = (),
+    *,
+    band_rows: int = 256,
+    scale: int = 1,
+) -> Iterable[np.ndarray]:
+    """Yield ``uint8`` palette index bands composited from map layers.
+
+    ``base(y0, y1)`` returns the background indices for rows ``y0:y1``.
+    Each ``(index, mask)`` in ``layers`` paints ``index`` wherever
+    ``mask(y0, y1)`` is true, in order, so later layers win. ``points`` paints
+    single ``(y, x)`` tiles such as cities on top. Only one band of
+    ``band_rows`` source rows (times ``scale`` squared) is alive at a time.
+    """
+
+    for y0 in range(0, height, band_rows):
+        y1 = min(y0 + band_rows, height)
+        idx = np.array(base(y0, y1), dtype=np.uint8)
+        for index, mask in layers:
+            idx[mask(y0, y1)] = index
+        for index, coords in points:
+            pts = np.asarray(coords, dtype=np.int64).reshape(-1, 2)
+            sel = (pts[:, 0] >= y0) & (pts[:, 0] < y1)
+            idx[pts[sel, 0] - y0, pts[sel, 1]] = index
+        if scale > 1:
+            idx = np.repeat(np.repeat(idx, scale, axis=0), scale, axis=1)
+        yield idx
+
+
+def _png_chunk(fh: BinaryIO, tag: bytes, data: bytes) -> None:
+    fh.write(struct.pack(">I", len(data)))
+    fh.write(tag)
+    fh.write(data)
+    fh.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(tag)) & 0xFFFFFFFF))
+
+
+def write_png(
+    fp: Union[str, os.PathLike, BinaryIO],
+    width: int,
+    height: int,
+    palette: Sequence[Tuple[int, int, int]],
+    bands: Iterable[np.ndarray],
+    *,
+    compress_level: int = 6,
+) -> None:
+    """Write an 8-bit palette PNG from an iterable of ``uint8`` row bands.
+
+    The image data is deflated incrementally as bands arrive, so the whole
+    index image never has to exist in memory (Pillow can only save complete
+    images, which is why the encoder is written against ``zlib`` directly).
+    """
+
+    if len(palette) > 256:
+        raise ValueError("palette PNGs support at most 256 colours")
+    if isinstance(fp, (str, bytes)) or hasattr(fp, "__fspath__"):
+        with open(fp, "wb") as fh:
+            write_png(fh, width, height, palette, bands, compress_level=compress_level)
+        return
+
+    fp.write(b"\x89PNG\r\n\x1a\n")
+    _png_chunk(fp, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0))
+    _png_chunk(fp, b"PLTE", bytes(int(c) for rgb in palette for c in rgb))
+    comp = zlib.compressobj(compress_level)
+    rows = 0
+    for band in bands:
+        band = np.asarray(band, dtype=np.uint8)
+        if band.shape[1] != width:
+            raise ValueError(f"band width {band.shape[1]} != image width {width}")
+        raw = np.zeros((band.shape[0], width + 1), dtype=np.uint8)  # filter 0
+        raw[:, 1:] = band
+        rows += band.shape[0]
+        data = comp.compress(raw.tobytes())
+        if data:
+            _png_chunk(fp, b"IDAT", data)
+    if rows != height:
+        raise ValueError(f"received {rows} rows, expected {height}")
+    _png_chunk(fp, b"IDAT", comp.flush())
+    _png_chunk(fp, b"IEND", b"")
+
+
+def export_png(
+    arch,
+    fp: Union[str, os.PathLike, BinaryIO],
+    *,
+    scale: int = 1,
+    band_rows: int = 256,
+    compress_level: int = 6,
+    region: Optional[Tuple[int, int, int, int]] = None,
+    biome: Optional[np.ndarray] = None,
+) -> None:
+    """Export an :class:`~archipelago_generator.generator.Archipelago` as PNG.
+
+    Biomes come from the cell-label raster, overlaid with rivers, roads and
+    cities using the colours of the terminal renderer. Each tile becomes a
+    ``scale`` x ``scale`` block of pixels. ``region`` is an ``(x, y, width,
+    height)`` window in tiles; only that part of the map is encoded.
+    ``biome`` replaces the cell biomes with a full-map raster of indices into
+    ``BIOMES`` (``len(BIOMES)`` for unknown), such as one frame of
+    :func:`~archipelago_generator.seasons.seasonal_biomes`.
+    """
+
+    from .biomes import BIOMES
+    from .render import BIOME_GLYPHS, FEATURE_GLYPHS
+
+    palette = [BIOME_GLYPHS[b][1] for b in BIOMES] + [(255, 255, 255)]
+    palette += [FEATURE_GLYPHS[f][1] for f in FEATURE_LAYERS[1:]]
+    unknown, river, wide, road, city = range(len(BIOMES), len(palette))
+
+    lookup = {b: i for i, b in enumerate(BIOMES)}
+    # One code per cell plus a trailing ``unknown`` entry picked up by label -1.
+    codes = np.array([lookup.get(b, unknown) for b in arch.biome] + [unknown], dtype=np.uint8)
+
+    x, y, width, height = region if region is not None else (0, 0, arch.width, arch.height)
+    if width <= 0 or height <= 0 or x < 0 or y < 0 or x + width > arch.width or y + height > arch.height:
+        raise ValueError(f"region {region} is outside the {arch.width}x{arch.height} map")
+
+    def window(grid):
+        return lambda y0, y1: grid[y + y0:y + y1, x:x + width]
+
+    labels, river_map = window(arch.labels), window(arch.river_map)
+    river_width, road_map = window(arch.river_width), window(arch.road_map)
+    cities = [(cy - y, cx - x) for cy, cx in arch.cities if 0 <= cx - x < width]
+
+    if biome is None:
+        def base(y0, y1):
+            return codes[labels(y0, y1)]
+    elif np.shape(biome) != (arch.height, arch.width):
+        raise ValueError(f"biome raster shape {np.shape(biome)} != map shape {(arch.height, arch.width)}")
+    else:
+        base = window(biome)
+
+    bands = palette_bands(
+        base,
+        height,
+        [
+            (river, lambda y0, y1: river_map(y0, y1) > 0),
+            (wide, lambda y0, y1: (river_map(y0, y1) > 0) & (river_width(y0, y1) > 2)),
+            (road, lambda y0, y1: road_map(y0, y1) != 0),
+        ],
+        [(city, cities)],
+        band_rows=band_rows,
+        scale=scale,
+    )
+    write_png(
+        fp,
+        width * scale,
+        height * scale,
+        palette,
+        bands,
+        compress_level=compress_level,
+    )
@@ -2,12 +2,15 @@
 
 from __future__ import annotations
 
-from blessed import Terminal
+from typing import TYPE_CHECKING
+
 import numpy as np
 
-from .generator import Archipelago
 from .rasterizer import rasterize
 
+if TYPE_CHECKING:
+    from .generator import Archipelago
+
 # Simple glyph and color mapping for biomes
 BIOME_GLYPHS = {
     "ocean": ("~", (0, 0, 200)),
@@ -40,7 +43,9 @@ def render_archipelago(arch: Archipelago, show_legend: bool = False) -> None:
     show_legend:
         If ``True``, print a legend of biome glyphs below the map.
     """
-    grid = rasterize(arch.cells, arch.biome, arch.width, arch.height)
+    from blessed import Terminal
+
+    grid = rasterize(arch.cells, arch.biome, arch.width, arch.height, labels=arch.labels)
     term = Terminal()
     lines: list[str] = []
     cities = set(arch.cities)
@@ -9,16 +9,41 @@ lightweight A* search connecting consecutive cities.
 
 from __future__ import annotations
 
-from typing import List, Tuple
+import heapq
+from typing import TYPE_CHECKING, List, Optional, Tuple
 
 
 SEA_LEVEL = 0.26
 
 import numpy as np
 
+if TYPE_CHECKING:
+    from .voronoi import CellGraph
+
+
+def grid_downslope(elevation: np.ndarray) -> np.ndarray:
+    """Return the flat index of each tile's lowest lower 4-neighbour, or ``-1``.
+
+    Neighbours are tried up, down, left, right and must be strictly lower, so
+    ties go to the first of them. The result is an ``int32`` array shaped
+    like ``elevation``.
+    """
+
+    height, width = elevation.shape
+    padded = np.pad(np.asarray(elevation), 1, constant_values=np.inf)
+    index = np.arange(height * width, dtype=np.int32).reshape(height, width)
+    best = np.array(elevation, copy=True)
+    downslope = np.full((height, width), -1, dtype=np.int32)
+    for dy, dx in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+        neighbour = padded[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+        lower = neighbour < best
+        best[lower] = neighbour[lower]
+        downslope[lower] = (index + (dy * width + dx))[lower]
+    return downslope
+
 
 def compute_water_flux(
-    elevation: np.ndarray, *, sea_level: float = SEA_LEVEL
+    elevation: np.ndarray, *, sea_level: float = SEA_LEVEL, compact: bool = False
 ) -> tuple[np.ndarray, np.ndarray]:
     """Compute water flux and downslope for each tile.
 
@@ -26,6 +51,10 @@ def compute_water_flux(
     ----------
     elevation : np.ndarray
         Normalized elevation grid (0..1).
+    compact : bool
+        Return ``float32`` flux and flat ``int32`` downslope indices (see
+        :func:`grid_downslope`) instead of ``float64`` flux and ``(H, W, 2)``
+        coordinates.
 
     Returns
     -------
@@ -34,28 +63,13 @@ def compute_water_flux(
     """
 
     height, width = elevation.shape
-    downslope = np.full((height, width, 2), -1, dtype=int)
-    for y in range(height):
-        for x in range(width):
-            min_elev = elevation[y, x]
-            best: tuple[int, int] | None = None
-            for dy, dx in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                ny, nx = y + dy, x + dx
-                if 0 <= ny < height and 0 <= nx < width and elevation[ny, nx] < min_elev:
-                    min_elev = elevation[ny, nx]
-                    best = (ny, nx)
-            if best is not None:
-                downslope[y, x] = best
-
-    water_flux = np.ones((height, width))
-    order = [(y, x) for y in range(height) for x in range(width)]
-    order.sort(key=lambda p: -elevation[p])
-    for y, x in order:
-        ny, nx = downslope[y, x]
-        if ny >= 0:
-            water_flux[ny, nx] += water_flux[y, x]
-
-    return water_flux, downslope
+    flat = grid_downslope(elevation)
+    flux = accumulate_flux(flat.ravel(), np.ones(height * width)).reshape(height, width)
+    if compact:
+        return flux.astype(np.float32), flat
+    downslope = np.stack(np.divmod(flat, width), axis=-1).astype(int)
+    downslope[flat < 0] = -1
+    return flux, downslope
 
 
 def trace_rivers(
@@ -65,17 +79,25 @@ def trace_rivers(
     *,
     min_flux: float = 3.0,
     sea_level: float = SEA_LEVEL,
+    compact: bool = False,
 ) -> tuple[np.ndarray, np.ndarray, List[List[Tuple[int, int]]]]:
-    """Trace river paths following downslope until reaching sea level."""
+    """Trace river paths following downslope until reaching sea level.
+
+    ``downslope`` holds ``(y, x)`` pairs or flat indices. With ``compact``
+    the river ids are ``int32`` and the widths ``uint8``.
+    """
 
     height, width = elevation.shape
-    river_map = np.zeros((height, width), dtype=int)
-    river_width = np.zeros((height, width), dtype=int)
+    river_map = np.zeros((height, width), dtype=np.int32 if compact else int)
+    river_width = np.zeros((height, width), dtype=np.uint8 if compact else int)
+    flat = downslope.ndim == 2
     river_id = 1
     lines: List[List[Tuple[int, int]]] = []
     visited: set[tuple[int, int]] = set()
     coords = [(y, x) for y in range(height) for x in range(width) if water_flux[y, x] >= min_flux]
-    coords.sort(key=lambda p: water_flux[p], reverse=True)
+    # Start from the sources so each trace runs down a whole river; a trace
+    # ends on the tile where it joins one traced earlier.
+    coords.sort(key=lambda p: water_flux[p])
 
     for y, x in coords:
         if (y, x) not in visited:
@@ -83,12 +105,13 @@ def trace_rivers(
             line: List[Tuple[int, int]] = []
             while elevation[cy, cx] >= sea_level:
                 if (cy, cx) in visited:
+                    line.append((cx, cy))
                     break
                 visited.add((cy, cx))
                 river_map[cy, cx] = river_id
                 river_width[cy, cx] = int(max(1, np.log2(water_flux[cy, cx])))
                 line.append((cx, cy))
-                ny, nx = downslope[cy, cx]
+                ny, nx = divmod(int(downslope[cy, cx]), width) if flat else downslope[cy, cx]
                 if ny < 0 or elevation[ny, nx] < sea_level:
                     break
                 cy, cx = ny, nx
@@ -99,14 +122,123 @@ def trace_rivers(
     return river_map, river_width, lines
 
 
-
-
 def compute_rivers(
-    elevation: np.ndarray, *, sea_level: float = SEA_LEVEL
+    elevation: np.ndarray, *, sea_level: float = SEA_LEVEL, min_flux: float = 3.0, compact: bool = False
 ) -> tuple[np.ndarray, np.ndarray, List[List[Tuple[int, int]]]]:
     """Convenience wrapper returning ``(river_map, river_width, lines)``."""
 
-    flux, downslope = compute_water_flux(elevation, sea_level=sea_level)
-    return trace_rivers(flux, downslope, elevation, sea_level=sea_level)
+    flux, downslope = compute_water_flux(elevation, sea_level=sea_level, compact=compact)
+    return trace_rivers(flux, downslope, elevation, min_flux=min_flux, sea_level=sea_level, compact=compact)
+
 
+def accumulate_flux(downslope: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Sum ``weights`` down the drainage forest given by ``downslope``.
+
+    ``downslope[i]`` is the index ``i`` drains into, or ``-1``. Nodes are
+    processed in topological waves (Kahn's algorithm), each wave a handful of
+    array operations, so the cost is linear in the number of nodes.
+    """
+
+    flux = np.array(weights, dtype=float)
+    n = len(downslope)
+    drains = downslope >= 0
+    pending = np.bincount(downslope[drains], minlength=n)
+    wave = np.flatnonzero(pending == 0)
+    while wave.size:
+        wave = wave[drains[wave]]
+        target = downslope[wave]
+        np.add.at(flux, target, flux[wave])
+        np.subtract.at(pending, target, 1)
+        target = np.unique(target)
+        wave = target[pending[target] == 0]
+    return flux
+
+
+def route_cells(
+    graph: CellGraph, elevation: np.ndarray, *, sea_level: float = SEA_LEVEL
+) -> tuple[np.ndarray, np.ndarray]:
+    """Route water over the cells of ``graph``.
+
+    Depressions are filled with a priority flood seeded from the sea cells,
+    so every land cell drains to the sea. Returns ``(downslope, filled)``:
+    the neighbour each cell drains into (``-1`` for sea cells) and the filled
+    elevation, which strictly decreases along every drainage path.
+    """
+
+    n = len(graph)
+    filled = np.array(elevation, dtype=float)
+    downslope = np.full(n, -1, dtype=np.int64)
+    seeds = np.flatnonzero(filled < sea_level)
+    if seeds.size == 0:
+        seeds = np.array([int(np.argmin(filled))])
+    indptr, neighbor, _ = graph.csr()
+    indptr, neighbor = indptr.tolist(), neighbor.tolist()
+    height = filled.tolist()
+    done = [False] * n
+    for i in seeds.tolist():
+        done[i] = True
+    heap = [(height[i], i) for i in seeds.tolist()]
+    heapq.heapify(heap)
+    while heap:
+        h, i = heapq.heappop(heap)
+        for j in neighbor[indptr[i]:indptr[i + 1]]:
+            if done[j]:
+                continue
+            done[j] = True
+            # Raise pits just above their spill point so flats keep draining.
+            if height[j] <= h:
+                height[j] = h + 1e-9
+            downslope[j] = i
+            heapq.heappush(heap, (height[j], j))
+    return downslope, np.array(height)
+
+
+def compute_cell_rivers(
+    graph: CellGraph,
+    elevation: np.ndarray,
+    *,
+    sea_level: float = SEA_LEVEL,
+    min_flux: float = 4.0,
+    weights: Optional[np.ndarray] = None,
+) -> tuple[np.ndarray, np.ndarray, List[List[Tuple[float, float]]]]:
+    """Mesh counterpart of :func:`compute_rivers` working on Voronoi cells.
+
+    ``weights`` is the water each cell contributes (one per cell by default).
+    Cells whose accumulated flux reaches ``min_flux`` carry a river. Returns
+    ``(flux, width, lines)`` where ``flux`` and ``width`` are per cell and
+    each line runs through cell centroids and the midpoints of the shared
+    edges between them, ending on the coast.
+    """
 
+    n = len(graph)
+    downslope, _ = route_cells(graph, elevation, sea_level=sea_level)
+    flux = accumulate_flux(downslope, np.ones(n) if weights is None else weights)
+    sea = np.asarray(elevation) < sea_level
+    river = ~sea & (flux >= min_flux) & (downslope >= 0)
+    width = np.where(river, np.maximum(1, np.log2(np.maximum(flux, 1))), 0).astype(int)
+
+    feeds = np.bincount(downslope[river], minlength=n)
+    sources = np.flatnonzero(river & (feeds == 0))
+    sources = sources[np.argsort(-flux[sources], kind="stable")]
+    edge_of = {(a, b): k for k, (a, b) in enumerate(graph.edges.tolist())}
+    centroids = graph.centroids
+    midpoints = graph.edge_midpoints
+    visited = np.zeros(n, dtype=bool)
+    lines: List[List[Tuple[float, float]]] = []
+    for i in sources.tolist():
+        line = [tuple(centroids[i])]
+        visited[i] = True
+        while True:
+            d = int(downslope[i])
+            if d < 0:  # the outlet of a map without sea
+                break
+            line.append(tuple(midpoints[edge_of[(min(i, d), max(i, d))]]))
+            if sea[d]:
+                break
+            line.append(tuple(centroids[d]))
+            if visited[d]:
+                break
+            visited[d] = True
+            i = d
+        lines.append([(float(x), float(y)) for x, y in line])
+    return flux, width, lines
@@ -2,12 +2,17 @@
 
 from __future__ import annotations
 
-from typing import List, Tuple
+from array import array
+from typing import TYPE_CHECKING, List, Tuple
 import heapq
+import math
 
 import numpy as np
-from perlin_noise import PerlinNoise
-from shapely.geometry import LineString
+
+from .instrument import count
+
+if TYPE_CHECKING:
+    from perlin_noise import PerlinNoise
 
 SEA_LEVEL = 0.26
 
@@ -18,58 +23,85 @@ def _astar(start: tuple[int, int], goal: tuple[int, int], cost_grid: np.ndarray)
     height, width = cost_grid.shape
     open_set: list[tuple[float, tuple[int, int]]] = []
     heapq.heappush(open_set, (0.0, start))
-    came_from: dict[tuple[int, int], tuple[int, int]] = {}
-    g: dict[tuple[int, int], float] = {start: 0.0}
+    # Flat per-tile arrays rather than dicts keyed by tuples: 12 bytes a
+    # tile instead of well over a hundred per visited tile on long searches.
+    g = array("d", [math.inf]) * (height * width)
+    came_from = array("i", [-1]) * (height * width)
+    g[start[0] * width + start[1]] = 0.0
 
     def heur(a: tuple[int, int], b: tuple[int, int]) -> float:
         return abs(a[0] - b[0]) + abs(a[1] - b[1])
 
+    expansions = 0
     while open_set:
         _, current = heapq.heappop(open_set)
+        expansions += 1
         if current == goal:
             break
+        here = current[0] * width + current[1]
         for dy, dx in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
             ny, nx = current[0] + dy, current[1] + dx
             if not (0 <= ny < height and 0 <= nx < width):
                 continue
-            new_cost = g[current] + cost_grid[ny, nx]
-            if (ny, nx) not in g or new_cost < g[(ny, nx)]:
-                g[(ny, nx)] = new_cost
+            new_cost = g[here] + float(cost_grid[ny, nx])
+            there = ny * width + nx
+            if new_cost < g[there]:
+                g[there] = new_cost
                 priority = new_cost + heur((ny, nx), goal)
                 heapq.heappush(open_set, (priority, (ny, nx)))
-                came_from[(ny, nx)] = current
+                came_from[there] = here
 
+    count("astar_expansions", expansions)
     path: list[tuple[int, int]] = []
-    cur = goal
-    if cur not in came_from and cur != start:
+    cur = goal[0] * width + goal[1]
+    origin = start[0] * width + start[1]
+    if came_from[cur] < 0 and cur != origin:
         return path
-    while cur != start:
-        path.append(cur)
+    while cur != origin:
+        path.append(divmod(cur, width))
         cur = came_from[cur]
     path.append(start)
     path.reverse()
     return path
 
 
-def _distort_line(line: LineString, noise: PerlinNoise, *, amplitude: float, frequency: float) -> LineString:
-    """Return a distorted copy of ``line`` using 1D noise."""
-    if line.length == 0:
-        return line
-    (x1, y1), (x2, y2) = line.coords[0], line.coords[-1]
-    vec = np.array([x2 - x1, y2 - y1])
-    norm = np.array([-vec[1], vec[0]])
-    if np.allclose(norm, 0):
-        return line
-    norm = norm / np.linalg.norm(norm)
-    steps = max(int(line.length / 5), 2)
-    pts = []
-    for i in range(steps + 1):
-        t = i / steps
-        x = x1 + vec[0] * t
-        y = y1 + vec[1] * t
-        offset = noise(t * frequency) * amplitude
-        pts.append((x + norm[0] * offset, y + norm[1] * offset))
-    return LineString(pts)
+def road_cost(elevation: np.ndarray, *, sea_level: float = SEA_LEVEL) -> np.ndarray:
+    """Per-tile A* cost: climbing is dearer and the sea all but impassable."""
+
+    cost = 1.0 + elevation * 3.0
+    cost[elevation < sea_level] = 1e6
+    return cost
+
+
+def road_line(
+    path: List[Tuple[int, int]],
+    noise: PerlinNoise,
+    *,
+    noise_amplitude: float = 1.0,
+    noise_frequency: float = 0.15,
+    spacing: float = 2.0,
+) -> List[Tuple[float, float]]:
+    """Return the distorted ``(x, y)`` road line drawn for an A* ``path`` of ``(y, x)`` tiles.
+
+    The path is resampled every ``spacing`` tiles along its length, which
+    smooths the grid staircase, and each sample is pushed sideways by 1D
+    noise, so the line follows the route A* found.
+    """
+
+    xy = np.array([(x, y) for y, x in path], dtype=float).reshape(-1, 2)
+    along = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(xy, axis=0).T))])
+    length = along[-1]
+    if length == 0:
+        return [(float(x), float(y)) for x, y in xy]
+    steps = max(int(length / spacing), 2)
+    count("noise_samples", steps + 1)
+    t = np.linspace(0.0, 1.0, steps + 1)
+    x, y = np.interp(t * length, along, xy[:, 0]), np.interp(t * length, along, xy[:, 1])
+    # Unit normals of the resampled line; np.gradient keeps the end tangents one-sided.
+    dx, dy = np.gradient(x), np.gradient(y)
+    norm = np.maximum(np.hypot(dx, dy), 1e-12)
+    offset = np.array([noise(ti * noise_frequency) for ti in t]) * noise_amplitude
+    return list(zip((x - dy / norm * offset).tolist(), (y + dx / norm * offset).tolist()))
 
 
 def build_roads(
@@ -80,37 +112,37 @@ def build_roads(
     noise_amplitude: float = 1.0,
     noise_frequency: float = 0.15,
     seed: int = 0,
+    paths: List[List[Tuple[int, int]]] | None = None,
 ) -> tuple[np.ndarray, List[List[Tuple[float, float]]]]:
     """Connect consecutive cities using A* to create roads.
 
     The resulting paths are lightly distorted using 1D Perlin noise to avoid
-    perfectly straight segments.
+    perfectly straight segments. The A* tile path behind each line is
+    appended to ``paths`` when given.
     """
 
+    from perlin_noise import PerlinNoise
+    from shapely.geometry import LineString
+
     height, width = elevation.shape
     road = np.zeros((height, width), dtype=bool)
     lines: List[List[Tuple[float, float]]] = []
     if len(cities) < 2:
         return road, lines
 
-    cost = 1.0 + elevation * 3.0
-    cost[elevation < sea_level] = 1e6
-
+    cost = road_cost(elevation, sea_level=sea_level)
     noise = PerlinNoise(seed=seed)
 
     for a, b in zip(cities[:-1], cities[1:]):
         path = _astar(a, b, cost)
         if len(path) < 2:
             continue
-        line = LineString([(x, y) for y, x in path])
-        line = _distort_line(
-            line,
-            noise,
-            amplitude=noise_amplitude,
-            frequency=noise_frequency,
-        )
-        lines.append([(pt[0], pt[1]) for pt in line.coords])
+        coords = road_line(path, noise, noise_amplitude=noise_amplitude, noise_frequency=noise_frequency)
+        lines.append(coords)
+        if paths is not None:
+            paths.append(path)
 
+        line = LineString(coords)
         length = line.length
         d = 0.0
         while d <= length:
@@ -0,0 +1,146 @@
+"""Seasonal biome animation over a finished archipelago.
+
+Geometry, elevation and the cell-label raster do not change with the
+seasons, so there is no need to rerun the pipeline for each frame.
+:func:`seasonal_biomes` takes the climate of an
+:class:`~archipelago_generator.generator.Archipelago` and adds sinusoidal
+temperature and moisture offsets for ``T`` time steps as ``(T, cells)``
+arrays. It classifies every frame in one
+:func:`~archipelago_generator.biomes.classify_biome_codes` call, then
+gathers the result through the label raster into a ``uint8`` ``(T, H, W)``
+stack. :func:`export_frames` writes the stack as PNGs and :func:`play`
+animates it in the terminal viewer.
+
+Temperature swings are proportional to latitude, using the same latitudes
+as :func:`~archipelago_generator.climate.compute_winds` (60 degrees north at
+the top, 60 south at the bottom), so the hemispheres are half a year apart
+and the equator barely changes. Moisture peaks a quarter of a year after
+temperature.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, List, Tuple
+
+import numpy as np
+
+from .biomes import BIOMES, classify_biome_codes
+
+if TYPE_CHECKING:
+    from .generator import Archipelago
+
+# Frame code of tiles outside every cell, as in the PNG and viewer palettes.
+UNKNOWN = len(BIOMES)
+
+
+@dataclass
+class Seasons:
+    """Per-frame climate and biome rasters.
+
+    ``temperature`` and ``moisture`` are ``(T, cells)`` arrays. ``frames`` is
+    a ``(T, height, width)`` ``uint8`` stack of indices into ``BIOMES``, with
+    :data:`UNKNOWN` for tiles outside every cell.
+    """
+
+    temperature: np.ndarray
+    moisture: np.ndarray
+    frames: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+
+def cell_latitudes(arch: Archipelago, latitude_span: float = 60.0) -> np.ndarray:
+    """Latitude of every cell centroid in degrees, north positive."""
+    import shapely
+
+    y = shapely.get_coordinates(shapely.centroid(np.asarray(arch.cells, dtype=object)))[:, 1]
+    return latitude_span * (1 - 2 * y / arch.height)
+
+
+def seasonal_offsets(
+    latitude: np.ndarray,
+    frames: int,
+    *,
+    temperature_amplitude: float = 0.15,
+    moisture_amplitude: float = 0.1,
+    latitude_span: float = 60.0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Temperature and moisture offsets for ``frames`` equally spaced steps of a year.
+
+    Both are ``(frames, len(latitude))`` arrays and average to zero over
+    the year, so the generated climate is the annual mean. Frame 0 is the
+    northern spring equinox.
+    """
+    phase = 2 * np.pi * np.arange(frames) / frames
+    lat = np.asarray(latitude, dtype=float) / latitude_span
+    dt = temperature_amplitude * np.sin(phase)[:, None] * lat
+    dm = moisture_amplitude * np.sin(phase - np.pi / 2)[:, None] * lat
+    return dt, dm
+
+
+def seasonal_biomes(
+    arch: Archipelago,
+    frames: int = 52,
+    *,
+    temperature_amplitude: float = 0.15,
+    moisture_amplitude: float = 0.1,
+    latitude_span: float = 60.0,
+) -> Seasons:
+    """Classify the biomes of ``arch`` for ``frames`` steps of a year."""
+    lat = cell_latitudes(arch, latitude_span)
+    dt, dm = seasonal_offsets(lat, frames, temperature_amplitude=temperature_amplitude,
+                              moisture_amplitude=moisture_amplitude, latitude_span=latitude_span)
+    temperature = np.clip(np.asarray(arch.temperature)[None, :] + dt, 0.0, 1.0)
+    moisture = np.clip(np.asarray(arch.moisture)[None, :] + dm, 0.0, 1.0)
+    codes = np.empty((frames, len(lat) + 1), dtype=np.uint8)
+    codes[:, :-1] = classify_biome_codes(arch.land, temperature, moisture)
+    codes[:, -1] = UNKNOWN
+    labels = np.asarray(arch.labels)
+    stack = np.empty((frames,) + labels.shape, dtype=np.uint8)
+    for t in range(frames):
+        # Frame by frame so the temporaries stay the size of one raster;
+        # ``wrap`` sends label -1 to the trailing column.
+        np.take(codes[t], labels, out=stack[t], mode="wrap")
+    return Seasons(temperature, moisture, stack)
+
+
+def export_frames(arch: Archipelago, seasons: Seasons, pattern: str, **options: Any) -> List[str]:
+    """Write every frame as a PNG named ``pattern.format(t)`` and return the paths.
+
+    ``options`` are passed to :func:`~archipelago_generator.rasterizer.export_png`.
+    """
+    from .rasterizer import export_png
+
+    paths = []
+    for t, frame in enumerate(seasons.frames):
+        path = pattern.format(t)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        export_png(arch, path, biome=frame, **options)
+        paths.append(path)
+    return paths
+
+
+def play(arch: Archipelago, seasons: Seasons, *, fps: float = 8.0, term: Any = None) -> None:
+    """Animate ``seasons`` in a :class:`~archipelago_generator.viewer.Viewer` until ``q``.
+
+    Panning and zooming work while it plays. Only tiles whose biome changed
+    are redrawn from one frame to the next.
+    """
+    from .viewer import Viewer, archipelago_layers
+
+    viewer = Viewer(archipelago_layers(arch, seasons.frames[0]), term)
+    term = viewer.term
+    t = 0
+    with term.fullscreen(), term.cbreak(), term.hidden_cursor():
+        while True:
+            frame = seasons.frames[t]
+            viewer.layers.base = lambda w: frame[w]
+            print(viewer.frame(), end="", flush=True)
+            key = term.inkey(timeout=1 / fps)
+            if not key:
+                t = (t + 1) % len(seasons)
+            elif not viewer.handle(key):
+                break
@@ -0,0 +1,344 @@
+"""Local asyncio HTTP service that generates archipelagos on demand.
+
+Requests carry a seed and :class:`~archipelago_generator.generator.ArchipelagoParams`
+values in the query string. Generation runs in a bounded process pool so the
+event loop only parses requests and streams responses. Concurrent requests
+for the same map share one computation (single-flight), and finished maps
+are kept in a byte-budgeted LRU (:class:`~archipelago_generator.pipeline.StageCache`).
+
+Endpoints (all ``GET``)::
+
+    /map?seed=1&width=200         metadata: size, cell count, land share, layers
+    /layer/<name>?seed=1          one array layer as an ``.npy`` file
+    /png?seed=1&x=0&y=0&w=64&h=64 a rendered PNG region, optional ``scale``
+    /stats                        cache, pool and single-flight counters
+
+Only the standard library and the package's own dependencies are used.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import numpy as np
+
+from .batch import warm_up
+from .pipeline import StageCache
+
+# Query parameters that select a PNG window rather than a map.
+REGION_PARAMS = ("x", "y", "w", "h", "scale")
+# Largest PNG edge, in pixels, a single request may ask for.
+MAX_PNG_PIXELS = 4096
+
+
+class RequestError(ValueError):
+    """A malformed request; reported to the client as ``400``."""
+
+
+class Busy(RuntimeError):
+    """Too many distinct maps queued; reported to the client as ``503``."""
+
+
+def parse_params(query: Dict[str, str]) -> Dict[str, Any]:
+    """Convert query strings to :class:`ArchipelagoParams` values by field type."""
+    from .generator import ArchipelagoParams
+
+    defaults = {f.name: f.default for f in dataclasses.fields(ArchipelagoParams)}
+    params: Dict[str, Any] = {}
+    for name, raw in query.items():
+        if name in REGION_PARAMS:
+            continue
+        if name not in defaults:
+            raise RequestError(f"unknown parameter {name!r}")
+        default = defaults[name]
+        try:
+            if isinstance(default, bool):
+                if raw.lower() not in ("1", "0", "true", "false", "yes", "no"):
+                    raise ValueError(raw)
+                value: Any = raw.lower() in ("1", "true", "yes")
+            elif isinstance(default, tuple):
+                value = tuple(float(v) for v in raw.split(","))
+            elif isinstance(default, float):
+                value = float(raw)
+            elif isinstance(default, int) or name == "seed":
+                value = int(raw)
+            else:
+                value = raw
+        except ValueError:
+            raise RequestError(f"bad value for {name!r}: {raw!r}") from None
+        params[name] = value
+    if params.get("seed") is None:
+        # Unseeded maps are not reproducible, so they could never be shared.
+        raise RequestError("seed is required")
+    return params
+
+
+def map_key(params: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def _generate(params: Dict[str, Any]) -> Tuple[Dict[str, Any], float]:
+    from .generator import generate_archipelago
+
+    start = time.perf_counter()
+    arch = generate_archipelago(**params)
+    fields = {f.name: getattr(arch, f.name) for f in dataclasses.fields(arch)}
+    return fields, time.perf_counter() - start
+
+
+class MapService:
+    """Single-flight, LRU-cached archipelago generation on a process pool.
+
+    ``workers`` bounds the pool size, ``max_bytes`` the estimated size of the
+    cached maps and ``max_pending`` the distinct maps that may be queued or
+    running at once; beyond it :meth:`get` raises :class:`Busy`. A pool
+    broken by a dying worker fails the maps it was running and is replaced
+    on the next request.
+    """
+
+    def __init__(self, *, workers: Optional[int] = None, max_bytes: int = 256 * 2**20,
+                 max_pending: int = 64) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.cache = StageCache(max_bytes=max_bytes)
+        self.generated = 0
+        self.shared = 0
+        self.gen_seconds = 0.0
+        self.pool_failures = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Forked workers would inherit the open client sockets and keep
+            # connections from closing, so start them fresh.
+            self._pool = ProcessPoolExecutor(
+                self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=warm_up,
+                initargs=("archipelago",),
+            )
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    async def get(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the fields of the map for ``params``, generating it at most once."""
+        key = map_key(params)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        future = self._inflight.get(key)
+        if future is not None:
+            self.shared += 1
+        else:
+            if len(self._inflight) >= self.max_pending:
+                raise Busy(f"{len(self._inflight)} maps already pending")
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._inflight[key] = future
+            loop.create_task(self._run(key, params, future))
+        # A client that disconnects must not cancel the map others wait for.
+        return await asyncio.shield(future)
+
+    async def _run(self, key: str, params: Dict[str, Any], future: asyncio.Future) -> None:
+        loop = asyncio.get_running_loop()
+        pool = self._executor()
+        try:
+            fields, seconds = await loop.run_in_executor(pool, _generate, params)
+        except BaseException as exc:  # noqa: BLE001 - handed to every waiter
+            if isinstance(exc, BrokenProcessPool) and self._pool is pool:
+                self.pool_failures += 1
+                self._pool = None
+                pool.shutdown(wait=False, cancel_futures=True)
+            future.set_exception(exc)
+            future.exception()  # mark retrieved when nobody is waiting any more
+        else:
+            self.generated += 1
+            self.gen_seconds += seconds
+            self.cache.put(key, fields)
+            future.set_result(fields)
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "generated": self.generated,
+            "shared": self.shared,
+            "pending": len(self._inflight),
+            "pool_failures": self.pool_failures,
+            "cached_maps": len(self.cache),
+            "cached_bytes": self.cache.nbytes,
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "generation_seconds": round(self.gen_seconds, 3),
+        }
+
+
+def metadata(key: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+    layers = {
+        name: {"dtype": str(value.dtype), "shape": list(value.shape)}
+        for name, value in fields.items()
+        if isinstance(value, np.ndarray) and value.dtype != object
+    }
+    return {
+        "key": key,
+        "width": fields["width"],
+        "height": fields["height"],
+        "cells": len(fields["cells"]),
+        "land_fraction": float(np.mean(fields["land"])),
+        "cities": [list(c) for c in fields["cities"]],
+        "rivers": len(fields["river_lines"]),
+        "roads": len(fields["road_lines"]),
+        "layers": layers,
+    }
+
+
+def encode_layer(fields: Dict[str, Any], name: str) -> bytes:
+    value = fields.get(name)
+    if isinstance(value, np.ndarray) and value.dtype == object:
+        value = value.astype(str)  # categorical layers such as ``biome``
+    if not isinstance(value, np.ndarray):
+        raise RequestError(f"unknown layer {name!r}")
+    buf = io.BytesIO()
+    np.save(buf, value, allow_pickle=False)
+    return buf.getvalue()
+
+
+def render_region(fields: Dict[str, Any], query: Dict[str, str]) -> bytes:
+    from .generator import Archipelago
+    from .rasterizer import export_png
+
+    arch = Archipelago(**fields)
+    try:
+        x, y = int(query.get("x", 0)), int(query.get("y", 0))
+        w = int(query.get("w", arch.width - x))
+        h = int(query.get("h", arch.height - y))
+        scale = int(query.get("scale", 1))
+    except ValueError:
+        raise RequestError("x, y, w, h and scale must be integers") from None
+    if scale < 1 or max(w, h) * scale > MAX_PNG_PIXELS:
+        raise RequestError(f"scale must be >= 1 and the image at most {MAX_PNG_PIXELS} pixels wide")
+    buf = io.BytesIO()
+    try:
+        export_png(arch, buf, scale=scale, region=(x, y, w, h))
+    except ValueError as exc:
+        raise RequestError(str(exc)) from None
+    return buf.getvalue()
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def _response(status: int, body: bytes, content_type: str, keep_alive: bool) -> bytes:
+    head = (
+        f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode() + body
+
+
+def _json(data: Any) -> Tuple[bytes, str]:
+    return json.dumps(data).encode(), "application/json"
+
+
+class MapServer:
+    """Minimal HTTP/1.1 front end for a :class:`MapService`."""
+
+    def __init__(self, service: MapService) -> None:
+        self.service = service
+
+    async def dispatch(self, method: str, target: str) -> Tuple[int, bytes, str]:
+        if method != "GET":
+            return (405, *_json({"error": "only GET is supported"}))
+        url = urlsplit(target)
+        path = unquote(url.path).rstrip("/") or "/"
+        query = dict(parse_qsl(url.query))
+        if path == "/stats":
+            return (200, *_json(self.service.stats()))
+        if path not in ("/map", "/png") and not path.startswith("/layer/"):
+            return (404, *_json({"error": f"no route {path!r}"}))
+        try:
+            params = parse_params(query)
+            fields = await self.service.get(params)
+            if path == "/map":
+                return (200, *_json(metadata(map_key(params), fields)))
+            loop = asyncio.get_running_loop()
+            # Encoding is numpy and zlib work; keep it off the event loop.
+            if path == "/png":
+                return 200, await loop.run_in_executor(None, render_region, fields, query), "image/png"
+            data = await loop.run_in_executor(None, encode_layer, fields, path[len("/layer/"):])
+            return 200, data, "application/octet-stream"
+        except (ValueError, TypeError) as exc:  # RequestError or parameters the generator rejects
+            return (400, *_json({"error": str(exc)}))
+        except Busy as exc:
+            return (503, *_json({"error": str(exc)}))
+        except Exception as exc:  # noqa: BLE001 - reported to the client
+            return (500, *_json({"error": f"{type(exc).__name__}: {exc}"}))
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0) or 0)
+                if length:
+                    await reader.readexactly(length)
+                parts = request_line.decode("latin-1").split()
+                version = parts[2] if len(parts) > 2 else "HTTP/1.0"
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" or (version == "HTTP/1.1" and connection != "close")
+                if len(parts) < 2:
+                    status, body, ctype = 400, *_json({"error": "malformed request line"})
+                else:
+                    status, body, ctype = await self.dispatch(parts[0], parts[1])
+                writer.write(_response(status, body, ctype, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def serve(host: str = "127.0.0.1", port: int = 8080, **service_options: Any) -> None:
+    """Run the service until cancelled."""
+    service = MapService(**service_options)
+    server = await MapServer(service).start(host, port)
+    addresses = ", ".join(str(s.getsockname()[:2]) for s in server.sockets)
+    print(f"serving archipelagos on {addresses} with {service.workers} workers", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
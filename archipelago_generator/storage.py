@@ -0,0 +1,243 @@
+"""Compact on-disk format for generated maps.
+
+A saved :class:`~archipelago_generator.generator.Archipelago` (or world dict
+from :func:`archipelago.generator.generate_world`) is a directory holding a ``manifest.json`` and one
+uncompressed ``.npy`` file per array, so every grid and per-cell layer can be
+opened with ``np.load(mmap_mode="r")``. Geometry is stored as packed
+coordinate arrays with offsets (shapely's ragged-array layout) instead of
+pickled shapely objects.
+
+Loading is lazy: :func:`load_archipelago` only reads the manifest, and each
+field is decoded the first time it is accessed.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import os
+import shutil
+from typing import Any, Dict, Iterable, Tuple
+
+import numpy as np
+
+from .generator import Archipelago
+
+FORMAT_NAME = "archipelago"
+WORLD_FORMAT_NAME = "world"
+# Version 2 added bit-packed boolean masks.
+FORMAT_VERSION = 2
+MANIFEST = "manifest.json"
+
+
+def _save_npy(directory: str, name: str, arr: np.ndarray) -> str:
+    filename = f"{name}.npy"
+    np.save(os.path.join(directory, filename), np.ascontiguousarray(arr), allow_pickle=False)
+    return filename
+
+
+def _is_polyline(value: Any) -> bool:
+    return isinstance(value, (list, tuple)) and len(value) > 0 and isinstance(value[0], (list, tuple))
+
+
+def _encode_geometries(directory: str, name: str, geoms: list) -> Dict[str, Any]:
+    import shapely
+
+    arr = np.asarray(geoms, dtype=object)
+    try:
+        geom_type, coords, offsets = shapely.to_ragged_array(arr)
+    except ValueError:
+        # Mixed geometry types cannot share one ragged layout; fall back to
+        # concatenated WKB with byte offsets.
+        blobs = shapely.to_wkb(arr)
+        ends = np.cumsum([len(b) for b in blobs], dtype=np.int64)
+        return {
+            "kind": "wkb",
+            "data": _save_npy(directory, f"{name}.wkb", np.frombuffer(b"".join(blobs), dtype=np.uint8)),
+            "offsets": _save_npy(directory, f"{name}.offsets", np.concatenate([[0], ends])),
+        }
+    return {
+        "kind": "geometry",
+        "geometry_type": int(geom_type),
+        "coords": _save_npy(directory, f"{name}.coords", coords),
+        "offsets": [_save_npy(directory, f"{name}.offsets{i}", off) for i, off in enumerate(offsets)],
+    }
+
+
+def _encode(directory: str, name: str, value: Any, pack_masks: bool = False) -> Dict[str, Any]:
+    from shapely.geometry.base import BaseGeometry
+
+    if isinstance(value, np.ndarray):
+        if pack_masks and value.dtype == bool:
+            return {
+                "kind": "mask",
+                "shape": list(value.shape),
+                "file": _save_npy(directory, name, np.packbits(value, axis=None)),
+            }
+        if value.dtype == object:
+            categories, codes = np.unique(value.astype(str), return_inverse=True)
+            dtype = np.uint8 if len(categories) <= 256 else np.uint32
+            return {
+                "kind": "categorical",
+                "categories": categories.tolist(),
+                "file": _save_npy(directory, name, codes.reshape(value.shape).astype(dtype)),
+            }
+        return {"kind": "array", "file": _save_npy(directory, name, value)}
+    if isinstance(value, list) and value and isinstance(value[0], BaseGeometry):
+        return _encode_geometries(directory, name, value)
+    if isinstance(value, list) and value and _is_polyline(value[0]):
+        lengths = [len(line) for line in value]
+        coords = np.asarray([pt for line in value for pt in line]).reshape(-1, 2)
+        return {
+            "kind": "polylines",
+            "coords": _save_npy(directory, f"{name}.coords", coords),
+            "offsets": _save_npy(directory, f"{name}.offsets", np.concatenate([[0], np.cumsum(lengths)])),
+        }
+    if isinstance(value, list) and value and isinstance(value[0], tuple):
+        return {"kind": "points", "file": _save_npy(directory, name, np.asarray(value))}
+    return {"kind": "json", "value": value}
+
+
+def decode_layer(directory: str, entry: Dict[str, Any], mmap: bool = True) -> Any:
+    """Decode the layer described by manifest ``entry`` from the map directory ``directory``.
+
+    With ``mmap`` array files are opened as read-only memory maps.
+    """
+    mode = "r" if mmap else None
+
+    def load(filename: str) -> np.ndarray:
+        return np.load(os.path.join(directory, filename), mmap_mode=mode, allow_pickle=False)
+
+    kind = entry["kind"]
+    if kind == "array":
+        return load(entry["file"])
+    if kind == "mask":
+        shape = tuple(entry["shape"])
+        bits = np.unpackbits(np.asarray(load(entry["file"])), count=int(np.prod(shape)))
+        return bits.reshape(shape).view(bool)
+    if kind == "categorical":
+        categories = np.asarray(entry["categories"], dtype=object)
+        return categories[np.asarray(load(entry["file"]))]
+    if kind == "geometry":
+        import shapely
+
+        offsets = tuple(np.asarray(load(f)) for f in entry["offsets"])
+        geoms = shapely.from_ragged_array(
+            shapely.GeometryType(entry["geometry_type"]), np.asarray(load(entry["coords"])), offsets
+        )
+        return list(geoms)
+    if kind == "wkb":
+        import shapely
+
+        data = np.asarray(load(entry["data"])).tobytes()
+        offsets = np.asarray(load(entry["offsets"]))
+        blobs = [data[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+        return list(shapely.from_wkb(blobs))
+    if kind == "polylines":
+        coords = np.asarray(load(entry["coords"])).tolist()
+        offsets = np.asarray(load(entry["offsets"])).tolist()
+        return [[tuple(pt) for pt in coords[a:b]] for a, b in zip(offsets[:-1], offsets[1:])]
+    if kind == "points":
+        return [tuple(pt) for pt in np.asarray(load(entry["file"])).tolist()]
+    if kind == "json":
+        return entry["value"]
+    raise ValueError(f"unknown layer kind {kind!r}")
+
+
+def _write_layers(path: str, format_name: str, items: Iterable[Tuple[str, Any]], overwrite: bool,
+                  pack_masks: bool = False) -> None:
+    # Layers are written to a temporary sibling directory that is renamed into
+    # place at the end, so readers never observe a half-written map.
+    tmp = f"{path}.tmp{os.getpid()}"
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    layers = {name: _encode(tmp, name, value, pack_masks) for name, value in items if value is not None}
+    # Maps without packed masks stay readable by version 1 readers.
+    version = FORMAT_VERSION if any(e["kind"] == "mask" for e in layers.values()) else 1
+    manifest = {"format": format_name, "version": version, "layers": layers}
+    with open(os.path.join(tmp, MANIFEST), "w") as fh:
+        json.dump(manifest, fh)
+    if os.path.exists(path):
+        if not overwrite:
+            shutil.rmtree(tmp)
+            raise FileExistsError(path)
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+
+
+def save_archipelago(arch: Archipelago, path: str, *, overwrite: bool = True, pack_masks: bool = False) -> None:
+    """Write ``arch`` to the directory ``path``.
+
+    With ``pack_masks`` boolean layers are stored at one bit per tile; they
+    are then unpacked into memory on load instead of memory-mapped.
+    """
+    items = ((f.name, getattr(arch, f.name)) for f in dataclasses.fields(arch))
+    _write_layers(path, FORMAT_NAME, items, overwrite, pack_masks)
+
+
+def save_world(world: Dict[str, Any], path: str, *, overwrite: bool = True, pack_masks: bool = False) -> None:
+    """Write a world dict from ``generate_world`` to the directory ``path``."""
+    _write_layers(path, WORLD_FORMAT_NAME, world.items(), overwrite, pack_masks)
+
+
+def load_world(path: str, *, mmap: bool = True) -> Dict[str, Any]:
+    """Read a world written by :func:`save_world`; arrays are memory maps when ``mmap``."""
+    manifest = read_manifest(path, WORLD_FORMAT_NAME)
+    return {name: decode_layer(path, entry, mmap) for name, entry in manifest["layers"].items()}
+
+
+def read_manifest(path: str, format_name: str = FORMAT_NAME) -> Dict[str, Any]:
+    """Return the parsed manifest of a saved map, validating its version."""
+    with open(os.path.join(path, MANIFEST)) as fh:
+        manifest = json.load(fh)
+    if manifest.get("format") != format_name:
+        raise ValueError(f"{path} is not a saved {format_name}")
+    if manifest.get("version", 0) > FORMAT_VERSION:
+        raise ValueError(
+            f"{path} uses format version {manifest['version']}, newest supported is {FORMAT_VERSION}"
+        )
+    return manifest
+
+
+# Fields with a class-level default, which would otherwise hide __getattr__.
+_DEFAULTED = frozenset(
+    f.name for f in dataclasses.fields(Archipelago)
+    if f.default is not dataclasses.MISSING or f.default_factory is not dataclasses.MISSING
+)
+
+
+class LazyArchipelago(Archipelago):
+    """:class:`Archipelago` whose fields are decoded from disk on first access."""
+
+    def __getattribute__(self, name: str) -> Any:
+        if name in _DEFAULTED and name not in object.__getattribute__(self, "__dict__"):
+            return object.__getattribute__(self, "__getattr__")(name)
+        return super().__getattribute__(name)
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        layers = self._manifest["layers"]
+        if name not in layers:
+            if name in {f.name for f in dataclasses.fields(Archipelago)}:
+                return None
+            raise AttributeError(name)
+        value = decode_layer(self._path, layers[name], self._mmap)
+        setattr(self, name, value)
+        return value
+
+
+def load_archipelago(path: str, *, mmap: bool = True) -> Archipelago:
+    """Open a map written by :func:`save_archipelago`.
+
+    Only the manifest is read up front. Fields are decoded on first access
+    and then cached on the instance; with ``mmap=True`` (the default) array
+    layers are read-only memory maps, so untouched pages never leave disk.
+    """
+
+    arch = object.__new__(LazyArchipelago)
+    arch._path = os.path.abspath(path)
+    arch._manifest = read_manifest(path)
+    arch._mmap = mmap
+    return arch
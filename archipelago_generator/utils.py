@@ -8,3 +8,40 @@ import numpy as np
 def seeded_rng(seed: int | None) -> np.random.Generator:
     return np.random.default_rng(seed)
 
+
+def perlin_batch(noise, coords) -> np.ndarray:
+    """Evaluate a ``perlin_noise.PerlinNoise`` at many points at once.
+
+    ``coords`` is an ``(n, dims)`` array (or ``(n,)`` for 1-D noise). The
+    lattice vectors are drawn exactly as the library draws them, once per
+    distinct lattice hash, and the per-point arithmetic runs as array
+    operations, so the result matches ``[noise(list(c)) for c in coords]``
+    to within floating-point rounding.
+    """
+    import itertools
+    import random
+
+    pts = np.asarray(coords, dtype=float)
+    if pts.ndim == 1:
+        pts = pts[:, None]
+    pts = pts * noise.octaves
+    n, dims = pts.shape
+    base = np.floor(pts).astype(np.int64)
+    # perlin_noise.tools.hasher: the vector of a corner depends only on this key.
+    powers = 10 ** np.arange(dims, dtype=np.int64)
+    offsets = [np.array(off) for off in itertools.product((0, 1), repeat=dims)]
+    keys = np.stack([np.maximum(1, np.abs((base + off) @ powers + 1)) for off in offsets])
+    unique, inverse = np.unique(keys, return_inverse=True)
+    vectors = np.empty((len(unique), dims))
+    for k, key in enumerate(unique.tolist()):
+        rnd = random.Random(noise.seed * key)  # perlin_noise.tools.sample_vector
+        vectors[k] = [rnd.uniform(-1, 1) for _ in range(dims)]
+    inverse = inverse.reshape(keys.shape)
+
+    total = np.zeros(n)
+    for j, off in enumerate(offsets):
+        dist = pts - (base + off)
+        t = 1 - np.abs(dist)
+        fade = t * t * t * (t * (t * 6 - 15) + 10)
+        total += fade.prod(axis=1) * (vectors[inverse[j]] * dist).sum(axis=1)
+    return total
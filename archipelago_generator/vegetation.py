@@ -0,0 +1,162 @@
+"""Vegetation scatter: trees, cacti and oases placed per biome.
+
+Poisson-disk sampling a whole large map point by point is far too slow for
+millions of props. :func:`scatter` instead samples a few small tileable
+Poisson-disk tiles once per seed (:func:`poisson_tiles`, cached). It stamps
+them over the map with vectorized offsets, one randomly chosen tile per
+slot. Each stamped point is then kept or dropped by array masks built from
+the biome and moisture under it. Rivers and roads stay clear. The result is
+a pair of packed arrays, which is deterministic for a seed.
+
+Within a tile, and between copies of the same tile, points are at least
+``radius`` apart. Where two different tiles meet, points may come closer.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+import numpy as np
+
+from .biomes import BIOMES
+from .pipeline import stage_rng
+from .points import poisson_disk_sampling
+
+if TYPE_CHECKING:
+    from .generator import Archipelago
+
+PROP_TYPES = ("tree", "pine", "palm", "cactus", "shrub", "oasis")
+
+# Per biome: share of candidate points kept at moisture 0.5, and the odds of
+# each prop type among those kept.
+VEGETATION: Dict[str, Tuple[float, Dict[str, float]]] = {
+    "ocean": (0.0, {}),
+    "desert": (0.06, {"cactus": 0.85, "shrub": 0.15}),
+    "grassland": (0.15, {"tree": 0.3, "shrub": 0.7}),
+    "forest": (0.8, {"tree": 0.85, "pine": 0.05, "shrub": 0.1}),
+    "dark_forest": (0.95, {"pine": 0.7, "tree": 0.3}),
+    "jungle": (0.95, {"palm": 0.6, "tree": 0.4}),
+    "snow": (0.03, {"pine": 1.0}),
+    "tundra": (0.1, {"pine": 0.4, "shrub": 0.6}),
+    "scorched": (0.0, {}),
+}
+
+
+@dataclass
+class Props:
+    """Packed props: ``xy`` is a ``float32`` ``(n, 2)`` array of map
+    coordinates and ``kind`` a ``uint8`` index into :data:`PROP_TYPES`."""
+
+    xy: np.ndarray
+    kind: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.kind)
+
+    def of_type(self, name: str) -> np.ndarray:
+        """Coordinates of the props of type ``name``."""
+        return self.xy[self.kind == PROP_TYPES.index(name)]
+
+
+def poisson_tiles(seed: int, count: int = 4, size: int = 64, radius: float = 2.0) -> Tuple[np.ndarray, ...]:
+    """``count`` tileable Poisson-disk point sets on a ``size`` square, cached per arguments.
+
+    Each is a read-only ``float32`` ``(k, 2)`` array of ``(x, y)`` points.
+    """
+    return _poisson_tiles(int(seed), int(count), int(size), float(radius))
+
+
+@lru_cache(maxsize=16)
+def _poisson_tiles(seed: int, count: int, size: int, radius: float) -> Tuple[np.ndarray, ...]:
+    rng = stage_rng(seed, "vegetation_tiles")
+    tiles = []
+    for _ in range(count):
+        points = poisson_disk_sampling(size, size, radius, rng, wrap=True).astype(np.float32)
+        points.flags.writeable = False
+        tiles.append(points)
+    return tuple(tiles)
+
+
+def _tables() -> Tuple[np.ndarray, np.ndarray]:
+    # Keep rate per biome code and cumulative type odds, one row per code;
+    # the extra last row is for tiles outside every cell.
+    rate = np.zeros(len(BIOMES) + 1)
+    cumulative = np.ones((len(BIOMES) + 1, len(PROP_TYPES)))
+    for code, biome in enumerate(BIOMES):
+        keep, odds = VEGETATION.get(biome, (0.0, {}))
+        rate[code] = keep
+        weights = np.array([odds.get(name, 0.0) for name in PROP_TYPES])
+        if weights.sum() > 0:
+            cumulative[code] = np.cumsum(weights) / weights.sum()
+    return rate, cumulative
+
+
+def scatter(
+    arch: Archipelago,
+    seed: int = 0,
+    *,
+    radius: float = 2.0,
+    tile_size: int = 64,
+    tile_count: int = 4,
+    density: float = 1.0,
+    biome: Optional[np.ndarray] = None,
+) -> Props:
+    """Scatter vegetation props over ``arch``.
+
+    Candidate points are at least ``radius`` tiles apart. A point is kept
+    with the rate of its biome in :data:`VEGETATION`, times ``density``.
+    The rate scales with moisture, from half at moisture 0 to one and a half
+    at moisture 1. Desert points next to a river become oases. ``biome``
+    may replace the cell biomes with a raster of indices into ``BIOMES``,
+    such as a frame from :func:`~archipelago_generator.seasons.seasonal_biomes`.
+    """
+    height, width = arch.height, arch.width
+    tiles = poisson_tiles(seed, tile_count, tile_size, radius)
+    rng = stage_rng(seed, "vegetation")
+    rows, cols = -(-height // tile_size), -(-width // tile_size)
+    choice = rng.integers(0, len(tiles), (rows, cols))
+
+    # Stamp every tile at all the slots that picked it, as flat x and y
+    # columns; only slots on a ragged map edge need clipping.
+    xs, ys = [], []
+    for t, points in enumerate(tiles):
+        sy, sx = np.nonzero(choice == t)
+        xs.append((sx[:, None] * tile_size + points[None, :, 0]).ravel())
+        ys.append((sy[:, None] * tile_size + points[None, :, 1]).ravel())
+    x = np.concatenate(xs).astype(np.float32)
+    y = np.concatenate(ys).astype(np.float32)
+    if width % tile_size or height % tile_size:
+        inside = (x < width) & (y < height)
+        x, y = x[inside], y[inside]
+    flat = y.astype(np.intp) * width + x.astype(np.intp)
+
+    labels = np.asarray(arch.labels).reshape(-1)[flat]
+    if biome is not None:
+        code = np.asarray(biome).reshape(-1)[flat].astype(np.intp)
+    else:
+        lookup = {b: i for i, b in enumerate(BIOMES)}
+        cell_code = np.array([lookup.get(b, len(BIOMES)) for b in arch.biome] + [len(BIOMES)], dtype=np.intp)
+        code = cell_code[labels]
+    moisture = np.append(np.asarray(arch.moisture, dtype=np.float32), np.float32(0))[labels]
+    rate, cumulative = _tables()
+    rate = (rate * density).astype(np.float32)
+    keep = rng.random(len(flat), dtype=np.float32) < rate[code] * (0.5 + moisture)
+    river = np.asarray(arch.river_map).reshape(-1)
+    keep &= river[flat] == 0
+    keep &= np.asarray(arch.road_map).reshape(-1)[flat] == 0
+    x, y, code, flat = x[keep], y[keep], code[keep], flat[keep]
+
+    pick = rng.random(len(flat), dtype=np.float32)
+    kind = np.minimum((pick[:, None] > cumulative[code]).sum(axis=1), len(PROP_TYPES) - 1).astype(np.uint8)
+    desert = np.flatnonzero(code == BIOMES.index("desert"))
+    if desert.size:
+        iy, ix = np.divmod(flat[desert], width)
+        near = np.zeros(desert.size, dtype=bool)
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                near |= river[np.clip(iy + dy, 0, height - 1) * width + np.clip(ix + dx, 0, width - 1)] != 0
+        kind[desert[near]] = PROP_TYPES.index("oasis")
+    xy = np.stack([x, y], axis=1)
+    return Props(xy, kind)
@@ -0,0 +1,234 @@
+"""Interactive terminal viewer that pans and zooms over large maps.
+
+The renderers in :mod:`archipelago_generator.render` draw the whole map,
+which is useless for maps bigger than the terminal. :class:`Viewer`
+instead samples only the tiles under the viewport. At zoom level ``n``
+every ``2**n``-th tile is read straight from the layer arrays (memory maps
+work too). Each frame is diffed against the previous one, and only the
+changed span of each changed row is written. The cost of a frame therefore
+depends on the terminal size, not on the map size.
+
+Keys: arrows or ``hjkl`` pan a quarter screen, ``HJKL`` a full screen,
+``+``/``-`` zoom, ``0`` fits the whole map and ``q`` quits.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .generator import Archipelago
+
+Window = Tuple[slice, slice]
+Glyph = Tuple[str, Tuple[int, int, int]]
+
+
+@dataclass
+class TileLayers:
+    """Map layers as palette indices, sampled one window at a time.
+
+    ``base(window)`` returns the palette indices of a ``(rows, cols)`` slice
+    pair. Each ``(index, mask)`` in ``masks`` paints ``index`` where
+    ``mask(window)`` is true, and later masks win. ``points`` paints single
+    ``(y, x)`` tiles such as cities on top. This is the same layering as
+    :func:`~archipelago_generator.rasterizer.palette_bands`.
+    """
+
+    height: int
+    width: int
+    palette: Sequence[Glyph]
+    base: Callable[[Window], np.ndarray]
+    masks: Sequence[Tuple[int, Callable[[Window], np.ndarray]]] = ()
+    points: Sequence[Tuple[int, Sequence[Tuple[int, int]]]] = ()
+
+    def sample(self, y: int, x: int, rows: int, cols: int, step: int = 1) -> np.ndarray:
+        """Palette indices of a ``rows`` x ``cols`` screen with tile ``(y, x)`` at its top left.
+
+        Every ``step``-th tile is shown. Points inside a skipped tile still
+        show in the screen cell that covers them. Cells past the map edge
+        are ``-1``.
+        """
+        out = np.full((rows, cols), -1, dtype=np.int16)
+        y1 = min(y + rows * step, self.height)
+        x1 = min(x + cols * step, self.width)
+        if y1 <= y or x1 <= x:
+            return out
+        window = (slice(y, y1, step), slice(x, x1, step))
+        codes = np.array(self.base(window), dtype=np.int16)
+        for index, mask in self.masks:
+            codes[np.asarray(mask(window))] = index
+        out[:codes.shape[0], :codes.shape[1]] = codes
+        for index, coords in self.points:
+            pts = np.asarray(coords, dtype=np.int64).reshape(-1, 2)
+            sel = (pts[:, 0] >= y) & (pts[:, 0] < y1) & (pts[:, 1] >= x) & (pts[:, 1] < x1)
+            out[(pts[sel, 0] - y) // step, (pts[sel, 1] - x) // step] = index
+        return out
+
+
+def archipelago_layers(arch: Archipelago, biome: Optional[np.ndarray] = None) -> TileLayers:
+    """Biomes from the cell-label raster with rivers, roads and cities on top.
+
+    ``biome`` replaces the cell biomes with a raster of indices into
+    ``BIOMES``, as in :func:`~archipelago_generator.rasterizer.export_png`.
+    """
+    from .biomes import BIOMES
+    from .render import BIOME_GLYPHS, FEATURE_GLYPHS
+
+    palette: List[Glyph] = [BIOME_GLYPHS[b] for b in BIOMES] + [("?", (255, 255, 255))]
+    palette += [FEATURE_GLYPHS[f] for f in ("river", "wide river", "road", "city")]
+    unknown, river, wide, road, city = range(len(BIOMES), len(palette))
+    lookup = {b: i for i, b in enumerate(BIOMES)}
+    # One code per cell plus a trailing ``unknown`` entry picked up by label -1.
+    codes = np.array([lookup.get(b, unknown) for b in arch.biome] + [unknown], dtype=np.int16)
+    return TileLayers(
+        arch.height,
+        arch.width,
+        palette,
+        (lambda w: codes[arch.labels[w]]) if biome is None else (lambda w: biome[w]),
+        [
+            (river, lambda w: arch.river_map[w] > 0),
+            (wide, lambda w: (arch.river_map[w] > 0) & (arch.river_width[w] > 2)),
+            (road, lambda w: arch.road_map[w] != 0),
+        ],
+        [(city, arch.cities)],
+    )
+
+
+class Viewer:
+    """Keyboard-driven viewport over :class:`TileLayers` in a blessed terminal.
+
+    The bottom terminal row is a status line; the rest shows the map.
+    :meth:`frame` returns the escape sequences that bring the screen up to
+    date, so it can be driven without a real terminal.
+    """
+
+    def __init__(self, layers: TileLayers, term: Any = None) -> None:
+        if term is None:
+            from blessed import Terminal
+
+            term = Terminal()
+        self.layers = layers
+        self.term = term
+        self.y = self.x = 0
+        self.level = 0
+        self._colors = [term.color_rgb(*rgb) for _, rgb in layers.palette]
+        self._glyphs = [glyph for glyph, _ in layers.palette]
+        self._shown: Optional[np.ndarray] = None
+        self._status = ""
+
+    @property
+    def step(self) -> int:
+        return 1 << self.level
+
+    def _screen(self) -> Tuple[int, int]:
+        return max(self.term.height - 1, 1), max(self.term.width, 1)
+
+    def max_level(self) -> int:
+        """The first zoom level at which the whole map fits on screen."""
+        rows, cols = self._screen()
+        level = 0
+        while (self.layers.height > rows << level) or (self.layers.width > cols << level):
+            level += 1
+        return level
+
+    def _clamp(self) -> None:
+        rows, cols = self._screen()
+        self.level = min(max(self.level, 0), self.max_level())
+        self.y = min(max(self.y, 0), max(self.layers.height - rows * self.step, 0))
+        self.x = min(max(self.x, 0), max(self.layers.width - cols * self.step, 0))
+
+    def pan(self, dy: int, dx: int) -> None:
+        """Move by ``dy`` rows and ``dx`` columns of screen cells."""
+        self.y += dy * self.step
+        self.x += dx * self.step
+        self._clamp()
+
+    def zoom(self, delta: int) -> None:
+        """Change the zoom level by ``delta`` (positive zooms out), keeping the centre."""
+        rows, cols = self._screen()
+        cy = self.y + rows * self.step // 2
+        cx = self.x + cols * self.step // 2
+        self.level += delta
+        self._clamp()
+        self.y = cy - rows * self.step // 2
+        self.x = cx - cols * self.step // 2
+        self._clamp()
+
+    def _run(self, codes: np.ndarray) -> str:
+        # One colour sequence per run of equal codes.
+        term = self.term
+        parts = []
+        breaks = np.flatnonzero(np.diff(codes)) + 1
+        for start, end in zip(np.r_[0, breaks], np.r_[breaks, len(codes)]):
+            code = int(codes[start])
+            if code < 0:
+                parts.append(term.normal + " " * (end - start))
+            else:
+                parts.append(self._colors[code] + self._glyphs[code] * (end - start))
+        return "".join(parts) + term.normal
+
+    def frame(self) -> str:
+        """Escape sequences that redraw what changed since the last frame."""
+        term = self.term
+        rows, cols = self._screen()
+        self._clamp()
+        codes = self.layers.sample(self.y, self.x, rows, cols, self.step)
+        shown = self._shown
+        out = []
+        if shown is None or shown.shape != codes.shape:
+            out.append(term.clear)
+            shown = np.full(codes.shape, -2, dtype=codes.dtype)
+        changed = codes != shown
+        for r in np.flatnonzero(changed.any(axis=1)):
+            cs = np.flatnonzero(changed[r])
+            c0, c1 = int(cs[0]), int(cs[-1]) + 1
+            out.append(term.move_yx(int(r), c0) + self._run(codes[r, c0:c1]))
+        self._shown = codes
+        status = (f"x {self.x} y {self.y}  1:{self.step}  {self.layers.width}x{self.layers.height}"
+                  "  arrows/hjkl pan  +/- zoom  0 fit  q quit")[:cols]
+        if status != self._status or out[:1] == [term.clear]:
+            out.append(term.move_yx(rows, 0) + term.normal + status.ljust(cols))
+            self._status = status
+        return "".join(out)
+
+    def handle(self, key: Any) -> bool:
+        """Apply one keypress; return ``False`` when the viewer should quit."""
+        rows, cols = self._screen()
+        name = getattr(key, "name", None) or ""
+        ch = str(key)
+        moves = {"KEY_UP": "k", "KEY_DOWN": "j", "KEY_LEFT": "h", "KEY_RIGHT": "l",
+                 "KEY_PGUP": "K", "KEY_PGDOWN": "J"}
+        ch = moves.get(name, ch)
+        if ch == "q":
+            return False
+        deltas = {"k": (-1, 0), "j": (1, 0), "h": (0, -1), "l": (0, 1)}
+        if ch.lower() in deltas and ch:
+            dy, dx = deltas[ch.lower()]
+            far = ch.isupper()
+            self.pan(dy * (rows if far else max(rows // 4, 1)), dx * (cols if far else max(cols // 4, 1)))
+        elif ch in ("+", "="):
+            self.zoom(-1)
+        elif ch in ("-", "_"):
+            self.zoom(1)
+        elif ch == "0":
+            self.level = self.max_level()
+            self.y = self.x = 0
+        return True
+
+    def run(self) -> None:
+        """Show the viewer until ``q`` is pressed."""
+        term = self.term
+        with term.fullscreen(), term.cbreak(), term.hidden_cursor():
+            while True:
+                print(self.frame(), end="", flush=True)
+                key = term.inkey()
+                if not self.handle(key):
+                    break
+
+
+def view(layers: TileLayers) -> None:
+    """Open an interactive :class:`Viewer` on ``layers``."""
+    Viewer(layers).run()
@@ -2,38 +2,140 @@
 
 from __future__ import annotations
 
-from typing import List, Tuple
+from dataclasses import dataclass
+from functools import cached_property
+from typing import TYPE_CHECKING, List, Tuple
 
 import numpy as np
-from shapely.geometry import Polygon, box, MultiPoint
-from shapely.ops import voronoi_diagram
-from scipy.spatial import Voronoi
+
+if TYPE_CHECKING:
+    from shapely.geometry import Polygon
+
+
+@dataclass
+class CellGraph:
+    """Voronoi cells plus their adjacency expressed as shared edges.
+
+    ``cells[i]`` is the cell of ``sites[i]``. ``edges`` holds one ``(i, j)``
+    pair with ``i < j`` per shared edge and ``edge_vertices`` its two
+    endpoints, so per-edge quantities are plain array operations.
+    """
+
+    cells: List[Polygon]
+    sites: np.ndarray
+    edges: np.ndarray
+    edge_vertices: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    @cached_property
+    def neighbors(self) -> List[set[int]]:
+        adjacency: List[set[int]] = [set() for _ in range(len(self.cells))]
+        for a, b in self.edges.tolist():
+            adjacency[a].add(b)
+            adjacency[b].add(a)
+        return adjacency
+
+    @cached_property
+    def centroids(self) -> np.ndarray:
+        import shapely
+
+        return shapely.get_coordinates(shapely.centroid(np.asarray(self.cells, dtype=object)))
+
+    @property
+    def edge_midpoints(self) -> np.ndarray:
+        return self.edge_vertices.mean(axis=1)
+
+    @property
+    def edge_lengths(self) -> np.ndarray:
+        return np.linalg.norm(self.edge_vertices[:, 1] - self.edge_vertices[:, 0], axis=1)
+
+    def csr(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return ``(indptr, neighbor, edge)`` listing each cell's neighbours.
+
+        The neighbours of cell ``i`` are ``neighbor[indptr[i]:indptr[i + 1]]``
+        and ``edge`` gives the row of ``edges`` each one is reached through.
+        """
+        n_edges = len(self.edges)
+        src = np.concatenate([self.edges[:, 0], self.edges[:, 1]])
+        dst = np.concatenate([self.edges[:, 1], self.edges[:, 0]])
+        edge = np.concatenate([np.arange(n_edges), np.arange(n_edges)])
+        order = np.argsort(src, kind="stable")
+        indptr = np.zeros(len(self.cells) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(self.cells)), out=indptr[1:])
+        return indptr, dst[order], edge[order]
+
+
+def _clip_segments(segments: np.ndarray, width: float, height: float) -> np.ndarray:
+    """Clip ``(E, 2, 2)`` segments to the map (Liang-Barsky).
+
+    Segments entirely outside collapse to a single point.
+    """
+    p0 = segments[:, 0]
+    d = segments[:, 1] - p0
+    t0 = np.zeros(len(segments))
+    t1 = np.ones(len(segments))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for p, q in ((-d[:, 0], p0[:, 0]), (d[:, 0], width - p0[:, 0]),
+                     (-d[:, 1], p0[:, 1]), (d[:, 1], height - p0[:, 1])):
+            r = q / p
+            t0 = np.where(p < 0, np.maximum(t0, r), t0)
+            t1 = np.where(p > 0, np.minimum(t1, r), t1)
+            t1 = np.where((p == 0) & (q < 0), t0, t1)
+    t1 = np.maximum(t0, t1)
+    return np.stack([p0 + t0[:, None] * d, p0 + t1[:, None] * d], axis=1)
+
+
+def compute_cell_graph(points: np.ndarray, width: int, height: int) -> CellGraph:
+    """Compute the Voronoi cells of ``points`` clipped to the map and their shared edges.
+
+    Four sentinel sites far outside the map make every cell bounded without
+    changing anything inside it, so ``cells[i]`` is always the cell of
+    ``points[i]``.
+    """
+    import shapely
+    from scipy.spatial import Voronoi
+
+    points = np.asarray(points, dtype=float)
+    n = len(points)
+    far = 10.0 * (width + height)
+    cx, cy = width / 2, height / 2
+    sentinels = [(cx - far, cy), (cx + far, cy), (cx, cy - far), (cx, cy + far)]
+    vor = Voronoi(np.concatenate([points, sentinels]))
+
+    coords, ring_index, valid = [], [], []
+    for i in range(n):
+        region = vor.regions[vor.point_region[i]]
+        if len(region) >= 3 and -1 not in region:  # else a duplicate site
+            coords.append(vor.vertices[region + region[:1]])
+            ring_index.append(np.full(len(region) + 1, len(valid)))
+            valid.append(i)
+    polys = np.full(n, shapely.Polygon(), dtype=object)
+    if valid:
+        rings = shapely.linearrings(np.concatenate(coords), indices=np.concatenate(ring_index))
+        polys[valid] = shapely.polygons(rings)
+    # Only cells reaching past the map need the (comparatively slow) clip.
+    lo = np.full((n, 2), np.inf)
+    hi = np.full((n, 2), -np.inf)
+    if valid:
+        flat = np.concatenate(coords)
+        idx = np.asarray(valid)[np.concatenate(ring_index)]
+        np.minimum.at(lo, idx, flat)
+        np.maximum.at(hi, idx, flat)
+    spill = (lo < 0).any(axis=1) | (hi > [width, height]).any(axis=1)
+    polys[spill] = shapely.intersection(polys[spill], shapely.box(0, 0, width, height))
+
+    ridges = vor.ridge_points
+    keep = (ridges < n).all(axis=1)
+    pairs = np.sort(ridges[keep], axis=1)
+    segments = _clip_segments(vor.vertices[np.array(vor.ridge_vertices)[keep]], width, height)
+    # Drop ridges outside the map and those of cells meeting at one corner.
+    solid = np.linalg.norm(segments[:, 1] - segments[:, 0], axis=1) > 1e-9 * max(width, height)
+    return CellGraph(list(polys), points, pairs[solid].astype(np.int64), segments[solid])
 
 
 def compute_voronoi(points: np.ndarray, width: int, height: int) -> Tuple[List[Polygon], List[set[int]]]:
     """Compute bounded Voronoi cells and adjacency."""
-    # Use scipy Voronoi then clip to bounding box
-    bbox = box(0, 0, width, height)
-    vor = Voronoi(points)
-    regions: List[Polygon] = []
-    adjacency: List[set[int]] = [set() for _ in range(len(points))]
-    for i, point in enumerate(points):
-        region_index = vor.point_region[i]
-        region = vor.regions[region_index]
-        if -1 in region or len(region) == 0:
-            # Use generic approach: compute Voronoi diagram via shapely
-            break
-        polygon = Polygon(vor.vertices[region])
-        regions.append(polygon.intersection(bbox))
-    if len(regions) != len(points):
-        # Fallback shapely voronoi for boundary points
-        pts = MultiPoint([tuple(p) for p in points])
-        cells = voronoi_diagram(pts, envelope=bbox, edges=False)
-        regions = [poly.intersection(bbox) for poly in cells.geoms]
-
-    for a, b in vor.ridge_points:
-        adjacency[a].add(b)
-        adjacency[b].add(a)
-
-    return regions, adjacency
-
+    graph = compute_cell_graph(points, width, height)
+    return graph.cells, graph.neighbors
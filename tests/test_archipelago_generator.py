@@ -51,3 +51,35 @@ def test_roads_on_land():
         for x in range(arch.width):
             if arch.road_map[y, x]:
                 assert elev_grid[y, x] >= sea_level
+
+
+def test_wide_jittered_roads_on_land():
+    sea_level = ArchipelagoParams.sea_level
+    arch = generate_archipelago(width=60, height=60, seed=8, road_width_tiles=3, jitter=True)
+    elev_grid = rasterize(arch.cells, arch.elevation, arch.width, arch.height)
+    assert arch.road_map.any() and not arch.road_map[elev_grid < sea_level].any()
+
+
+def test_export_png_matches_layers(tmp_path):
+    from PIL import Image
+    from archipelago_generator.biomes import BIOMES
+    from archipelago_generator.rasterizer import export_png
+
+    arch = generate_archipelago(width=40, height=30, seed=6)
+    path = tmp_path / "arch.png"
+    export_png(arch, path, scale=2, band_rows=7)
+    img = np.array(Image.open(path))
+    assert img.shape == (60, 80)
+    grid = rasterize(arch.cells, arch.biome, arch.width, arch.height, labels=arch.labels)
+    plain = ~arch.road_map & ~(arch.river_map > 0)
+    for cy, cx in arch.cities:
+        plain[cy, cx] = False
+    y, x = np.argwhere(plain)[0]
+    assert BIOMES[img[2 * y, 2 * x]] == grid[y, x]
+
+
+def test_barycentric_rasterization_gives_rivers_without_erosion():
+    flat = generate_archipelago(width=120, height=120, seed=2)
+    smooth = generate_archipelago(width=120, height=120, seed=2, rasterization="barycentric")
+    assert not flat.river_lines and smooth.river_lines
+    assert np.array_equal(flat.biome, smooth.biome)
@@ -0,0 +1,20 @@
+import os
+
+from archipelago_generator.batch import BatchJob, parse_seeds, run_batch
+from archipelago_generator.storage import load_world
+
+
+def test_parse_seeds():
+    assert parse_seeds("0:3") == [0, 1, 2]
+    assert parse_seeds("0:10:5,7") == [0, 5, 7]
+
+
+def test_batch_resumes(tmp_path):
+    job = BatchJob(str(tmp_path), kind="world", params={"width": 16, "height": 8, "num_provinces": 2})
+    first = run_batch(job, [0, 1], workers=1)
+    assert first.generated == 2
+    assert os.path.isdir(job.output_path(1))
+    assert load_world(job.output_path(1))["elevation"].shape == (8, 16)
+
+    second = run_batch(job, [0, 1, 2], workers=1)
+    assert second.generated == 1 and second.skipped == 2
@@ -0,0 +1,21 @@
+from archipelago_generator import benchmarks
+
+
+def test_world_stages_timed():
+    rows = benchmarks.bench_world(16, 8, memory=True)
+    stages = [r["stage"] for r in rows]
+    assert stages[0] == "seeds" and "flux" in stages and stages[-2:] == ["render", "png"]
+    assert all(r["wall"] >= 0 and r["peak_bytes"] > 0 for r in rows)
+
+
+def test_compare_flags_regressions():
+    row = {"pipeline": "world", "sweep": "size", "stage": "flux", "width": 8, "height": 8, "cells": 5}
+    baseline = {"results": [dict(row, wall=0.10, peak_bytes=1000)]}
+    current = {"results": [dict(row, wall=0.15, peak_bytes=1000)]}
+    assert [r["metric"] for r in benchmarks.compare(baseline, current)] == ["wall"]
+    assert benchmarks.compare(baseline, current, threshold=0.6) == []
+
+
+def test_generator_import_is_lazy():
+    row = benchmarks.import_time("from archipelago_generator import generate_archipelago; import archipelago", runs=1)
+    assert row["heavy_loaded"] == []
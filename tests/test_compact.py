@@ -0,0 +1,56 @@
+import weakref
+
+import numpy as np
+
+from archipelago.generator import generate_world
+from archipelago_generator import generate_archipelago, load_archipelago, save_archipelago
+from archipelago_generator.pipeline import Stage, run_stages
+from archipelago_generator.rivers import compute_water_flux
+
+
+def test_compact_world_matches_full():
+    full = generate_world(width=48, height=24, seed=3, num_provinces=4)
+    compact = generate_world(width=48, height=24, seed=3, num_provinces=4, compact=True)
+    assert compact["elevation"].dtype == np.float32 and compact["provinces"].dtype == np.uint16
+    assert compact["river_width"].dtype == np.uint8
+    for key in ("elevation", "rainfall", "temperature"):
+        assert np.allclose(compact[key], full[key], atol=1e-5)
+    assert np.array_equal(compact["provinces"], full["provinces"])
+
+
+def test_flat_downslope_matches_pairs():
+    elevation = np.random.default_rng(0).random((30, 40)).round(2)  # plenty of ties
+    flux, pairs = compute_water_flux(elevation)
+    flat_flux, flat = compute_water_flux(elevation, compact=True)
+    assert flat.dtype == np.int32 and np.array_equal(flat_flux, flux)
+    assert np.array_equal(flat, np.where(pairs[..., 0] >= 0, pairs[..., 0] * 40 + pairs[..., 1], -1))
+
+
+def test_compact_archipelago_and_packed_masks(tmp_path):
+    arch = generate_archipelago(width=60, height=50, seed=2, compact=True)
+    assert arch.elevation.dtype == np.float32 and arch.regions.dtype == np.int32
+    assert arch.river_width.dtype == np.uint8
+    save_archipelago(arch, str(tmp_path / "map"), pack_masks=True)
+    loaded = load_archipelago(str(tmp_path / "map"))
+    assert loaded.road_map.dtype == bool and np.array_equal(loaded.road_map, arch.road_map)
+    assert np.array_equal(loaded.land, arch.land)
+
+
+def test_intermediates_are_released():
+    refs = []
+
+    def make():
+        tmp = np.zeros(4)
+        refs.append(weakref.ref(tmp))
+        return {"tmp": tmp}
+
+    def check(out):
+        assert refs[0]() is None  # ``tmp`` had no consumer left
+        return {"final": out * 2}
+
+    stages = [
+        Stage("a", make, ("tmp",)),
+        Stage("b", lambda tmp: {"out": tmp + 1}, ("out",), ("tmp",)),
+        Stage("c", check, ("final",), ("out",)),
+    ]
+    assert run_stages(stages, None, ["final"])["final"].tolist() == [2.0] * 4
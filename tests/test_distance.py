@@ -0,0 +1,38 @@
+import numpy as np
+
+from archipelago_generator import generate_archipelago, load_archipelago, save_archipelago
+from archipelago_generator.distance import distance_field
+
+
+def test_distance_field_is_euclidean():
+    features = np.zeros((20, 30), dtype=bool)
+    features[[2, 15], [3, 25]] = True
+    dist, nearest = distance_field(features, nearest=True)
+    yy, xx = np.mgrid[:20, :30]
+    brute = np.minimum(np.hypot(yy - 2, xx - 3), np.hypot(yy - 15, xx - 25))
+    assert dist.dtype == np.float32 and np.allclose(dist, brute)
+    assert nearest.dtype == np.int32 and set(np.unique(nearest)) == {2 * 30 + 3, 15 * 30 + 25}
+
+    dist, nearest = distance_field(np.zeros((4, 4), dtype=bool), nearest=True)
+    assert np.isinf(dist).all() and (nearest == -1).all()
+
+
+def test_archipelago_distance_layers():
+    arch = generate_archipelago(width=100, height=80, seed=3, erosion_iterations=5, nearest_features=True)
+    assert arch.sea_distance.shape == (80, 100) and arch.sea_distance.dtype == np.float32
+    assert (arch.river_distance[arch.river_map > 0] == 0).all()
+    assert (arch.road_distance[arch.road_map > 0] == 0).all()
+    iy, ix = np.divmod(arch.nearest_river, 100)
+    assert (arch.river_map[iy, ix] > 0).all()
+    for y, x in arch.cities:
+        assert arch.river_map[y, x] > 0 or arch.sea_distance[y, x] <= 1.5
+    assert generate_archipelago(width=40, height=40, seed=3).nearest_sea is None
+
+
+def test_distance_layers_survive_save_and_load(tmp_path):
+    arch = generate_archipelago(width=60, height=40, seed=3, nearest_features=True)
+    save_archipelago(arch, str(tmp_path / "map"))
+    loaded = load_archipelago(str(tmp_path / "map"))
+    for name in ("sea_distance", "river_distance", "road_distance", "nearest_sea", "nearest_river", "nearest_road"):
+        assert np.array_equal(getattr(loaded, name), getattr(arch, name)), name
+    assert loaded.profile is None
@@ -0,0 +1,64 @@
+import numpy as np
+
+from archipelago_generator.borders import compute_borders, unite_regions
+from archipelago_generator.editor import MapEditor
+from archipelago_generator.pipeline import stage_rng
+from archipelago_generator.rasterizer import Rasterizer
+from archipelago_generator.rivers import compute_water_flux, trace_rivers
+
+
+def make_editor():
+    return MapEditor.generate(width=80, height=80, seed=1, point_count=640, num_cities=4, erosion_iterations=5)
+
+
+def test_elevation_edits_match_a_full_recompute():
+    ed = make_editor()
+    arch = ed.arch
+    rng = np.random.default_rng(0)
+    for _ in range(10):
+        x, y = rng.integers(0, 60, 2)
+        w, h = rng.integers(2, 16, 2)
+        ed.edit_elevation((int(x), int(y), int(w), int(h)), ed.elev_grid[y:y + h, x:x + w] + rng.normal(0, 0.1, (h, w)))
+
+    flux, downslope = compute_water_flux(ed.elev_grid, sea_level=0.5, compact=True)
+    assert np.array_equal(ed.downslope, downslope.ravel())
+    assert np.allclose(ed.flux, flux.ravel())
+    _, width, lines = trace_rivers(flux, downslope, ed.elev_grid, min_flux=ed.min_flux, sea_level=0.5)
+    assert lines and np.array_equal(arch.river_width, width)
+    assert np.array_equal(arch.river_map, Rasterizer(80, 80).rasterize_rivers(lines))
+
+    regions = unite_regions(arch.biome, ed.neighbors)
+    assert len(set(zip(regions.tolist(), arch.regions.tolist()))) == len(set(regions.tolist()))
+    assert len(set(arch.regions.tolist())) == len(set(regions.tolist()))
+    borders = compute_borders(arch.cells, arch.biome, ed.neighbors,
+                              seed=int(stage_rng(1, "borders").integers(0, 1_000_000)))
+    assert sorted(b.wkt for b in borders) == sorted(b.wkt for b in arch.borders)
+
+
+def test_biome_paint_and_road_detour():
+    ed = make_editor()
+    x, y, w, h = ed.edit_biome((30, 30, 6, 6), "snow")
+    cells = np.unique(ed.arch.labels[30:36, 30:36])
+    assert (ed.arch.biome[cells[cells >= 0]] == "snow").all()
+    assert x <= 30 and y <= 30 and x + w >= 36 and y + h >= 36
+
+    path = ed._road_paths[0]
+    cy, cx = path[len(path) // 2]
+    ed.edit_elevation((int(cx) - 2, int(cy) - 2, 5, 5), 0.99)
+    path = ed._road_paths[0]
+    assert (np.abs(np.diff(path, axis=0)).sum(axis=1) == 1).all()
+    assert tuple(path[0]) == tuple(ed.arch.cities[0]) and tuple(path[-1]) == tuple(ed.arch.cities[1])
+
+    assert ed.arch.road_distance is None
+    ed.update_distances()
+    assert ed.arch.road_distance[tuple(path[len(path) // 2])] == 0
+
+
+def test_flooded_road_is_redrawn_around_the_sea():
+    ed = make_editor()
+    path = ed._road_paths[0]
+    cy, cx = path[len(path) // 2]
+    before = ed.arch.road_map.copy()
+    ed.edit_elevation((int(cx) - 3, int(cy) - 3, 7, 7), 0.0)
+    assert not np.array_equal(ed.arch.road_map, before)
+    assert not (ed.arch.road_map[ed.elev_grid < ed.params.sea_level] > 0).any()
@@ -0,0 +1,39 @@
+import numpy as np
+
+from archipelago.generator import generate_world
+from archipelago_generator.erosion import hydraulic_erosion, simulate, thermal_erosion
+
+
+def _hill(n=64):
+    yy, xx = np.mgrid[0:n, 0:n]
+    noise = 0.02 * np.random.default_rng(0).random((n, n))
+    return np.exp(-((xx - n / 2) ** 2 + (yy - n / 2) ** 2) / (2 * (n / 4) ** 2)) + noise
+
+
+def test_thermal_conserves_material_and_flattens():
+    h = np.random.default_rng(1).random((40, 50))
+    t = thermal_erosion(h, 10)
+    assert np.isclose(t.sum(), h.sum())
+    assert np.abs(np.diff(t)).max() < np.abs(np.diff(h)).max()
+
+
+def test_hydraulic_carves_downhill():
+    h = _hill()
+    e = hydraulic_erosion(h, 5000, np.random.default_rng(2))
+    assert not np.array_equal(e, h)
+    # Sediment leaves the map or is dropped, it is never created.
+    assert e.sum() <= h.sum() + 1e-9
+
+
+def test_simulate_is_deterministic():
+    h = _hill()
+    assert np.array_equal(simulate(h, 2, seed=3), simulate(h, 2, seed=3))
+    assert not np.array_equal(simulate(h, 2, seed=3), simulate(h, 2, seed=4))
+    assert np.array_equal(simulate(h, 0, seed=3), h)
+
+
+def test_world_erosion_iterations():
+    plain = generate_world(width=30, height=20, seed=1)
+    eroded = generate_world(width=30, height=20, seed=1, erosion_iterations=2)
+    assert not np.array_equal(plain["elevation"], eroded["elevation"])
+    assert np.array_equal(eroded["elevation"], generate_world(width=30, height=20, seed=1, erosion_iterations=2)["elevation"])
@@ -0,0 +1,40 @@
+import gzip
+import io
+import json
+
+from archipelago_generator import generate_archipelago
+from archipelago_generator.export import export_json
+from archipelago_generator.generator import STAGES, ArchipelagoParams
+from archipelago_generator.pipeline import run_stages
+
+
+def test_ndjson_records_match_map():
+    arch = generate_archipelago(width=60, height=60, seed=3, point_count=200)
+    buf = io.BytesIO()
+    count = export_json(arch, buf, chunk=50)
+    records = [json.loads(line) for line in buf.getvalue().splitlines()]
+    assert len(records) == count and not buf.closed
+    assert records[0]["counts"]["cells"] == 200
+    cells = [r for r in records if r["type"] == "cell"]
+    assert [c["id"] for c in cells] == list(range(200))
+    assert cells[7]["biome"] == arch.biome[7] and cells[7]["elevation"] == float(arch.elevation[7])
+    # Neighbours found with shapely agree with the cell graph.
+    graph = run_stages(STAGES, ArchipelagoParams(width=60, height=60, seed=3, point_count=200), ["graph"])["graph"]
+    from_graph = [json.loads(line) for line in _export(arch, graph=graph).splitlines()]
+    assert [r.get("neighbors") for r in records] == [r.get("neighbors") for r in from_graph]
+    assert [(r["y"], r["x"]) for r in records if r["type"] == "city"] == [tuple(c) for c in arch.cities]
+
+
+def _export(arch, **kwargs):
+    buf = io.BytesIO()
+    export_json(arch, buf, **kwargs)
+    return buf.getvalue()
+
+
+def test_json_document_gzip(tmp_path):
+    arch = generate_archipelago(width=50, height=50, seed=1, point_count=120)
+    path = tmp_path / "map.json.gz"
+    export_json(arch, path, fmt="json")
+    doc = json.loads(gzip.decompress(path.read_bytes()))
+    assert set(doc) == {"width", "height", "counts", "cells", "rivers", "roads", "borders", "cities"}
+    assert len(doc["cells"]) == 120 and len(doc["borders"]) == len(arch.borders)
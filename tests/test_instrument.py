@@ -0,0 +1,41 @@
+import tracemalloc
+
+from archipelago_generator import generate_archipelago
+from archipelago_generator.generator import STAGES
+from archipelago_generator.instrument import Instrumentation, count
+from archipelago_generator.pipeline import StageCache
+
+
+def test_stage_events_and_summary():
+    events = []
+    inst = Instrumentation(events.append, trace_memory=True)
+    arch = generate_archipelago(width=40, height=40, seed=3, instrument=inst)
+
+    ends = [e for e in events if e.phase == "end"]
+    assert {e.stage for e in ends} == {s.name for s in STAGES}
+    assert len(events) == 2 * len(ends)
+    assert all(e.alloc_peak is not None and e.output_bytes > 0 for e in ends)
+    assert "elevation" in next(e for e in ends if e.stage == "elevation").outputs
+    assert arch.profile["counters"]["noise_samples"] > 0
+    assert arch.profile["stages"]["roads"]["counters"].get("astar_expansions", 0) > 0
+
+
+def test_cached_stages_reported():
+    cache = StageCache()
+    generate_archipelago(width=30, height=30, seed=3, cache=cache)
+    inst = Instrumentation()
+    arch = generate_archipelago(width=30, height=30, seed=3, cache=cache, num_cities=2, instrument=inst)
+    assert arch.profile["stages"]["cities"]["cached"] is False
+    assert any(s["cached"] for s in arch.profile["stages"].values())
+
+
+def test_disabled_is_silent():
+    count("noise_samples", 5)  # no active instrumentation: a no-op
+    assert generate_archipelago(width=20, height=20, seed=1).profile is None
+
+
+def test_memory_not_traced_for_concurrent_stages():
+    inst = Instrumentation(trace_memory=True)
+    arch = generate_archipelago(width=30, height=30, seed=3, instrument=inst, workers=4)
+    assert all(s["alloc_peak"] is None and s["alloc_delta"] is None for s in arch.profile["stages"].values())
+    assert not tracemalloc.is_tracing()
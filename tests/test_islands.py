@@ -0,0 +1,39 @@
+import numpy as np
+from perlin_noise import PerlinNoise
+
+from archipelago_generator import generate_archipelago
+from archipelago_generator.island_mask import Island, classify_land, generate_islands, island_falloff
+from archipelago_generator.utils import perlin_batch
+
+
+def test_perlin_batch_matches_pointwise():
+    noise = PerlinNoise(octaves=3, seed=11)
+    coords = np.random.default_rng(0).uniform(-2, 5, (500, 2))
+    expected = [noise(list(c)) for c in coords]
+    assert np.allclose(perlin_batch(noise, coords), expected, rtol=0, atol=1e-12)
+
+
+def test_island_falloff_matches_pairwise():
+    rng = np.random.default_rng(1)
+    points = rng.uniform(0, 100, (400, 2))
+    islands = generate_islands(20, 100, 100, rng, 5, 20, clustering=0.5)
+    expected = [
+        max([0.0] + [1 - min(1, np.linalg.norm(p - isl.center) / isl.radius) for isl in islands])
+        for p in points
+    ]
+    assert np.allclose(island_falloff(points, islands), expected)
+
+
+def test_classify_land():
+    points = np.array([[50.0, 50.0], [5.0, 5.0]])
+    land = classify_land(points, [Island(np.array([50.0, 50.0]), 30.0)], 0.5, np.random.default_rng(0))
+    assert land.dtype == bool and land.tolist() == [True, False]
+
+
+def test_islands_stage():
+    arch = generate_archipelago(width=120, height=120, seed=4, point_count=800, num_islands=8,
+                                island_clustering=0.3)
+    assert 0 < arch.land.mean() < 0.5
+    assert (arch.land == (arch.elevation > 0.5)).all()
+    plain = generate_archipelago(width=120, height=120, seed=4, point_count=800)
+    assert not np.array_equal(arch.land, plain.land)
@@ -0,0 +1,66 @@
+import io
+import json
+import struct
+from collections import Counter
+
+import numpy as np
+
+from archipelago.generator import generate_world
+from archipelago.render import world_mesh
+from archipelago_generator import generate_archipelago
+from archipelago_generator.mesh import archipelago_mesh, grid_mesh, write_glb, write_obj
+
+
+def _edges(mesh):
+    return Counter(tuple(sorted((a, b))) for tri in mesh.indices.tolist() for a, b in zip(tri, tri[1:] + tri[:1]))
+
+
+def test_flat_sea_collapses_and_mesh_has_no_cracks():
+    assert len(grid_mesh(np.zeros((65, 65)), chunk=64)) == 2
+    heights = np.zeros((40, 70))
+    heights[10:25, 20:50] = np.random.default_rng(0).random((15, 30))
+    mesh = grid_mesh(heights, chunk=16)
+    assert len(mesh) < 39 * 69  # half of the undecimated 2 * 39 * 69
+    # Every edge is shared by two triangles, or lies on the map border.
+    for (a, b), n in _edges(mesh).items():
+        assert n <= 2
+        if n == 1:
+            pa, pb = mesh.positions[a], mesh.positions[b]
+            assert (pa[0] == pb[0] and pa[0] in (0, 69)) or (pa[2] == pb[2] and pa[2] in (0, 39))
+    p = mesh.positions.astype(float)
+    a, b, c = (p[mesh.indices[:, k]] for k in range(3))
+    up = (b[:, 2] - a[:, 2]) * (c[:, 0] - a[:, 0]) - (b[:, 0] - a[:, 0]) * (c[:, 2] - a[:, 2])
+    assert (up > 0).all() and up.sum() / 2 == 39 * 69
+
+
+def test_chunks_partition_the_mesh():
+    heights = np.random.default_rng(1).random((50, 40))
+    whole = grid_mesh(heights, max_error=0.3, chunk=16)
+    chunks = grid_mesh(heights, max_error=0.3, chunk=16, by_chunk=True)
+    assert set(chunks) == {(r, c) for r in range(4) for c in range(3)}
+    assert sum(len(m) for m in chunks.values()) == len(whole)
+
+
+def test_writers_and_map_meshes():
+    arch = generate_archipelago(width=60, height=50, seed=2)
+    mesh = archipelago_mesh(arch, max_error=0.01, sea_level=0.5)
+    assert mesh.colors.shape == (len(mesh.positions), 3)
+    cells = archipelago_mesh(arch, source="cells")
+    assert len(cells.positions) == len(arch.cells)
+
+    buf = io.BytesIO()
+    write_glb({(0, 0): mesh, (0, 1): cells}, buf)
+    data = buf.getvalue()
+    magic, version, total = struct.unpack("<4sII", data[:12])
+    length, _ = struct.unpack("<I4s", data[12:20])
+    doc = json.loads(data[20:20 + length])
+    assert (magic, version, total) == (b"glTF", 2, len(data))
+    assert [n["name"] for n in doc["nodes"]] == ["0_0", "0_1"]
+
+    buf = io.BytesIO()
+    write_obj(mesh, buf)
+    lines = buf.getvalue().decode().splitlines()
+    assert sum(line.startswith("f ") for line in lines) == len(mesh)
+
+    world = generate_world(width=40, height=30, seed=1)
+    assert len(world_mesh(world, max_error=0.02).positions) < 40 * 30
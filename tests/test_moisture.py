@@ -0,0 +1,45 @@
+import numpy as np
+
+from archipelago_generator.climate import compute_winds
+from archipelago_generator.moisture import advection_operator, diffusion_operator, edge_fluxes, transport
+from archipelago_generator.points import random_points
+from archipelago_generator.voronoi import compute_cell_graph
+
+
+def _graph(n=600, size=100):
+    return compute_cell_graph(random_points(n, size, size, np.random.default_rng(0)), size, size)
+
+
+def test_operators_conserve_moisture():
+    graph = _graph()
+    lap = diffusion_operator(graph)
+    assert np.allclose(lap.sum(axis=1), 0)
+    assert abs(lap - lap.T).max() < 1e-12
+    winds = np.tile([1.0, 0.2], (len(graph), 1))
+    adv = advection_operator(graph, edge_fluxes(graph, winds))
+    # Whatever a cell exports is imported by its downwind neighbours.
+    assert np.allclose(adv.sum(axis=0), 0)
+
+
+def test_transport_rains_out_downwind():
+    graph = _graph()
+    x = graph.sites[:, 0]
+    land = (x > 20) & (x < 80)
+    elevation = np.where(land, 0.6, 0.0)
+    elevation[(x > 45) & (x < 55)] = 1.0  # a north-south ridge
+    winds = np.tile([1.0, 0.0], (len(graph), 1))  # blowing east
+    humidity = transport(graph, land, elevation, winds)
+    assert (humidity[~land] == 1).all()
+    assert ((humidity >= 0) & (humidity <= 1)).all()
+    windward = humidity[land & (x < 40)].mean()
+    leeward = humidity[land & (x > 60)].mean()
+    assert leeward < windward
+    calm = transport(graph, land, np.where(land, 0.6, 0.0), winds)
+    assert calm[land & (x > 60)].mean() > leeward
+
+
+def test_winds_follow_latitude_bands():
+    centroids = np.array([[0, 50], [0, 10], [0, 90]])
+    u, v = compute_winds(centroids, 100).T
+    assert u[0] < 0  # easterly trades at the equator
+    assert u[1] > 0 and u[2] > 0  # westerlies towards the poles
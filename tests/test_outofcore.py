@@ -0,0 +1,49 @@
+import numpy as np
+
+from archipelago.generator import generate_world
+from archipelago.outofcore import _group_by_province, accumulate_bands, generate_world_to_disk, open_world
+from archipelago.render import export_png
+from archipelago_generator.rivers import accumulate_flux, grid_downslope
+from archipelago_generator.storage import load_world
+
+
+def test_accumulate_bands_matches_in_memory():
+    elevation = np.random.default_rng(0).random((23, 17))
+    downslope = grid_downslope(elevation).reshape(elevation.shape)
+    expected = accumulate_flux(downslope.ravel(), np.ones(elevation.size)).reshape(elevation.shape)
+    for band_rows in (1, 3, 7, 50):
+        out = np.zeros(elevation.shape)
+        accumulate_bands(downslope, out, band_rows)
+        assert np.array_equal(out, expected)
+
+
+def test_group_by_province_keeps_file_order(tmp_path):
+    rows = np.column_stack([np.arange(50), np.arange(50) * 2, np.random.default_rng(0).integers(0, 6, 50)])
+    rows.astype(np.int64).tofile(tmp_path / "rows.bin")
+    per_province = np.bincount(rows[:, 2], minlength=7)
+    grouped, offsets = _group_by_province(str(tmp_path / "rows.bin"), per_province, chunk=8)
+    order = np.argsort(rows[:, 2], kind="stable")
+    assert np.array_equal(grouped, rows[order, :2])
+    assert offsets.tolist() == [0, *np.cumsum(per_province).tolist()]
+
+
+def test_out_of_core_world_matches_generate_world(tmp_path):
+    world = generate_world(width=48, height=40, seed=3, num_provinces=4)
+    path = generate_world_to_disk(str(tmp_path / "world"), 48, 40, seed=3, num_provinces=4, band_rows=7)
+    disk = load_world(path)
+    for key in ("elevation", "rainfall", "temperature"):
+        assert np.allclose(disk[key], world[key], rtol=0, atol=1e-12)
+    for key in ("provinces", "borders", "water_flux", "river_width", "biome"):
+        assert np.array_equal(disk[key], world[key])
+    assert np.array_equal(disk["river_map"] > 0, world["river_map"] > 0)
+    assert disk["cities"] == world["cities"]
+
+
+def test_out_of_core_png_matches(tmp_path):
+    world = generate_world(width=40, height=30, seed=1)
+    path = generate_world_to_disk(str(tmp_path / "world"), 40, 30, seed=1, band_rows=8)
+    opened = open_world(path)
+    assert opened["biome"].dtype == np.uint8 and isinstance(opened["elevation"], np.memmap)
+    export_png(world, tmp_path / "a.png")
+    export_png(opened, tmp_path / "b.png")
+    assert (tmp_path / "a.png").read_bytes() == (tmp_path / "b.png").read_bytes()
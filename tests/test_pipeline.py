@@ -0,0 +1,77 @@
+import numpy as np
+
+from archipelago_generator import generate_archipelago, generator
+from archipelago_generator.pipeline import Stage, StageCache, run_stages, stage_rng
+
+
+def test_param_tweak_reuses_upstream(monkeypatch):
+    calls = []
+    real = generator.compute_cell_graph
+    monkeypatch.setattr(generator, "compute_cell_graph", lambda *a: calls.append(1) or real(*a))
+
+    cache = StageCache()
+    generate_archipelago(width=60, height=60, seed=8, cache=cache)
+    tweaked = generate_archipelago(width=60, height=60, seed=8, cache=cache, river_width_tiles=3)
+    assert len(calls) == 1
+
+    fresh = generate_archipelago(width=60, height=60, seed=8, river_width_tiles=3)
+    assert np.array_equal(tweaked.river_map, fresh.river_map)
+    assert np.array_equal(tweaked.road_map, fresh.road_map)
+    assert tweaked.cities == fresh.cities
+
+
+def test_disk_cache_and_eviction(tmp_path):
+    class P:
+        n = 3
+
+    stages = [Stage("make", lambda n: {"x": np.arange(n)}, ("x",), params=("n",))]
+    run_stages(stages, P, ["x"], StageCache(directory=str(tmp_path)))
+
+    cold = StageCache(directory=str(tmp_path))
+    assert np.array_equal(run_stages(stages, P, ["x"], cold)["x"], [0, 1, 2])
+    assert cold.hits == 1 and cold.misses == 0
+
+    small = StageCache(max_bytes=1)
+    small.put("a", {"x": np.zeros(10)})
+    small.put("b", {"x": np.zeros(10)})
+    assert "a" not in small and "b" in small
+
+
+def test_independent_stages_run_concurrently():
+    from concurrent.futures import ThreadPoolExecutor
+    import threading
+
+    class P:
+        seed = 5
+
+    barrier = threading.Barrier(2, timeout=5)
+
+    def draw(rng):
+        barrier.wait()  # deadlocks unless both stages run at once
+        return rng.random(3)
+
+    stages = [
+        Stage("a", lambda rng: {"a": draw(rng)}, ("a",), seeded=True),
+        Stage("b", lambda rng: {"b": draw(rng)}, ("b",), seeded=True),
+        Stage("sum", lambda a, b: {"sum": a + b}, ("sum",), ("a", "b")),
+    ]
+    with ThreadPoolExecutor(2) as pool:
+        out = run_stages(stages, P, ["a", "b", "sum"], executor=pool)
+    assert np.array_equal(out["a"], stage_rng(5, "a").random(3))
+    assert np.array_equal(out["sum"], out["a"] + out["b"])
+    assert not np.array_equal(out["a"], out["b"])
+
+
+def test_worker_count_does_not_change_results():
+    from archipelago.generator import generate_world
+
+    serial = generate_world(width=40, height=24, seed=2, num_provinces=3)
+    threaded = generate_world(width=40, height=24, seed=2, num_provinces=3, workers=4)
+    for key, value in serial.items():
+        assert np.array_equal(np.asarray(value), np.asarray(threaded[key])), key
+
+    arch = generate_archipelago(width=50, height=50, seed=6)
+    arch4 = generate_archipelago(width=50, height=50, seed=6, workers=4)
+    for name in ("elevation", "temperature", "borders", "river_map", "road_map"):
+        assert np.array_equal(getattr(arch, name), getattr(arch4, name)), name
+    assert arch.cities == arch4.cities
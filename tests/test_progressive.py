@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from archipelago_generator import generate_archipelago
+from archipelago_generator.instrument import Instrumentation
+from archipelago_generator.pipeline import Cancelled, StageCache
+from archipelago_generator.progressive import generate_progressive
+
+
+def test_levels_refine_to_the_full_map():
+    levels = list(generate_progressive(width=160, height=120, seed=5, point_count=512))
+    assert [p.level for p in levels] == [0, 1, 2, 3]
+    assert [p.map.width for p in levels] == [21, 40, 80, 160]
+    assert [p.map.height for p in levels] == [16, 30, 60, 120]
+    assert [len(p.map.cells) for p in levels] == [64, 64, 128, 512]
+    assert levels[0].map.river_map is None and levels[0].map.biome is not None
+    assert levels[-1].final and not levels[0].final
+
+    full = generate_archipelago(width=160, height=120, seed=5, point_count=512)
+    assert np.array_equal(levels[-1].map.biome, full.biome)
+    assert levels[-1].map.cities == full.cities
+
+
+def test_cancel_stops_before_full_resolution():
+    stop = []
+    cache = StageCache()
+    previews = generate_progressive(scales=(0.25, 1.0), width=160, height=120, seed=5, cache=cache,
+                                    cancel=lambda: bool(stop))
+    assert next(previews).scale == 0.25
+    stored = len(cache)
+    stop.append(True)
+    with pytest.raises(Cancelled):
+        next(previews)
+    assert len(cache) == stored
+
+
+def test_world_previews():
+    shapes = [p.map["elevation"].shape for p in generate_progressive("world", width=128, height=32, seed=1)]
+    assert shapes == [(16, 64), (32, 128)]
+
+
+def test_archipelago_previews_pass_other_arguments_through():
+    inst = Instrumentation()
+    levels = list(generate_progressive(scales=(0.5, 1.0), width=64, height=48, seed=1, workers=2, instrument=inst))
+    assert [p.map.width for p in levels] == [32, 64]
+    assert levels[0].map.profile is not None and levels[-1].map.profile is not None
+    assert np.array_equal(levels[-1].map.biome, generate_archipelago(width=64, height=48, seed=1).biome)
+
+
+def test_world_previews_pass_other_arguments_through():
+    levels = list(generate_progressive("world", scales=(0.5, 1.0), width=64, height=32, seed=1,
+                                       instrument=Instrumentation()))
+    assert [p.map["elevation"].shape for p in levels] == [(16, 32), (32, 64)]
+    assert "profile" in levels[-1].map
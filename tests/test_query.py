@@ -0,0 +1,47 @@
+import numpy as np
+import shapely
+
+from archipelago_generator import generate_archipelago
+
+
+def test_cell_lookups_match_label_raster():
+    arch = generate_archipelago(width=120, height=80, seed=3)
+    yy, xx = np.mgrid[:80, :120]
+    cell = arch.query.cell_at(xx + 0.5, yy + 0.5)
+    assert cell.shape == (80, 120) and np.array_equal(cell, arch.labels)
+    assert np.array_equal(arch.query.region_at(xx + 0.5, yy + 0.5), arch.regions[arch.labels])
+    assert arch.query.biome_at(10.5, 20.5) == arch.biome[arch.labels[20, 10]]
+    assert arch.query.cell_at([-1.0, 130.0], [5.0, 5.0]).tolist() == [-1, -1]
+    assert arch.query.biome_at(-1.0, -1.0) is None
+
+    inside = arch.query.cells_in_bbox(30, 20, 50, 40)
+    box = shapely.box(30, 20, 50, 40)
+    assert inside.tolist() == [i for i, c in enumerate(arch.cells) if c.intersects(box)]
+
+
+def test_nearest_city_is_exact():
+    arch = generate_archipelago(width=120, height=80, seed=3)
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(0, 120, 500), rng.uniform(0, 80, 500)
+    index, dist = arch.query.nearest_city(x, y)
+    cities = np.array(arch.cities, dtype=float)[:, ::-1] + 0.5
+    brute = np.hypot(cities[None, :, 0] - x[:, None], cities[None, :, 1] - y[:, None])
+    assert np.allclose(dist, brute.min(axis=1))
+    assert np.allclose(brute[np.arange(500), index], dist)
+
+
+def test_line_queries_follow_rivers_and_roads():
+    arch = generate_archipelago(width=120, height=80, seed=3, erosion_iterations=5)
+    assert arch.river_lines and arch.road_lines
+    x, y = np.array(arch.river_lines[0], dtype=float).T + 0.5
+    assert arch.query.on_river(x, y).all()
+    line, dist = arch.query.nearest_line("river", x, y)
+    assert np.allclose(dist, 0) and (line >= 0).all()
+    x, y = np.array(arch.road_lines[0], dtype=float).T + 0.5
+    assert arch.query.on_road(x, y).all()
+    assert not arch.query.on_road(-50.0, -50.0)
+    assert arch.query.on_border(*arch.borders[0].coords[0]).item()
+
+    arch.road_lines = []
+    arch.query.invalidate("road")
+    assert not arch.query.on_road(x, y).any()
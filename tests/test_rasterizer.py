@@ -1,6 +1,6 @@
 import numpy as np
 
-from archipelago_generator.rasterizer import Rasterizer
+from archipelago_generator.rasterizer import Rasterizer, rasterize_barycentric
 
 
 def test_rasterize_line():
@@ -19,3 +19,33 @@ def test_jitter_determinism():
     j2 = r2.jitter_polyline(line, freq=1.0, strength=1.0)
     assert np.allclose(j1, j2)
 
+
+def test_write_png_bands_roundtrip(tmp_path):
+    from PIL import Image
+    from archipelago_generator.rasterizer import palette_bands, write_png
+
+    base = np.arange(6 * 4, dtype=np.uint8).reshape(6, 4) % 3
+    mask = np.zeros((6, 4), dtype=bool)
+    mask[:, 1] = True
+    bands = palette_bands(lambda y0, y1: base[y0:y1], 6, [(3, lambda y0, y1: mask[y0:y1])],
+                          [(4, [(5, 3)])], band_rows=4, scale=2)
+    path = tmp_path / "map.png"
+    write_png(path, 8, 12, [(0, 0, 0), (1, 1, 1), (2, 2, 2), (3, 3, 3), (4, 4, 4)], bands)
+    img = np.array(Image.open(path))
+    expected = np.where(mask, 3, base)
+    expected[5, 3] = 4
+    assert np.array_equal(img, np.repeat(np.repeat(expected, 2, axis=0), 2, axis=1))
+
+
+def test_barycentric_reproduces_planes():
+    rng = np.random.default_rng(0)
+    sites = np.vstack([[[0, 0], [40, 0], [0, 30], [40, 30]], rng.uniform(0, 40, (50, 2)) * [1, 0.75]])
+    values = np.stack([0.5 * sites[:, 0] - 0.2 * sites[:, 1] + 3, np.full(len(sites), 2.0)])
+    out = np.zeros((2, 30, 40), dtype=np.float32)
+    grid = rasterize_barycentric(sites, values, 40, 30, out=out)
+    yy, xx = np.mgrid[:30, :40] + 0.5
+    assert grid is out
+    assert np.allclose(out[0], 0.5 * xx - 0.2 * yy + 3, atol=1e-4)
+    assert np.allclose(out[1], 2.0)
+    single = rasterize_barycentric(sites, values[0], 40, 30)
+    assert single.shape == (30, 40) and np.allclose(single, out[0], atol=1e-4)
@@ -0,0 +1,59 @@
+import numpy as np
+import shapely
+
+from archipelago_generator import generate_archipelago
+from archipelago_generator.points import random_points
+from archipelago_generator.rivers import accumulate_flux, compute_cell_rivers, compute_rivers, route_cells
+from archipelago_generator.voronoi import compute_cell_graph
+
+
+def test_cell_graph_follows_point_order():
+    pts = random_points(300, 80, 60, np.random.default_rng(0))
+    graph = compute_cell_graph(pts, 80, 60)
+    assert shapely.contains_xy(np.array(graph.cells, dtype=object), pts[:, 0], pts[:, 1]).all()
+    assert np.isclose(sum(c.area for c in graph.cells), 80 * 60)
+    for (a, b), length in zip(graph.edges, graph.edge_lengths):
+        assert np.isclose(graph.cells[a].intersection(graph.cells[b]).length, length)
+
+
+def test_accumulate_flux():
+    # 0 -> 1 -> 3, 2 -> 3, 3 is the outlet
+    flux = accumulate_flux(np.array([1, 3, 3, -1]), np.ones(4))
+    assert flux.tolist() == [1, 2, 1, 4]
+
+
+def test_grid_rivers_trace_from_source_to_mouth():
+    # A valley down column 2 draining into the sea on row 0. Tracing from
+    # the mouth upwards used to give one-point lines, which were dropped.
+    y, x = np.mgrid[:8, :5]
+    elevation = 0.4 + 0.02 * y + 0.1 * np.abs(x - 2)
+    elevation[0] = 0.1
+    river_map, river_width, lines = compute_rivers(elevation, sea_level=0.3, min_flux=3)
+    assert [[tuple(map(int, p)) for p in line] for line in lines] == [[(2, y) for y in range(7, 0, -1)]]
+    assert np.flatnonzero(river_map.any(axis=0)).tolist() == [2]
+    assert (np.diff(river_width[1:, 2]) <= 0).all()  # widening towards the mouth
+
+
+def test_route_cells_fills_pits():
+    pts = random_points(400, 100, 100, np.random.default_rng(1))
+    graph = compute_cell_graph(pts, 100, 100)
+    centre = np.hypot(*(graph.sites - 50).T)
+    elevation = 1 - centre / 70
+    elevation[np.argmin(centre)] = 0.6  # a pit at the summit
+    downslope, filled = route_cells(graph, elevation, sea_level=0.3)
+    land = np.flatnonzero(elevation >= 0.3)
+    assert (downslope[land] >= 0).all()
+    assert (filled[downslope[land]] < filled[land]).all()
+
+    flux, width, lines = compute_cell_rivers(graph, elevation, sea_level=0.3)
+    assert flux.sum() >= len(graph)
+    assert lines and all(len(line) >= 2 for line in lines)
+    assert (width[elevation < 0.3] == 0).all()
+
+
+def test_mesh_hydrology_mode():
+    arch = generate_archipelago(width=80, height=80, seed=3, hydrology="mesh")
+    assert arch.river_lines and arch.river_map.any()
+    assert arch.river_width.shape == (80, 80)
+    sea_pixels = ~np.append(arch.land, False)[arch.labels]
+    assert not arch.river_width[sea_pixels].any()
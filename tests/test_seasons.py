@@ -0,0 +1,57 @@
+import io
+
+import numpy as np
+
+from archipelago_generator import generate_archipelago
+from archipelago_generator.biomes import BIOMES, classify_biome_codes, classify_biomes
+from archipelago_generator.rasterizer import export_png
+from archipelago_generator.seasons import UNKNOWN, seasonal_biomes, seasonal_offsets
+
+
+def _reference_biome(land, t, m):
+    # The per-cell loop classify_biomes used before it was vectorized.
+    if not land:
+        return "ocean"
+    if m < 0.05:
+        return "scorched"
+    if t < 0.2:
+        return "snow" if m > 0.5 else "tundra"
+    if t < 0.4:
+        return "desert" if m < 0.25 else "grassland" if m < 0.5 else "forest"
+    if t < 0.7:
+        return "desert" if m < 0.25 else "grassland" if m < 0.5 else "forest" if m < 0.75 else "dark_forest"
+    if m < 0.3:
+        return "desert" if m > 0.05 else "scorched"
+    return "grassland" if m < 0.6 else "jungle"
+
+
+def test_codes_match_the_reference_loop_at_thresholds():
+    edges = np.array([0.0, 0.05, 0.2, 0.25, 0.3, 0.4, 0.5, 0.6, 0.7, 0.75, 1.0])
+    values = np.union1d(edges, (edges[:-1] + edges[1:]) / 2)
+    t, m = (a.ravel() for a in np.meshgrid(values, values))
+    land = np.arange(len(t)) % 7 != 0
+    expected = [_reference_biome(*args) for args in zip(land, t, m)]
+    assert classify_biomes(land, t, m).tolist() == expected
+    assert np.array(BIOMES)[classify_biome_codes(land, t, m)].tolist() == expected
+
+
+def test_still_year_repeats_the_map():
+    arch = generate_archipelago(width=60, height=50, seed=3)
+    seasons = seasonal_biomes(arch, 4, temperature_amplitude=0, moisture_amplitude=0)
+    assert seasons.frames.shape == (4, 50, 60) and seasons.frames.dtype == np.uint8
+    lookup = {b: i for i, b in enumerate(BIOMES)}
+    static = np.array([lookup[b] for b in arch.biome] + [UNKNOWN], dtype=np.uint8)[arch.labels]
+    assert (seasons.frames == static).all()
+
+    plain, frame = io.BytesIO(), io.BytesIO()
+    export_png(arch, plain)
+    export_png(arch, frame, biome=seasons.frames[2])
+    assert plain.getvalue() == frame.getvalue()
+
+
+def test_hemispheres_are_half_a_year_apart():
+    dt, dm = seasonal_offsets(np.array([45.0, 0.0, -45.0]), 4, temperature_amplitude=0.1)
+    assert dt.shape == dm.shape == (4, 3)
+    assert dt[1, 0] > 0 and dt[1, 2] < 0 and dt[:, 1].tolist() == [0, 0, 0, 0]
+    assert np.allclose(dt.sum(axis=0), 0) and np.allclose(dm.sum(axis=0), 0)
+    assert np.allclose(dm[2], dt[1])  # moisture lags a quarter year
@@ -0,0 +1,90 @@
+import asyncio
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+from archipelago_generator import generate_archipelago
+from archipelago_generator.rasterizer import export_png
+from archipelago_generator.service import MapServer, MapService, RequestError, parse_params
+
+PARAMS = {"seed": 5, "width": 40, "height": 30, "point_count": 120}
+
+
+def test_parse_params():
+    params = parse_params({"seed": "5", "sea_level": "0.4", "jitter": "true", "island_radius": "0.1,0.2", "x": "3"})
+    assert params == {"seed": 5, "sea_level": 0.4, "jitter": True, "island_radius": (0.1, 0.2)}
+    with pytest.raises(RequestError):
+        parse_params({"seed": "1", "colour": "red"})
+    with pytest.raises(RequestError):
+        parse_params({"width": "10"})
+
+
+def test_region_png_matches_crop():
+    from PIL import Image
+
+    arch = generate_archipelago(**PARAMS)
+    full, part = io.BytesIO(), io.BytesIO()
+    export_png(arch, full)
+    export_png(arch, part, region=(5, 4, 20, 10))
+    crop = np.asarray(Image.open(full).convert("RGB"))[4:14, 5:25]
+    assert np.array_equal(np.asarray(Image.open(part).convert("RGB")), crop)
+
+
+async def _request(port, target):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n".encode())
+    raw = await reader.read()
+    writer.close()
+    head, _, body = raw.partition(b"\r\n\r\n")
+    return int(head.split()[1]), body
+
+
+def test_service_single_flight_and_endpoints():
+    async def scenario():
+        service = MapService(workers=1)
+        server = await MapServer(service).start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        query = "&".join(f"{k}={v}" for k, v in PARAMS.items())
+        try:
+            results = await asyncio.gather(*[_request(port, f"/map?{query}") for _ in range(4)])
+            assert {status for status, _ in results} == {200}
+            meta = json.loads(results[0][1])
+            assert meta["width"] == 40 and meta["layers"]["labels"]["shape"] == [30, 40]
+            assert service.generated == 1 and service.shared == 3
+
+            status, body = await _request(port, f"/layer/elevation?{query}")
+            assert status == 200 and np.load(io.BytesIO(body)).shape == (meta["cells"],)
+            status, body = await _request(port, f"/png?{query}&x=0&y=0&w=10&h=10&scale=2")
+            assert status == 200 and body.startswith(b"\x89PNG")
+            assert (await _request(port, f"/png?{query}&x=35&w=10"))[0] == 400
+            assert (await _request(port, "/map?width=3"))[0] == 400
+            assert service.generated == 1
+        finally:
+            server.close()
+            await server.wait_closed()
+            service.close()
+
+    asyncio.run(scenario())
+
+
+def test_broken_pool_is_replaced():
+    async def scenario():
+        service = MapService(workers=1)
+        service._pool = broken = ProcessPoolExecutor(1)
+        with pytest.raises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result()
+        try:
+            with pytest.raises(BrokenProcessPool):
+                await service.get(PARAMS)
+            assert service._pool is None and service.stats()["pool_failures"] == 1
+            fields = await service.get(PARAMS)
+            assert fields["width"] == 40 and service.generated == 1
+        finally:
+            service.close()
+
+    asyncio.run(scenario())
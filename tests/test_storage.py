@@ -0,0 +1,38 @@
+import json
+
+import numpy as np
+import pytest
+
+from archipelago_generator import generate_archipelago, save_archipelago, load_archipelago
+from archipelago_generator.generator import Archipelago
+from archipelago_generator.storage import FORMAT_VERSION
+
+
+def test_roundtrip(tmp_path):
+    arch = generate_archipelago(width=60, height=40, seed=7)
+    path = tmp_path / "map"
+    save_archipelago(arch, str(path))
+
+    loaded = load_archipelago(str(path))
+    assert isinstance(loaded, Archipelago)
+    assert "elevation" not in vars(loaded)  # nothing decoded yet
+    assert isinstance(loaded.elevation, np.memmap)
+    assert np.array_equal(loaded.elevation, arch.elevation)
+    assert np.array_equal(loaded.biome, arch.biome)
+    assert np.array_equal(loaded.labels, arch.labels)
+    assert loaded.cities == arch.cities
+    assert loaded.river_lines == arch.river_lines
+    assert loaded.road_lines == arch.road_lines
+    assert all(a.equals_exact(b, 0) for a, b in zip(loaded.cells, arch.cells))
+    assert all(a.equals_exact(b, 0) for a, b in zip(loaded.borders, arch.borders))
+
+
+def test_rejects_newer_version(tmp_path):
+    arch = generate_archipelago(width=30, height=30, seed=1)
+    path = tmp_path / "map"
+    save_archipelago(arch, str(path))
+    manifest = json.loads((path / "manifest.json").read_text())
+    manifest["version"] = FORMAT_VERSION + 1
+    (path / "manifest.json").write_text(json.dumps(manifest))
+    with pytest.raises(ValueError):
+        load_archipelago(str(path))
@@ -0,0 +1,37 @@
+import numpy as np
+
+from archipelago_generator import generate_archipelago
+from archipelago_generator.biomes import BIOMES
+from archipelago_generator.vegetation import PROP_TYPES, poisson_tiles, scatter
+
+
+def test_tiles_wrap_and_are_cached():
+    tiles = poisson_tiles(3, 2, 32, 2.0)
+    assert poisson_tiles(3, count=2, size=32) is tiles
+    for points in tiles:
+        d = np.abs(points[:, None] - points[None])
+        d = np.minimum(d, 32 - d)
+        dist = np.hypot(d[..., 0], d[..., 1])
+        np.fill_diagonal(dist, np.inf)
+        assert dist.min() >= 2.0 - 1e-4
+
+
+def test_scatter_follows_biomes():
+    arch = generate_archipelago(width=100, height=90, seed=2)
+    props = scatter(arch, 2, tile_size=32, tile_count=2)
+    again = scatter(arch, 2, tile_size=32, tile_count=2)
+    assert np.array_equal(props.xy, again.xy) and np.array_equal(props.kind, again.kind)
+    assert len(props) > 100 and props.xy.dtype == np.float32 and props.kind.dtype == np.uint8
+
+    ix, iy = props.xy[:, 0].astype(int), props.xy[:, 1].astype(int)
+    assert (ix < 100).all() and (iy < 90).all()
+    labels = arch.labels[iy, ix]
+    assert (labels >= 0).all()
+    assert not set(arch.biome[labels]) & {"ocean", "scorched"}
+    assert not arch.river_map[iy, ix].any() and not arch.road_map[iy, ix].any()
+    cactus = arch.biome[labels[props.kind == PROP_TYPES.index("cactus")]]
+    assert set(cactus) <= {"desert"}
+
+    snow = np.full((90, 100), BIOMES.index("snow"), dtype=np.uint8)
+    kinds = set(scatter(arch, 2, tile_size=32, tile_count=2, biome=snow).kind.tolist())
+    assert kinds <= {PROP_TYPES.index("pine")}
@@ -0,0 +1,65 @@
+import io
+
+import numpy as np
+from blessed import Terminal
+
+from archipelago.generator import generate_world
+from archipelago.render import world_layers
+from archipelago_generator import generate_archipelago
+from archipelago_generator.viewer import TileLayers, Viewer, archipelago_layers
+
+
+class FakeTerm(Terminal):
+    def __init__(self, height, width):
+        super().__init__(kind="xterm-256color", force_styling=True, stream=io.StringIO())
+        self._size = (height, width)
+
+    @property
+    def height(self):
+        return self._size[0]
+
+    @property
+    def width(self):
+        return self._size[1]
+
+
+def grid_layers(height=100, width=160):
+    codes = (np.arange(height * width).reshape(height, width) // 7) % 3
+    return TileLayers(height, width, [(".", (0, 0, 200)), (",", (50, 180, 50)), ("^", (20, 140, 20)),
+                                      ("@", (230, 180, 0))],
+                      lambda w: codes[w], points=[(3, [(55, 97)])]), codes
+
+
+def test_sample_downsamples_and_keeps_points():
+    layers, codes = grid_layers()
+    view = layers.sample(40, 90, 10, 12, step=4)
+    expected = codes[40:80:4, 90:138:4].copy()
+    expected[(55 - 40) // 4, (97 - 90) // 4] = 3
+    assert np.array_equal(view, expected)
+    edge = layers.sample(96, 150, 5, 20)
+    assert (edge[4:] == -1).all() and (edge[:, 10:] == -1).all()
+
+
+def test_frames_redraw_only_changes():
+    layers, _ = grid_layers()
+    term = FakeTerm(21, 40)
+    viewer = Viewer(layers, term)
+    first = viewer.frame()
+    assert term.clear in first
+    assert viewer.frame() == ""
+    viewer.pan(1, 0)
+    assert 0 < len(viewer.frame()) <= len(first)
+    viewer.handle("0")
+    assert viewer.step == 8 and (viewer.y, viewer.x) == (0, 0)
+    viewer.handle("+")
+    assert viewer.step == 4
+    assert viewer.handle("q") is False
+
+
+def test_map_layers():
+    arch = generate_archipelago(width=60, height=40, seed=1)
+    layers = archipelago_layers(arch)
+    full = layers.sample(0, 0, 40, 60)
+    assert (full >= 0).all() and full[arch.cities[0]] == len(layers.palette) - 1
+    world = generate_world(width=50, height=30, seed=1)
+    assert world_layers(world).sample(0, 0, 30, 50).shape == (30, 50)